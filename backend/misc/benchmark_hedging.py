@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""Compare downloading price data from a single source with hedged downloads from a source and its mirror.
+
+Call:
+
+    ./benchmark_hedging.py --downloads 200 --latency 0.05 --slow-latency 3 --slow-rate 0.1 --hedge-delay 0.2
+
+to download the DE price data 200 times from a local stand-in of the aWATTar API, first on its own and then with a
+second stand-in configured as its mirror. Both stand-ins take 0.05 seconds to respond, except for 10% of the calls
+which take 3 seconds. With a mirror the download is hedged after 0.2 seconds.
+
+Everything runs offline on localhost. The stand-ins are the ones of the load test. Reported are p50, p99 and
+maximal download durations and how often each source won. Downloads include decoding and validating the price
+data, but not storing it. This only works if there is no config at /etc/awattprice/config.ini, which would take
+precedence.
+
+Afterwards hedging is checked: a primary which only answers late must be cancelled once the mirror won, and if
+both stand-ins fail the error of the primary must be raised. The script exits with an error if a check fails.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+import argparse
+import asyncio
+import functools
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from collections import Counter
+from pathlib import Path
+
+import arrow
+
+from liteconfig import Config
+
+from awattprice import configurator
+from awattprice import defaults
+from awattprice import exceptions
+from awattprice import ingest
+from awattprice import metrics
+from awattprice import prices
+from awattprice import upstream
+from awattprice.defaults import Region
+from load_test_prices import DAY
+from load_test_prices import AwattarStub
+from load_test_prices import get_percentile
+
+REGION = Region.DE
+
+
+class SlowTailAwattarStub(AwattarStub):
+    """Stand-in of the aWATTar API of which a share of calls is answered late."""
+
+    slow_latency: float
+    slow_rate: float
+
+    _base_latency: float
+    _latency_random: random.Random
+    _latency_lock: threading.Lock
+
+    def __init__(
+        self, seed_start: int, seed_end: int, latency: float, slow_latency: float, slow_rate: float, seed: int
+    ):
+        """Constructor for a new stand-in listening on a free port of localhost.
+
+        :param latency: Seconds to wait before responding to most calls.
+        :param slow_latency: Seconds to wait before responding to slow calls.
+        :param slow_rate: Share of calls which are slow.
+        :param seed: Seed of the random choice of slow calls.
+        """
+        self._latency_random = random.Random(seed)
+        self._latency_lock = threading.Lock()
+        super().__init__(seed_start, seed_end, latency, failure_rate=0, failure_mode="error")
+        self.slow_latency = slow_latency
+        self.slow_rate = slow_rate
+
+    @property
+    def latency(self) -> float:
+        """Seconds to wait before responding to the current call."""
+        with self._latency_lock:
+            slow = self._latency_random.random() < self.slow_rate
+        return self.slow_latency if slow else self._base_latency
+
+    @latency.setter
+    def latency(self, latency: float):
+        self._base_latency = latency
+
+    def handle_error(self, request, client_address):
+        # Requests which lost the race are cancelled and their connections closed before the stand-in responds.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def prepare_config(home: Path, primary: AwattarStub, mirror: AwattarStub, hedge_delay: float) -> Config:
+    """Write a config pointing to the primary stand-in, with the mirror as its mirror, into a home directory."""
+    region_path = f"/{REGION.value.lower()}/v1/marketdata/"
+    config_text = defaults.DEFAULT_CONFIG.replace(
+        f"https://api.awattar.{REGION.value.lower()}/v1/marketdata/",
+        f"http://127.0.0.1:{primary.port}{region_path}",
+    )
+    # The first mirrors field is the one of the DE section.
+    config_text = config_text.replace(
+        "\nmirrors =\n", f"\nmirrors = http://127.0.0.1:{mirror.port}{region_path}\n", 1
+    )
+    config_text = config_text.replace("hedge_delay = 1", f"hedge_delay = {hedge_delay}")
+    config_path = home / ".config" / "awattprice" / "config.ini"
+    config_path.parent.mkdir(parents=True)
+    config_path.write_text(config_text)
+
+    os.environ["HOME"] = str(home)
+    return configurator.get_config()
+
+
+async def measure_downloads(config: Config, count: int) -> list[float]:
+    """Download price data repeatedly and get the duration of each download."""
+    durations = []
+    upstream.open_client(config)
+    try:
+        for _ in range(count):
+            timer = ingest.IngestTimer(REGION)
+            start = time.perf_counter()
+            data = await prices.download_data(REGION, config, timer)
+            durations.append(time.perf_counter() - start)
+            if data is None:
+                raise RuntimeError("Price data couldn't be downloaded.")
+    finally:
+        await upstream.close_client()
+    return durations
+
+
+def count_wins() -> Counter:
+    """Get how often each source won so far."""
+    return Counter({source: metrics.upstream_source_wins.get(REGION.name, str(source)) for source in range(2)})
+
+
+async def hedge_download(config: Config, cancelled: set[int]) -> int:
+    """Download price data once from the sources hedged, without retrying.
+
+    :param cancelled: Filled with the index of each source whose request was cancelled.
+    :returns: Index of the source which won.
+    """
+    day_start = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE).floor("day")
+    params = {
+        "start": day_start.int_timestamp * defaults.SEC_TO_MILLISEC,
+        "end": day_start.shift(days=+2).int_timestamp * defaults.SEC_TO_MILLISEC,
+    }
+    timer = ingest.IngestTimer(REGION)
+
+    async def fetch(client, source: int, url: str) -> dict:
+        try:
+            return await prices.fetch_price_data(client, url, params, REGION, source, timer)
+        except asyncio.CancelledError:
+            cancelled.add(source)
+            raise
+
+    async with upstream.client_session(config) as client:
+        requests = [
+            functools.partial(fetch, client, source, url)
+            for source, url in enumerate(upstream.get_sources(REGION, config))
+        ]
+        source, _ = await upstream.hedge(requests, config.upstream.hedge_delay)
+    return source
+
+
+def check_hedging(config: Config, primary: SlowTailAwattarStub, mirror: SlowTailAwattarStub) -> bool:
+    """Check that a slow primary is cancelled once the mirror won and that the error of the primary is raised if
+    both stand-ins fail.
+
+    :returns: True if all checks passed.
+    """
+    passed = True
+
+    primary.slow_rate, mirror.slow_rate = 1, 0
+    cancelled = set()
+    start = time.perf_counter()
+    source = asyncio.run(hedge_download(config, cancelled))
+    duration = time.perf_counter() - start
+    ok = source == 1 and 0 in cancelled and duration < primary.slow_latency
+    print(f"slow primary cancelled once the mirror won after {duration * 1000:.1f}ms: {'ok' if ok else 'FAILED'}")
+    passed &= ok
+
+    # The primary fails first, so that its error isn't the one of the request which failed last.
+    primary.slow_rate = 0
+    primary.failure_rate = mirror.failure_rate = 1
+    try:
+        asyncio.run(hedge_download(config, set()))
+        error = None
+    except exceptions.UpstreamStatusError as exc:
+        error = exc
+    ok = error is not None and error.url.startswith(f"http://127.0.0.1:{primary.port}/")
+    print(f"error of the primary raised if both failed ({error}): {'ok' if ok else 'FAILED'}")
+    passed &= ok
+    return passed
+
+
+def report(name: str, durations: list[float], wins: Counter):
+    """Print percentiles of the download durations and how often each source won."""
+    p50 = get_percentile(durations, 50) * 1000
+    p99 = get_percentile(durations, 99) * 1000
+    print(
+        f"{name}: p50 {p50:.1f}ms, p99 {p99:.1f}ms, max {max(durations) * 1000:.1f}ms, "
+        f"primary won {wins[0]:.0f}, mirror won {wins[1]:.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--downloads", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--slow-latency", type=float, default=3)
+    parser.add_argument("--slow-rate", type=float, default=0.1)
+    parser.add_argument("--hedge-delay", type=float, default=0.2)
+    args = parser.parse_args()
+
+    day_start = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE).floor("day").int_timestamp
+    stubs = [
+        SlowTailAwattarStub(
+            day_start - DAY, day_start + DAY, args.latency, args.slow_latency, args.slow_rate, seed
+        )
+        for seed in range(2)
+    ]
+    for stub in stubs:
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+    primary, mirror = stubs
+
+    with tempfile.TemporaryDirectory() as home:
+        config = prepare_config(Path(home), primary, mirror, args.hedge_delay)
+        region_config = getattr(config, f"awattar.{REGION.value.lower()}")
+        mirrors, region_config.mirrors = region_config.mirrors, ""
+        for name in ("single source", "hedged with mirror"):
+            wins = count_wins()
+            durations = asyncio.run(measure_downloads(config, args.downloads))
+            report(name, durations, count_wins() - wins)
+            region_config.mirrors = mirrors
+        print(f"calls: primary {sum(primary.calls.values())}, mirror {sum(mirror.calls.values())}")
+        passed = check_hedging(config, primary, mirror)
+
+    for stub in stubs:
+        stub.shutdown()
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
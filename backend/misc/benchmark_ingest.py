@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""Compare the ingest stages of downloaded price data with the former ingest path.
+
+Call:
+
+    ./benchmark_ingest.py 2
+
+to benchmark two days of hourly price data for one region.
+
+The former path decoded the response to text, wrapped the json in a Box, validated it with `jsonschema.validate`
+(which checks the schema and builds a validator on every call) and parsed each price point into a Box with two
+Arrow objects and a MarketPrice holding a Decimal built from the string of the float price.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+import json
+import sys
+import timeit
+
+import jsonschema
+
+from box import Box
+
+from awattprice import defaults
+from awattprice import ingest
+from awattprice import prices
+from awattprice.defaults import Region
+
+from benchmark_price_series import generate_downloaded_data
+from benchmark_price_series import legacy_response
+from benchmark_price_series import parse_legacy
+
+
+def legacy_decode(content: bytes) -> Box:
+    """Decode the response body like the former ingest path."""
+    return Box(json.loads(content.decode("utf-8")))
+
+
+def legacy_validate(data: Box):
+    """Validate like the former ingest path."""
+    jsonschema.validate(data, defaults.AWATTAR_API_PRICE_DATA_SCHEMA)
+
+
+def measure_time(run, number: int = 200) -> float:
+    """Get the average time in microseconds one call of the callable takes."""
+    return min(timeit.repeat(run, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    if len(sys.argv) == 2:
+        days = int(sys.argv[1])
+    else:
+        days = 2
+    region = Region.DE
+    content = json.dumps(generate_downloaded_data(days).to_dict()).encode("utf-8")
+
+    legacy_data = legacy_decode(content)
+    data = ingest.decode_price_data(content)
+    legacy_points = legacy_response(parse_legacy(region, legacy_data))
+    points = prices.parse_to_response_data(ingest.parse_price_data(region, data))["prices"]
+    if legacy_points != points:
+        raise RuntimeError("Former and current ingest path parse different price data.")
+
+    rows = [
+        (
+            "decode (us)",
+            measure_time(lambda: legacy_decode(content)),
+            measure_time(lambda: ingest.decode_price_data(content)),
+        ),
+        (
+            "validate (us)",
+            measure_time(lambda: legacy_validate(legacy_data)),
+            measure_time(lambda: ingest.validate_price_data(data)),
+        ),
+        (
+            "parse (us)",
+            measure_time(lambda: parse_legacy(region, legacy_data)),
+            measure_time(lambda: ingest.parse_price_data(region, data)),
+        ),
+    ]
+    rows.append(("total (us)", sum(row[1] for row in rows), sum(row[2] for row in rows)))
+
+    print(f"{len(data['data'])} price points of region {region.value}, {len(content)} bytes.\n")
+    print(f"{'':<16}{'former':>14}{'current':>14}{'factor':>10}")
+    for name, legacy_value, value in rows:
+        print(f"{name:<16}{legacy_value:>14.1f}{value:>14.1f}{legacy_value / value:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+"""Compare finding the prices below the values of many tokens with decimal and with fixed-point integer prices.
+
+Call:
+
+    ./benchmark_price_below_tokens.py 100000
+
+to check two days of hourly price data against the below values and base fees of 100000 tokens. Also measures
+filtering these tokens in SQL with the checks used to collect the tokens which apply for a notification.
+
+The former decimal computation is rebuilt here to have something to compare against. Both must find the same
+prices for every token.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+import asyncio
+import random
+import sys
+import time
+
+from decimal import Decimal
+
+from sqlalchemy import and_
+from sqlalchemy import func
+from sqlalchemy import or_
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from awattprice import defaults
+from awattprice import orm
+from awattprice import utils
+from awattprice.defaults import Region
+from awattprice.series import PriceSeries
+from awattprice_notifications.price_below.prices import DetailedPriceData
+from awattprice_notifications.price_below.tokens import get_below_value_checks
+
+REGION = Region.DE
+
+
+def generate_price_data(days: int = 2) -> PriceSeries:
+    """Generate hourly price data with market prices of two decimal places."""
+    starts = range(0, days * 24 * 3600, 3600)
+    prices = (round(80 + (index * 37 % 53) - 20.17, 2) for index in range(len(starts)))
+    return PriceSeries.from_columns(REGION, starts, (start + 3600 for start in starts), prices)
+
+
+def generate_tokens(count: int) -> list[tuple[bool, Decimal, int]]:
+    """Generate the tax options, base fees and below values of tokens."""
+    generator = random.Random(0)
+    return [
+        (generator.random() < 0.5, Decimal(generator.randrange(0, 2000)) / 100, generator.randrange(5, 25))
+        for _ in range(count)
+    ]
+
+
+def find_decimal(data: PriceSeries, tokens: list[tuple[bool, Decimal, int]]) -> list[list[int]]:
+    """Find the prices below the values of all tokens with the former decimal computation."""
+    # Like the millicent computation, prices are only converted once for each tax option.
+    ct_kwh_prices = {
+        taxed: [utils.round_ctkwh(utils.euromwh_to_ctkwh(price)) for price in prices]
+        for taxed, prices in ((False, data.decimal_marketprices()), (True, data.taxed()))
+    }
+    results = []
+    for taxed, base_fee, below_value in tokens:
+        results.append(
+            [index for index, price in enumerate(ct_kwh_prices[taxed]) if price + base_fee <= below_value]
+        )
+    return results
+
+
+def find_millicents(data: PriceSeries, tokens: list[tuple[bool, Decimal, int]]) -> list[list[int]]:
+    """Find the prices below the values of all tokens with fixed-point integer millicents."""
+    detailed_data = DetailedPriceData(data)
+    results = []
+    for taxed, base_fee, below_value in tokens:
+        base_fee = utils.ctkwh_to_millicents(base_fee)
+        consumer_prices = detailed_data.get_consumer_prices(taxed, base_fee)
+        below_value *= defaults.MILLICENTS_PER_CENT
+        results.append([index for index, price in enumerate(consumer_prices) if price <= below_value])
+    return results
+
+
+async def measure_sql(data: PriceSeries, tokens: list[tuple[bool, Decimal, int]]) -> tuple[int, float]:
+    """Filter the tokens in an in-memory database with the checks of the price below notifications."""
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(orm.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        for token_id, (taxed, base_fee, below_value) in enumerate(tokens):
+            token = orm.Token(
+                token=f"token-{token_id}", region=REGION, tax=taxed, base_fee=utils.ctkwh_to_millicents(base_fee)
+            )
+            token.price_below = orm.PriceBelowNotification(active=True, below_value=below_value)
+            session.add(token)
+        await session.commit()
+
+        detailed_data = DetailedPriceData(data)
+        detailed_data.find_lowest_price()
+        checks = get_below_value_checks({REGION: detailed_data})
+        statement = (
+            select(func.count())
+            .select_from(orm.Token)
+            .join(orm.Token.price_below)
+            .where(and_(orm.PriceBelowNotification.active == True, or_(*checks)))
+        )
+        start = time.perf_counter()
+        count = (await session.execute(statement)).scalar_one()
+        duration = time.perf_counter() - start
+    await engine.dispose()
+    return count, duration
+
+
+def main():
+    token_count = int(sys.argv[1]) if len(sys.argv) == 2 else 100000
+    data = generate_price_data()
+    tokens = generate_tokens(token_count)
+    print(f"{token_count} tokens, {len(data)} price points.")
+
+    start = time.perf_counter()
+    decimal_results = find_decimal(data, tokens)
+    decimal_duration = time.perf_counter() - start
+    start = time.perf_counter()
+    millicent_results = find_millicents(data, tokens)
+    millicent_duration = time.perf_counter() - start
+    if decimal_results != millicent_results:
+        raise AssertionError("Decimal and millicent computations found different prices.")
+    print(f"Decimal:    {decimal_duration:.3f}s")
+    print(f"Millicents: {millicent_duration:.3f}s ({decimal_duration / millicent_duration:.1f}x faster)")
+
+    applying = sum(1 for indices in decimal_results if indices)
+    count, sql_duration = asyncio.run(measure_sql(data, tokens))
+    if count != applying:
+        raise AssertionError(f"SQL filter found {count} applying tokens instead of {applying}.")
+    print(f"SQL filter: {sql_duration:.3f}s for {count} applying tokens")
+
+
+if __name__ == "__main__":
+    main()
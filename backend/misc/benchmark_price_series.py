@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""Compare memory and CPU usage of the price series with the former Box price point format.
+
+Call:
+
+    ./benchmark_price_series.py 2
+
+to benchmark two days of hourly price data for one region.
+
+The former format stored each price point as a Box with two Arrow objects and a MarketPrice. It is rebuilt
+here to have something to compare against.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+import copy
+import pickle
+import sys
+import timeit
+import tracemalloc
+
+from decimal import Decimal
+
+import arrow
+
+from box import Box
+from box import BoxList
+
+from awattprice import defaults
+from awattprice import ingest
+from awattprice import prices
+from awattprice.defaults import Region
+
+
+def generate_downloaded_data(days: int) -> Box:
+    """Generate data as it would be downloaded from the aWATTar API."""
+    start = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE).floor("day")
+    points = []
+    for hour in range(days * 24):
+        start_timestamp = start.shift(hours=hour).int_timestamp * defaults.SEC_TO_MILLISEC
+        points.append(
+            {
+                "start_timestamp": start_timestamp,
+                "end_timestamp": start_timestamp + 3600 * defaults.SEC_TO_MILLISEC,
+                "marketprice": round(80 + (hour * 37 % 53) - 20.17, 2),
+                "unit": "Eur/MWh",
+            }
+        )
+    return Box({"object": "list", "data": points, "url": "/de/v1/marketdata/"})
+
+
+def parse_legacy(region: Region, data: Box) -> Box:
+    """Parse downloaded data into the former format of Box price points."""
+    new_data = Box()
+    new_data.prices = BoxList()
+    for point in data.data:
+        new_point = Box()
+        start_timestamp = point.start_timestamp / defaults.SEC_TO_MILLISEC
+        new_point.start_timestamp = arrow.get(start_timestamp).to(defaults.EUROPE_BERLIN_TIMEZONE)
+        end_timestamp = point.end_timestamp / defaults.SEC_TO_MILLISEC
+        new_point.end_timestamp = arrow.get(end_timestamp).to(defaults.EUROPE_BERLIN_TIMEZONE)
+        new_point.marketprice = prices.MarketPrice(Decimal(str(point.marketprice)), region)
+        new_data.prices.append(new_point)
+    return new_data
+
+
+def legacy_response(data: Box) -> list:
+    """Build the response points from the former format."""
+    return [
+        {
+            "start_timestamp": point.start_timestamp.int_timestamp,
+            "end_timestamp": point.end_timestamp.int_timestamp,
+            "marketprice": float(point.marketprice.value),
+        }
+        for point in data.prices
+    ]
+
+
+def legacy_ct_kwh(data: Box) -> list:
+    """Convert all prices of the former format to rounded and taxed cent per kWh."""
+    return [point.marketprice.ct_kwh(taxed=True, round_=True) for point in data.prices]
+
+
+def measure_memory(create) -> int:
+    """Get the number of bytes allocated by the object the callable returns."""
+    tracemalloc.start()
+    created = create()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del created
+    return allocated
+
+
+def measure_time(run, number: int = 200) -> float:
+    """Get the average time in microseconds one call of the callable takes."""
+    return min(timeit.repeat(run, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    if len(sys.argv) == 2:
+        days = int(sys.argv[1])
+    else:
+        days = 2
+    region = Region.DE
+    downloaded = generate_downloaded_data(days)
+
+    legacy = parse_legacy(region, downloaded)
+    series = ingest.parse_price_data(region, downloaded)
+    legacy_pickled = pickle.dumps(legacy)
+    series_pickled = pickle.dumps(series)
+
+    rows = [
+        (
+            "memory (bytes)",
+            measure_memory(lambda: parse_legacy(region, downloaded)),
+            measure_memory(lambda: ingest.parse_price_data(region, downloaded)),
+        ),
+        ("pickled size (bytes)", len(legacy_pickled), len(series_pickled)),
+        (
+            "parse (us)",
+            measure_time(lambda: parse_legacy(region, downloaded)),
+            measure_time(lambda: ingest.parse_price_data(region, downloaded)),
+        ),
+        (
+            "unpickle (us)",
+            measure_time(lambda: pickle.loads(legacy_pickled)),
+            measure_time(lambda: pickle.loads(series_pickled)),
+        ),
+        (
+            "deepcopy (us)",
+            measure_time(lambda: copy.deepcopy(legacy)),
+            measure_time(lambda: copy.deepcopy(series)),
+        ),
+        (
+            "response points (us)",
+            measure_time(lambda: legacy_response(legacy)),
+            measure_time(lambda: prices.parse_to_response_data(series)),
+        ),
+        (
+            "taxed ct/kWh (us)",
+            measure_time(lambda: legacy_ct_kwh(legacy)),
+            measure_time(lambda: series.ct_kwh(taxed=True, round_=True)),
+        ),
+    ]
+
+    print(f"{len(series)} price points of region {region.value}.\n")
+    print(f"{'':<22}{'legacy':>14}{'series':>14}{'factor':>10}")
+    for name, legacy_value, series_value in rows:
+        factor = legacy_value / series_value if series_value else float("inf")
+        print(f"{name:<22}{legacy_value:>14.1f}{series_value:>14.1f}{factor:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
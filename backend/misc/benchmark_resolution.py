@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+"""Compare serving and notifying about price data with hourly and with quarter-hourly resolution.
+
+Call:
+
+    ./benchmark_resolution.py --requests 2000 --tokens 100000
+
+to benchmark two days of hourly (48 price points) and of quarter-hourly (192 price points) price data. Measured are
+ingesting the downloaded data, rendering responses once per data version, the latency of 2000 requests to
+/data/DE for each kind of response and a price below notification run for 100000 tokens.
+
+Requests are sent in process, so their latencies include the web framework but no network. Refreshing is left to
+the background, so requests only read the stored price data. Notification runs include finding the prices below
+the value of each token and constructing the notifications, but not sending them. They are measured with prices
+averaged to the notification resolution and with the prices as received.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import timeit
+
+from pathlib import Path
+
+import arrow
+
+from fastapi.testclient import TestClient
+
+from awattprice import configurator
+from awattprice import defaults
+from awattprice import ingest
+from awattprice import orm
+from awattprice import prices
+from awattprice import responses
+from awattprice import store
+from awattprice import variants
+from awattprice.api import create_app
+from awattprice.defaults import PriceUnit
+from awattprice.defaults import Region
+from awattprice.series import PriceSeries
+from awattprice_notifications.price_below import defaults as price_below_defaults
+from awattprice_notifications.price_below.notifications import construct_notification
+from awattprice_notifications.price_below.notifications import construct_notification_headers
+from awattprice_notifications.price_below.prices import NotifiableDetailedPriceData
+
+REGION = Region.DE
+RESOLUTIONS = {"hourly": 3600, "quarter-hourly": 900}
+
+# Query parameters and headers of the requests measured for each kind of response.
+REQUESTS = {
+    "json": ({}, {}),
+    "columnar": ({}, {"accept": responses.COLUMNAR_PRICE_DATA_MEDIA_TYPE}),
+    "gzip": ({}, {"accept-encoding": "gzip"}),
+    "consumer": ({"tax": "true", "base_fee": "0.5", "unit": "ct_kwh"}, {}),
+    "aggregated": ({"resolution": "3600"}, {}),
+}
+
+
+def get_marketprice(start_timestamp: int) -> float:
+    """Get the synthetic market price of the price point starting at a timestamp."""
+    quarter = start_timestamp // 900
+    return round(60 + (quarter // 4 * 37 % 53) + (quarter % 4 * 7 % 5) - 20.17, 2)
+
+
+def generate_price_data(resolution: int) -> PriceSeries:
+    """Generate price data of the current and the following day."""
+    day_start = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE).floor("day")
+    starts = range(day_start.int_timestamp, day_start.shift(days=+2).int_timestamp, resolution)
+    return PriceSeries.from_columns(
+        REGION, starts, (start + resolution for start in starts), (get_marketprice(start) for start in starts)
+    )
+
+
+def generate_downloaded_data(data: PriceSeries) -> bytes:
+    """Get the response body aWATTar would send for price data."""
+    points = [
+        {
+            "start_timestamp": start * defaults.SEC_TO_MILLISEC,
+            "end_timestamp": end * defaults.SEC_TO_MILLISEC,
+            "marketprice": marketprice,
+            "unit": "Eur/MWh",
+        }
+        for start, end, marketprice in zip(data.start_timestamps, data.end_timestamps, data.marketprices)
+    ]
+    return json.dumps({"object": "list", "data": points, "url": "/de/v1/marketdata/"}).encode("utf-8")
+
+
+def measure_time(run, number: int = 200) -> float:
+    """Get the average time in microseconds one call of the callable takes."""
+    return min(timeit.repeat(run, number=number, repeat=5)) / number * 1e6
+
+
+def measure_processing(data: PriceSeries):
+    """Measure ingesting the downloaded data and rendering each kind of response once."""
+    content = generate_downloaded_data(data)
+
+    def ingest_data():
+        decoded = ingest.decode_price_data(content)
+        ingest.validate_price_data(decoded)
+        ingest.parse_price_data(REGION, decoded)
+
+    columnar_format = responses.ResponseFormat(responses.COLUMNAR_PRICE_DATA_MEDIA_TYPE)
+    timings = {
+        "ingest": measure_time(ingest_data),
+        "render json": measure_time(lambda: responses.render_price_series(data)),
+        "render columnar": measure_time(lambda: responses.render_price_series(data, columnar_format)),
+        "render gzip": measure_time(lambda: responses.render_price_series(data).compress("gzip"), number=20),
+        "personalize": measure_time(lambda: variants.personalize(data, True, 500, PriceUnit.CT_KWH)),
+        "aggregate": measure_time(lambda: data.aggregate(3600)),
+    }
+    print("    " + ", ".join(f"{name} {timing:.0f}us" for name, timing in timings.items()))
+
+
+def prepare_home(home: Path, data: PriceSeries):
+    """Write a config, an empty database and the price data into a home directory."""
+    config_path = home / ".config" / "awattprice" / "config.ini"
+    config_path.parent.mkdir(parents=True)
+    config_path.write_text(defaults.DEFAULT_CONFIG.replace("background = false", "background = true"))
+
+    os.environ["HOME"] = str(home)
+    config = configurator.get_config()
+    (config.paths.data_dir / defaults.DATABASE_FILE_NAME).touch()
+    asyncio.run(store.write_price_file(prices.get_price_data_file_path(REGION, config), data))
+    return config
+
+
+def measure_requests(data: PriceSeries, request_count: int):
+    """Measure the latencies of requests to the price data endpoint for each kind of response."""
+    with tempfile.TemporaryDirectory() as home:
+        config = prepare_home(Path(home), data)
+        with TestClient(create_app(config)) as client:
+            for name, (params, headers) in REQUESTS.items():
+                # The first request renders the response for the data version.
+                client.get(f"/data/{REGION.value}", params=params, headers=headers).raise_for_status()
+                latencies = []
+                for _ in range(request_count):
+                    start = time.perf_counter()
+                    client.get(f"/data/{REGION.value}", params=params, headers=headers)
+                    latencies.append(time.perf_counter() - start)
+                latencies.sort()
+                p50 = statistics.median(latencies) * 1000
+                p99 = latencies[int(len(latencies) * 0.99)] * 1000
+                print(f"    {name}: p50 {p50:.2f}ms, p99 {p99:.2f}ms")
+
+
+def generate_tokens(count: int) -> list[orm.Token]:
+    """Generate tokens with price below notifications. They aren't stored in a database."""
+    generator = random.Random(0)
+    tokens = []
+    for token_id in range(count):
+        token = orm.Token(
+            token=f"token-{token_id}",
+            region=REGION,
+            tax=generator.random() < 0.5,
+            base_fee=generator.randrange(0, 2000) * 10,
+        )
+        token.price_below = orm.PriceBelowNotification(active=True, below_value=generator.randrange(5, 25))
+        tokens.append(token)
+    return tokens
+
+
+def run_notifications(data: PriceSeries, tokens: list[orm.Token]) -> int:
+    """Find the prices below the value of each token and construct its notification.
+
+    :returns: Number of constructed notifications.
+    """
+    notifiable_data = price_below_defaults.get_notifiable_prices(data)
+    notifiable_prices = NotifiableDetailedPriceData(notifiable_data)
+    notifiable_prices.find_lowest_price()
+    count = 0
+    for token in tokens:
+        prices_below = notifiable_prices.get_prices_below_value(
+            token.price_below.below_value, token.base_fee, token.tax
+        )
+        # Only tokens for which a price is below their value are collected from the database.
+        if len(prices_below) == 0:
+            continue
+        construct_notification_headers("authorization", prices_below, True)
+        construct_notification(token, prices_below, notifiable_prices)
+        count += 1
+    return count
+
+
+def measure_notifications(data: PriceSeries, tokens: list[orm.Token]):
+    """Measure notification runs with prices at the notification resolution and with the prices as received."""
+    notification_resolution = price_below_defaults.NOTIFICATION_RESOLUTION
+    for name, resolution in (("notification resolution", notification_resolution), ("as received", 0)):
+        price_below_defaults.NOTIFICATION_RESOLUTION = resolution
+        try:
+            start = time.perf_counter()
+            count = run_notifications(data, tokens)
+            duration = time.perf_counter() - start
+        finally:
+            price_below_defaults.NOTIFICATION_RESOLUTION = notification_resolution
+        print(f"    notifications at {name}: {duration:.3f}s for {count} notifications")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--tokens", type=int, default=100000)
+    args = parser.parse_args()
+
+    tokens = generate_tokens(args.tokens)
+    for name, resolution in RESOLUTIONS.items():
+        data = generate_price_data(resolution)
+        print(f"{name}: {len(data)} price points")
+        measure_processing(data)
+        measure_requests(data, args.requests)
+        measure_notifications(data, tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Check that importing the web app and the notification service stays within a time budget.
+
+Call:
+
+    ./check_import_time.py --runs 5
+
+to import each budgeted module in five fresh interpreters with `python -X importtime` and compare the fastest
+cumulative import time against its budget. Exits with status 1 if a module exceeds its budget. The slowest
+imports of such a module are listed to find what caused it.
+
+Importing must not have side effects like reading the config, so the modules are imported with a temporary home
+directory. The budgets were measured on a single cpu and leave about a quarter of headroom.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+# Budgets as milliseconds of the cumulative import time of each module.
+BUDGETS = {
+    # Importing the package must not import its submodules.
+    "awattprice": 50,
+    # Price computations must not import the web framework.
+    "awattprice.series": 250,
+    "awattprice.api": 1000,
+    "awattprice_notifications.price_below.service": 1000,
+}
+
+
+def measure(module: str, home: str) -> tuple[float, list[tuple[float, str]]]:
+    """Import a module in a fresh interpreter.
+
+    :returns: Cumulative import time of the module in milliseconds and the cumulative import times of all
+        modules it imported.
+    """
+    environment = dict(os.environ, HOME=home)
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        imports.append((int(cumulative) / 1000, name.strip()))
+    total = next(cumulative for cumulative, name in imports if name == module)
+    return total, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    exceeded = False
+    with tempfile.TemporaryDirectory() as home:
+        for module, budget in BUDGETS.items():
+            total, imports = min((measure(module, home) for _ in range(args.runs)), key=lambda result: result[0])
+            status = "ok" if total <= budget else "EXCEEDED"
+            print(f"{module}: {total:.0f}ms of {budget}ms {status}")
+            if total > budget:
+                exceeded = True
+                for cumulative, name in sorted(imports, reverse=True)[1:11]:
+                    print(f"    {cumulative:.0f}ms {name}")
+    if exceeded:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+"""Load test the price data endpoint against a local stand-in of the aWATTar API.
+
+Call:
+
+    ./load_test_prices.py --rate 200 --duration 90 --publish-after 30 --herd 200 --latency 0.3
+
+to request /data/DE at 200 requests per second for 90 seconds. The stand-in publishes the prices of the next day
+after 30 seconds. At that moment 200 additional requests are sent at once, like clients do when the update hour
+is reached. The stand-in takes 0.3 seconds to respond to each call.
+
+Everything runs offline on localhost. The web app is served with gunicorn and a temporary home directory. Its
+config points to the stand-in, which is started by this script. The stored price data ends at midnight of the
+current day, so it would be due for update regardless of the time the test runs. Its last update time is set so
+that the update cooldown only ends at publication, which keeps the web app from polling the stand-in before. Until
+publication the stand-in has no newer prices. Afterwards it has prices until the day after tomorrow, which makes
+them up to date. This only works if there is no config at /etc/awattprice/config.ini, which would take
+precedence.
+
+Requests are scheduled at a fixed rate and don't wait for previous responses. Latencies are measured from the
+time a request was scheduled, so that a stalled server can't hide its delays by slowing down the load. Reported
+are p50 and p99 latency and the throughput before publication, of the herd and after publication. Also reported
+are the calls the stand-in received and when clients were first served the new prices. Unless price data is
+refreshed in the background or the stand-in fails, the test fails if publication didn't cause exactly one call.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+import arrow
+import httpx
+
+from liteconfig import Config
+
+from awattprice import configurator
+from awattprice import defaults
+from awattprice import prices
+from awattprice import snapshot
+from awattprice import store
+from awattprice.defaults import Region
+from awattprice.series import PriceSeries
+from load_test_workers import get_free_port
+from load_test_workers import wait_until_serving
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+def get_marketprice(start_timestamp: int) -> float:
+    """Get the synthetic market price of the price point starting at a timestamp."""
+    hour = start_timestamp // HOUR
+    return round(60 + (hour * 37 % 53) - 20.17, 2)
+
+
+class AwattarStub(ThreadingHTTPServer):
+    """Stand-in of the market data endpoints of the aWATTar API."""
+
+    daemon_threads = True
+
+    seed_start: int
+    seed_end: int
+    published_end: int
+    publish_time: float
+    latency: float
+    failure_rate: float
+    failure_mode: str
+    calls: Counter
+
+    _random: random.Random
+    _lock: threading.Lock
+
+    def __init__(self, seed_start: int, seed_end: int, latency: float, failure_rate: float, failure_mode: str):
+        """Constructor for a new stand-in listening on a free port of localhost.
+
+        :param seed_start, seed_end: Time range of the price data the stand-in has before publication.
+        :param latency: Seconds to wait before responding to each call.
+        :param failure_rate: Share of calls which fail.
+        :param failure_mode: Either 'error' to respond with status 503 or 'drop' to close the connection
+            without responding.
+        """
+        super().__init__(("127.0.0.1", 0), AwattarStubHandler)
+        self.seed_start = seed_start
+        self.seed_end = seed_end
+        self.published_end = seed_end + 2 * DAY
+        self.publish_time = float("inf")
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.calls = Counter()
+        self._random = random.Random(0)
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def count(self, outcome: str) -> bool:
+        """Count a call with its outcome.
+
+        :returns: True if the call should fail.
+        """
+        with self._lock:
+            fail = self._random.random() < self.failure_rate
+            self.calls[self.failure_mode if fail else outcome] += 1
+        return fail
+
+    def reset(self):
+        """Forget all calls counted so far."""
+        with self._lock:
+            self.calls.clear()
+
+    def get_price_points(self, start: int, end: int) -> list[dict]:
+        """Get the price points overlapping a time range which are published at the moment."""
+        end_timestamp = self.published_end if time.time() >= self.publish_time else self.seed_end
+        points = []
+        for start_timestamp in range(max(start, self.seed_start), min(end, end_timestamp), HOUR):
+            points.append(
+                {
+                    "start_timestamp": start_timestamp * defaults.SEC_TO_MILLISEC,
+                    "end_timestamp": (start_timestamp + HOUR) * defaults.SEC_TO_MILLISEC,
+                    "marketprice": get_marketprice(start_timestamp),
+                    "unit": "Eur/MWh",
+                }
+            )
+        return points
+
+
+class AwattarStubHandler(BaseHTTPRequestHandler):
+    """Respond to calls of the aWATTar stand-in."""
+
+    server: AwattarStub
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path not in ("/de/v1/marketdata/", "/at/v1/marketdata/"):
+            self.send_error(404)
+            return
+        time.sleep(self.server.latency)
+        if self.server.count("ok"):
+            if self.server.failure_mode == "drop":
+                self.close_connection = True
+                return
+            self.send_error(503)
+            return
+
+        parameters = parse_qs(url.query)
+        start = int(parameters["start"][0]) // defaults.SEC_TO_MILLISEC
+        end = int(parameters["end"][0]) // defaults.SEC_TO_MILLISEC
+        points = self.server.get_price_points(start, end)
+        body = json.dumps({"object": "list", "data": points, "url": url.path}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def set_cooldown_end(config: Config, timestamp: int):
+    """Set the last update time of the stored price data of all regions, so that their update cooldown ends at a
+    timestamp. The web app reloads it on the next request.
+    """
+    for region in Region:
+        last_update_time = timestamp - defaults.AWATTAR_COOLDOWN_INTERVAL
+        prices.get_update_ts_file_path(region, config).write_text(str(last_update_time))
+        snapshot.publish(region, config)
+
+
+def prepare_home(home: Path, stub: AwattarStub, background: bool) -> Config:
+    """Write a config pointing to the stand-in, an empty database and the seed price data into a home directory.
+
+    The seed price data was just updated, so that it isn't due until the update cooldown ended.
+    """
+    config_text = defaults.DEFAULT_CONFIG
+    for region in Region:
+        region_path = f"/{region.value.lower()}/v1/marketdata/"
+        config_text = config_text.replace(
+            f"https://api.awattar.{region.value.lower()}/v1/marketdata/",
+            f"http://127.0.0.1:{stub.port}{region_path}",
+        )
+    if background:
+        config_text = config_text.replace("background = false", "background = true")
+    config_path = home / ".config" / "awattprice" / "config.ini"
+    config_path.parent.mkdir(parents=True)
+    config_path.write_text(config_text)
+
+    os.environ["HOME"] = str(home)
+    config = configurator.get_config()
+    (config.paths.data_dir / defaults.DATABASE_FILE_NAME).touch()
+
+    starts = range(stub.seed_start, stub.seed_end, HOUR)
+    for region in Region:
+        data = PriceSeries.from_columns(
+            region, starts, (start + HOUR for start in starts), (get_marketprice(start) for start in starts)
+        )
+        asyncio.run(store.write_price_file(prices.get_price_data_file_path(region, config), data))
+    set_cooldown_end(config, int(time.time()) + defaults.AWATTAR_COOLDOWN_INTERVAL)
+    return config
+
+
+def start_server(home: Path, port: int, workers: int) -> subprocess.Popen:
+    """Serve the web app with gunicorn."""
+    environment = dict(os.environ, HOME=str(home))
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--workers",
+            str(workers),
+            "--worker-class",
+            "uvicorn.workers.UvicornWorker",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--log-level",
+            "warning",
+            "awattprice.api:create_app()",
+        ],
+        env=environment,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def send_requests(url: str, offsets: list[float], start_time: float) -> list[tuple[float, float, int, int]]:
+    """Send requests at scheduled times without waiting for previous responses.
+
+    :param offsets: Seconds after the start time at which to send each request.
+    :returns: For each request its offset, latency since its scheduled time, status code and number of price
+        points.
+    """
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+
+        async def send(offset: float) -> tuple[float, float, int, int]:
+            await asyncio.sleep(max(0, start_time + offset - time.time()))
+            try:
+                response = await client.get(url)
+            except httpx.HTTPError:
+                return offset, time.time() - start_time - offset, 0, 0
+            latency = time.time() - start_time - offset
+            points = len(response.json()["prices"]) if response.status_code == 200 else 0
+            return offset, latency, response.status_code, points
+
+        return await asyncio.gather(*(send(offset) for offset in offsets))
+
+
+def run_client(url: str, offsets: list[float], start_time: float, results: multiprocessing.Queue):
+    """Send requests from a separate process and report their results."""
+    results.put(asyncio.run(send_requests(url, offsets, start_time)))
+
+
+def get_percentile(values: list[float], percentile: int) -> float:
+    """Get a percentile of values with the nearest rank method."""
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percentile - 1]
+
+
+def report(name: str, results: list[tuple[float, float, int, int]], duration: Optional[float]):
+    """Print the latency and throughput of requests."""
+    if not results:
+        print(f"{name}: no requests")
+        return
+    latencies = [latency * defaults.SEC_TO_MILLISEC for _, latency, _, _ in results]
+    failed = sum(1 for _, _, status, _ in results if status != 200)
+    throughput = f", {len(results) / duration:.0f} requests/s" if duration else ""
+    print(
+        f"{name}: {len(results)} requests{throughput}, p50 {get_percentile(latencies, 50):.1f}ms, "
+        f"p99 {get_percentile(latencies, 99):.1f}ms, max {max(latencies):.1f}ms, {failed} failed"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--region", type=Region, default=Region.DE)
+    parser.add_argument("--rate", type=float, default=100, help="Requests per second.")
+    parser.add_argument("--duration", type=float, default=90, help="Seconds to send requests.")
+    parser.add_argument("--publish-after", type=float, default=30, help="Seconds until new prices are published.")
+    parser.add_argument("--herd", type=int, default=100, help="Requests sent at once at publication.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the stand-in takes to respond.")
+    parser.add_argument("--failure-rate", type=float, default=0, help="Share of stand-in calls which fail.")
+    parser.add_argument("--failure-mode", choices=["error", "drop"], default="error")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes of the web app.")
+    parser.add_argument("--clients", type=int, default=1, help="Processes sending requests.")
+    parser.add_argument("--background", action="store_true", help="Refresh price data in the background.")
+    args = parser.parse_args()
+
+    seed_end = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE).floor("day").int_timestamp
+    stub = AwattarStub(seed_end - DAY, seed_end, args.latency, args.failure_rate, args.failure_mode)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+    request_path = f"/data/{args.region.value}"
+    with tempfile.TemporaryDirectory() as home:
+        config = prepare_home(Path(home), stub, args.background)
+        port = get_free_port()
+        server = start_server(Path(home), port, args.workers)
+        try:
+            wait_until_serving(port, request_path)
+            seed_points = (stub.seed_end - stub.seed_start) // HOUR
+
+            # Last update times have second precision, so publication is at a full second.
+            publish_time = math.ceil(time.time() + 1 + args.publish_after)
+            start_time = publish_time - args.publish_after
+            stub.publish_time = publish_time
+            set_cooldown_end(config, publish_time)
+            stub.reset()
+            offsets = [index / args.rate for index in range(int(args.duration * args.rate))]
+            herd_offsets = [args.publish_after] * args.herd
+            # Spread the requests over the clients, the herd is sent by the first one.
+            client_offsets = [offsets[index :: args.clients] for index in range(args.clients)]
+            client_offsets[0] = sorted(client_offsets[0] + herd_offsets)
+
+            results = multiprocessing.Queue()
+            url = f"http://127.0.0.1:{port}{request_path}"
+            processes = [
+                multiprocessing.Process(target=run_client, args=(url, offsets, start_time, results))
+                for offsets in client_offsets
+            ]
+            for process in processes:
+                process.start()
+            client_results = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+        finally:
+            server.terminate()
+            server.wait()
+        stub.shutdown()
+
+    # The herd requests are those at the publication offset beyond the steady rate.
+    all_results = sorted(result for results in client_results for result in results)
+    herd, steady = [], []
+    herd_remaining = args.herd
+    for result in all_results:
+        if herd_remaining and result[0] == args.publish_after:
+            herd.append(result)
+            herd_remaining -= 1
+        else:
+            steady.append(result)
+    before = [result for result in steady if result[0] < args.publish_after]
+    after = [result for result in steady if result[0] >= args.publish_after]
+
+    print(
+        f"{args.rate:.0f} requests/s to {request_path} for {args.duration:.0f}s, {args.herd} at once after "
+        f"{args.publish_after:.0f}s, {args.workers} worker(s), {os.cpu_count()} cpus."
+    )
+    print(f"Stand-in latency {args.latency:.2f}s, failure rate {args.failure_rate:.0%} ({args.failure_mode}).")
+    report("Before publication", before, args.publish_after)
+    report("Herd at publication", herd, None)
+    report("After publication", after, args.duration - args.publish_after)
+    report("All", all_results, args.duration)
+    calls = ", ".join(f"{count} {outcome}" for outcome, count in sorted(stub.calls.items())) or "none"
+    print(f"Upstream calls: {sum(stub.calls.values())} ({calls})")
+    new_offsets = [offset for offset, _, _, points in all_results if points > seed_points]
+    if new_offsets:
+        print(f"New prices first served {min(new_offsets) - args.publish_after:.1f}s after publication.")
+    else:
+        print("New prices were never served.")
+
+    # In the background requests never poll the stand-in, which is polled on a schedule instead.
+    if not args.background and args.failure_rate == 0 and sum(stub.calls.values()) != 1:
+        print("FAILED: The herd at publication should have caused exactly one upstream call.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
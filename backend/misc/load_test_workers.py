@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+"""Measure how the throughput of the web app scales with the number of worker processes.
+
+Call:
+
+    ./load_test_workers.py --workers 1 2 4 --duration 10
+
+to serve the web app with gunicorn using one, two and four workers in turn and request current price data with as
+many concurrent clients as there are cpus for ten seconds each.
+
+The web app runs with a temporary home directory holding a config with background refresh enabled and synthetic
+price data which isn't due for update before the day after tomorrow, so aWATTar is never contacted. This only
+works if there is no config at /etc/awattprice/config.ini, which would take precedence. Throughput can only scale
+as far as there are cpus which aren't busy with the clients.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory.
+"""
+import argparse
+import asyncio
+import http.client
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+import arrow
+
+from awattprice import configurator
+from awattprice import defaults
+from awattprice import prices
+from awattprice import store
+from awattprice.defaults import Region
+from awattprice.series import PriceSeries
+
+REQUEST_PATH = "/data/DE"
+
+
+def prepare_home(home: Path):
+    """Write a config, an empty database and synthetic price data into a home directory."""
+    config_path = home / ".config" / "awattprice" / "config.ini"
+    config_path.parent.mkdir(parents=True)
+    config_path.write_text(defaults.DEFAULT_CONFIG.replace("background = false", "background = true"))
+
+    os.environ["HOME"] = str(home)
+    config = configurator.get_config()
+    (config.paths.data_dir / defaults.DATABASE_FILE_NAME).touch()
+
+    start = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE).floor("day").int_timestamp
+    starts = range(start, start + 3 * 24 * 3600, 3600)
+    for region in Region:
+        data = PriceSeries.from_columns(
+            region, starts, (start + 3600 for start in starts), (50 + index % 24 for index in range(len(starts)))
+        )
+        asyncio.run(store.write_price_file(prices.get_price_data_file_path(region, config), data))
+        asyncio.run(prices.update_last_update_time(region, config))
+
+
+def get_free_port() -> int:
+    """Get a port on localhost which is currently free."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_serving(port: int, path: str = REQUEST_PATH, timeout: float = 30):
+    """Wait until the web app responds with price data."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", path)
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Web app didn't serve price data within {timeout}s.")
+
+
+def run_client(port: int, duration: float, results: multiprocessing.Queue):
+    """Request price data over a keep-alive connection for some time and report the number of responses."""
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    count = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        connection.request("GET", REQUEST_PATH)
+        response = connection.getresponse()
+        response.read()
+        if response.status == 200:
+            count += 1
+    connection.close()
+    results.put(count)
+
+
+def measure(home: Path, workers: int, clients: int, duration: float) -> float:
+    """Serve the web app with a number of workers and measure the responses per second."""
+    port = get_free_port()
+    environment = dict(os.environ, HOME=str(home))
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--workers",
+            str(workers),
+            "--worker-class",
+            "uvicorn.workers.UvicornWorker",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--log-level",
+            "warning",
+            "awattprice.api:create_app()",
+        ],
+        env=environment,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_until_serving(port)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=run_client, args=(port, duration, results)) for _ in range(clients)
+        ]
+        for process in processes:
+            process.start()
+        total = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+    finally:
+        server.terminate()
+        server.wait()
+    return total / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=os.cpu_count())
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        prepare_home(Path(home))
+        print(f"{args.clients} clients requesting {REQUEST_PATH} for {args.duration:.0f}s, {os.cpu_count()} cpus.")
+        baseline = None
+        for workers in args.workers:
+            throughput = measure(Path(home), workers, args.clients, args.duration)
+            if baseline is None:
+                baseline = throughput
+            print(f"{workers} worker(s): {throughput:.0f} requests/s ({throughput / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Migrate the base fees of tokens from decimal cent strings to fixed-point integer millicents.
+
+Databases created before base fees were stored as millicents hold them as strings in a text column. The token
+table is rebuilt with an integer column, so that base fees are compared with plain integer operations in SQL.
+Running the migration on a migrated database does nothing.
+
+Make sure your PYTHONPATH environment variable is set to the awattprice package directory. Stop the backend and
+back up the database before migrating.
+"""
+import sys
+
+from decimal import Decimal
+
+from loguru import logger
+from sqlalchemy import text
+
+from awattprice import configurator
+from awattprice import database
+from awattprice import defaults
+from awattprice import orm
+from awattprice import utils
+
+config = configurator.get_config()
+db_engine = database.get_awattprice_engine(config)
+token_table_name = defaults.ORM_TABLE_NAMES.token_table
+legacy_table_name = f"{token_table_name}_legacy"
+
+with db_engine.connect() as connection:
+    base_fee_type = database.get_base_fee_column_type(connection)
+    if base_fee_type is None:
+        logger.error(f"The {token_table_name} table has no base fee column.")
+        sys.exit(1)
+    if base_fee_type == "INTEGER":
+        logger.info("Base fees are stored as millicents already.")
+        sys.exit(0)
+    connection.commit()
+
+    # Keep the foreign keys of other tables pointing to the token table while it is renamed and rebuilt.
+    connection.execute(text("PRAGMA foreign_keys=OFF"))
+    connection.execute(text("PRAGMA legacy_alter_table=ON"))
+    connection.commit()
+    with connection.begin():
+        connection.execute(text(f"ALTER TABLE {token_table_name} RENAME TO {legacy_table_name}"))
+        orm.Token.__table__.create(bind=connection)
+        rows = connection.execute(
+            text(f"SELECT token_id, token, region, tax, base_fee FROM {legacy_table_name}")
+        ).mappings()
+        migrated_rows = [
+            {**row, "base_fee": utils.ctkwh_to_millicents(Decimal(str(row["base_fee"] or 0)))} for row in rows
+        ]
+        if migrated_rows:
+            connection.execute(
+                text(
+                    f"INSERT INTO {token_table_name} (token_id, token, region, tax, base_fee) "
+                    "VALUES (:token_id, :token, :region, :tax, :base_fee)"
+                ),
+                migrated_rows,
+            )
+        connection.execute(text(f"DROP TABLE {legacy_table_name}"))
+    connection.execute(text("PRAGMA legacy_alter_table=OFF"))
+    connection.execute(text("PRAGMA foreign_keys=ON"))
+    connection.commit()
+
+logger.info(f"Migrated the base fees of {len(migrated_rows)} token(s) to millicents.")
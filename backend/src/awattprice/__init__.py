@@ -1,8 +1,45 @@
-from . import configurator
-from . import database
-from . import defaults
-from . import exceptions
-from . import notifications
-from . import orm
-from . import prices
-from . import utils
+"""Backend of AWattPrice.
+
+Submodules are imported on first access, so that importing the package or one of its submodules doesn't import
+all of them.
+"""
+import importlib
+
+_SUBMODULES = (
+    "archive",
+    "below",
+    "breaker",
+    "cache",
+    "cheapest",
+    "configurator",
+    "database",
+    "defaults",
+    "exceptions",
+    "ingest",
+    "metrics",
+    "notifications",
+    "orm",
+    "prices",
+    "refresh",
+    "responses",
+    "scheduler",
+    "series",
+    "snapshot",
+    "store",
+    "tracing",
+    "upstream",
+    "utils",
+    "variants",
+    "wire",
+)
+
+
+def __getattr__(name: str):
+    """Import a submodule on its first access."""
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_SUBMODULES])
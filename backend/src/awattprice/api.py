@@ -1,69 +1,458 @@
-"""Define the urls and their tasks handled by the API."""
+"""Define the urls and their tasks handled by the API.
+
+The web app is created with `create_app`. Servers call it as factory, e.g.
+`gunicorn 'awattprice.api:create_app()'`.
+"""
+import asyncio
+import hmac
+import math
+import os
 import sys
+import time
 
+from contextlib import asynccontextmanager
+from decimal import Decimal
 from json import JSONDecodeError
-
-import arrow
+from typing import AsyncIterator
+from typing import Optional
 
 from box import Box
+from fastapi import APIRouter
+from fastapi import Depends
 from fastapi import FastAPI
 from fastapi import HTTPException
+from fastapi import Query
 from fastapi import Request
+from fastapi import Response
+from liteconfig import Config
 from loguru import logger
-from starlette.responses import RedirectResponse
 
+from awattprice import archive
+from awattprice import below
+from awattprice import cheapest
 from awattprice import configurator
 from awattprice import database
 from awattprice import defaults
+from awattprice import metrics
 from awattprice import notifications
 from awattprice import orm
 from awattprice import prices
+from awattprice import refresh
+from awattprice import responses
+from awattprice import tracing
+from awattprice import upstream
+from awattprice import utils
+from awattprice import variants
+from awattprice.cache import PriceDataCacheEntry
+from awattprice.defaults import PriceUnit
 from awattprice.defaults import Region
+from awattprice.exceptions import DatabaseNotMigratedError
+from awattprice.exceptions import ProfilerBusyError
+from awattprice.refresh import RefresherElection
+from awattprice.scheduler import PriceRefreshScheduler
+from awattprice.scheduler import SnapshotWatcher
+from awattprice.series import PriceSeries
+from awattprice.store import PriceFileError
+
+router = APIRouter()
+
+
+async def check_admin(request: Request):
+    """Check that a request is authorized with the admin token as bearer token.
+
+    :raises HTTPException: With status 401 if the request isn't authorized.
+    """
+    admin_token = request.app.state.config.admin.token
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), admin_token.encode()):
+        raise HTTPException(401)
+
+
+admin_router = APIRouter(prefix="/admin", dependencies=[Depends(check_admin)], include_in_schema=False)
+
+
+def create_app(config: Optional[Config] = None) -> FastAPI:
+    """Create the web app.
+
+    Nothing is opened when creating the app. The database engine, the upstream http client and the background
+    tasks are opened when the app starts and closed when it shuts down.
+
+    :param config: Config of the app. If not set it is read from the config file.
+    """
+    if config is None:
+        config = configurator.get_config()
+    configurator.configure_loguru(defaults.AWATTPRICE_SERVICE_NAME, config)
+
+    app = FastAPI()
+    app.state.config = config
+    app.include_router(router)
+    if config.metrics.enabled:
+        app.add_middleware(metrics.MetricsMiddleware)
+        app.add_api_route("/metrics", get_metrics, include_in_schema=False)
+    if config.admin.token:
+        app.add_middleware(tracing.TracingMiddleware, admin_token=config.admin.token, config=config)
+        app.include_router(admin_router)
+    app.router.lifespan_context = lifespan
+    return app
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Open the resources of the web app while it runs.
+
+    Price data is refreshed in the background if configured. With multiple worker processes only the elected one
+    refreshes. Every worker process watches for new versions of the price data published by other processes.
+
+    :raises FileNotFoundError: If the database doesn't exist. The app doesn't start then.
+    :raises DatabaseNotMigratedError: If the database stores base fees in the format of previous versions. The app
+        doesn't start then.
+    """
+    config = app.state.config
+    try:
+        database_engine = database.get_awattprice_engine(config, async_=True)
+    except FileNotFoundError as exc:
+        logger.exception(exc)
+        raise
+    try:
+        await database.check_migrated_async(database_engine)
+    except DatabaseNotMigratedError as exc:
+        logger.exception(exc)
+        await database_engine.dispose()
+        raise
+    orm.metadata.bind = database_engine
+    app.state.database_engine = database_engine
+
+    # Uncomment to create all database tables inside the database. An empty sqlite database must already exist and async_ must be set to false upon engine creation.
+    # orm.Base.metadata.create_all()
 
-config = configurator.get_config()
-configurator.configure_loguru(defaults.AWATTPRICE_SERVICE_NAME, config)
+    price_refresh_scheduler = PriceRefreshScheduler(config, list(Region))
+    refresher_election = RefresherElection(
+        config.paths.price_data_dir / defaults.REFRESHER_LOCK_FILE_NAME, price_refresh_scheduler.start
+    )
+    snapshot_watcher = SnapshotWatcher(config, list(Region))
+    event_loop_lag_monitor = metrics.EventLoopLagMonitor()
+
+    upstream.open_client(config)
+    if config.refresh.background:
+        refresher_election.start()
+    snapshot_watcher.start()
+    if config.metrics.enabled:
+        event_loop_lag_monitor.start()
+    try:
+        yield
+    finally:
+        await event_loop_lag_monitor.stop()
+        await snapshot_watcher.stop()
+        await price_refresh_scheduler.stop()
+        await refresher_election.stop()
+        await refresh.coordinator.wait()
+        await upstream.close_client()
+        await database_engine.dispose()
+
+
+async def get_current_price_entry(region: Region, config: Config) -> Optional[PriceDataCacheEntry]:
+    """Get the cache entry with the current price data of a region.
+
+    Requests only refresh the price data themselves if it isn't refreshed in the background. Price data which is
+    due is served right away while it is refreshed, unless it is due for longer than the configured maximal
+    staleness.
+    """
+    return await prices.get_current_cache_entry(
+        region,
+        config,
+        fall_back=True,
+        refresh=not config.refresh.background,
+        max_staleness=config.refresh.max_staleness,
+    )
 
-try:
-    database_engine = database.get_awattprice_engine(config, async_=True)
-except FileNotFoundError as exc:
-    logger.exception(exc)
-    sys.exit(1)
-orm.metadata.bind = database_engine
 
-# Uncomment to create all database tables inside the database. An empty sqlite database must already exist and async_ must be set to false upon engine creation. 
-# orm.Base.metadata.create_all()
+def get_resolution(resolution: Optional[int], config: Config) -> int:
+    """Get the resolution in seconds to which price data is aggregated for a request. 0 if it isn't aggregated.
 
-app = FastAPI()
+    :param resolution: Resolution requested by the client. If not set the configured default is used.
+    :raises HTTPException: With status 400 if the requested resolution is negative.
+    """
+    if resolution is None:
+        return config.responses.default_resolution
+    if resolution < 0:
+        raise HTTPException(400)
+    return resolution
+
+
+def get_response_format(request: Request) -> responses.ResponseFormat:
+    """Negotiate the format of a price data response with the Accept and Accept-Encoding request headers.
+
+    :raises HTTPException: With status 406 if the client accepts none of the offered media types.
+    """
+    response_format = responses.negotiate_format(
+        request.headers.get("accept"), request.headers.get("accept-encoding")
+    )
+    if response_format is None:
+        raise HTTPException(406)
+    return response_format
 
 
 @logger.catch
-@app.get("/data/{region}")
-async def get_region_data(region: Region):
-    """Get current price data for specified region."""
-    price_data = await prices.get_current_prices(region, config, fall_back=True)
+@router.get("/data/{region}")
+async def get_region_data(
+    region: Region,
+    request: Request,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    since: Optional[int] = None,
+    tax: bool = False,
+    base_fee: float = 0,
+    unit: PriceUnit = PriceUnit.EUR_MWH,
+    resolution: Optional[int] = None,
+):
+    """Get current price data for specified region. See `build_region_data_response` for the parameters."""
+    return await build_region_data_response(region, request, start, end, since, tax, base_fee, unit, resolution)
+
+
+@logger.catch
+@router.get("/data/")
+async def get_default_region_data(
+    request: Request,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    since: Optional[int] = None,
+    tax: bool = False,
+    base_fee: float = 0,
+    unit: PriceUnit = PriceUnit.EUR_MWH,
+    resolution: Optional[int] = None,
+):
+    """Get current price data for default region. See `build_region_data_response` for the parameters."""
+    return await build_region_data_response(
+        defaults.DEFAULT_REGION, request, start, end, since, tax, base_fee, unit, resolution
+    )
+
+
+async def build_region_data_response(
+    region: Region,
+    request: Request,
+    start: Optional[int],
+    end: Optional[int],
+    since: Optional[int],
+    tax: bool,
+    base_fee: float,
+    unit: PriceUnit,
+    resolution: Optional[int],
+) -> Response:
+    """Build the response with the current price data of a region.
+
+    The response is rendered once per data version and response format. Clients can revalidate it with its ETag.
+    The media type and compression are negotiated with the Accept and Accept-Encoding request headers.
+
+    :param start, end: If one or both are set, respond with the archived price data overlapping this time
+        range instead. Both are epoch seconds and the end is exclusive. A missing start or end leaves the range
+        open on that side.
+    :param since: If set, only respond with the current price points starting at or after this epoch second.
+        Clients pass the end timestamp of the latest price point they hold. Responds with 304 if there is none.
+    :param tax, base_fee, unit: If set respond with the final consumer prices in place of the market prices. The
+        prices are taxed if tax is set. The base fee is given as cent per kWh with up to three decimal places and
+        added to each price. Prices as cent per kWh are rounded before adding the base fee.
+    :param resolution: If set respond with price points shorter than this many seconds averaged into periods of
+        it, e.g. 3600 for hourly prices. 0 responds with the price points as received from aWATTar. If not set the
+        configured default resolution is used.
+    """
+    if since is not None and (start is not None or end is not None):
+        raise HTTPException(400)
+    if not math.isfinite(base_fee):
+        raise HTTPException(400)
+    base_fee = utils.ctkwh_to_millicents(Decimal(str(base_fee)))
+    personalized = variants.check_personalized(tax, base_fee, unit)
+    resolution = get_resolution(resolution, request.app.state.config)
+    response_format = get_response_format(request)
+    if start is not None or end is not None:
+        price_data = get_archived_region_data(region, request.app.state.config, start, end)
+        if resolution:
+            price_data = price_data.aggregate(resolution)
+        if personalized:
+            price_data = variants.personalize(price_data, tax, base_fee, unit)
+        return responses.build_price_range_response(
+            price_data, request.headers.get("if-none-match"), response_format
+        )
+
+    price_entry = await get_current_price_entry(region, request.app.state.config)
 
-    if price_data is None:
+    if price_entry is None:
         logger.warning(f"Couldn't get current price data for region {region.name}.")
         raise HTTPException(503)
 
-    response_price_data = prices.parse_to_response_data(price_data)
+    if resolution:
+        price_entry = variants.get_aggregated(price_entry, resolution)
+    if personalized:
+        price_entry = variants.cache.get(price_entry, tax, base_fee, unit, resolution)
 
-    return response_price_data
+    if_none_match = request.headers.get("if-none-match")
+    if since is not None:
+        response = responses.build_price_data_since_response(price_entry, since, if_none_match, response_format)
+    else:
+        response = responses.build_price_data_response(price_entry, if_none_match, response_format)
+    if personalized:
+        variants.cache.trim()
+    return response
 
 
 @logger.catch
-@app.get("/data/")
-async def get_default_region_data():
-    """Get current price data for default region.
+@router.get("/data/{region}/cheapest")
+async def get_cheapest_window(
+    region: Region,
+    request: Request,
+    duration: int = Query(..., gt=0),
+    energy: float = Query(..., gt=0),
+    tax: bool = False,
+    base_fee: float = 0,
+):
+    """Get the window in the current price data of a region in which consuming energy is cheapest.
 
-    This will respond with an temporary redirect to the data price site of the default region.
+    :param duration: Duration of the consumption in minutes.
+    :param energy: Energy consumed over the duration in kWh.
+    :param tax: If set use taxed prices.
+    :param base_fee: Fee as cent per kWh added to each price.
     """
-    region = Region.DE
-    return RedirectResponse(url=f"/data/{region.value}")
+    if not math.isfinite(energy) or not math.isfinite(base_fee):
+        raise HTTPException(400)
+
+    price_entry = await get_current_price_entry(region, request.app.state.config)
+    if price_entry is None:
+        logger.warning(f"Couldn't get current price data for region {region.name}.")
+        raise HTTPException(503)
+
+    finder = cheapest.get_finder(price_entry)
+    earliest_start = cheapest.get_earliest_start(time.time())
+    window = finder.find(
+        duration * defaults.MINUTE_TO_SEC, Decimal(str(energy)), earliest_start, tax, Decimal(str(base_fee))
+    )
+    if window is None:
+        raise HTTPException(404)
+
+    return cheapest.parse_to_response_data(window)
+
+
+@logger.catch
+@router.get("/data/{region}/below")
+async def get_runs_below(region: Region, request: Request, value: float, tax: bool = False, base_fee: float = 0):
+    """Get all runs of contiguous price points in the current price data on or below a value.
+
+    :param value: Value as cent per kWh.
+    :param tax: If set compare taxed prices.
+    :param base_fee: Fee as cent per kWh added to each price before comparing.
+    """
+    if not math.isfinite(value) or not math.isfinite(base_fee):
+        raise HTTPException(400)
+
+    price_entry = await get_current_price_entry(region, request.app.state.config)
+    if price_entry is None:
+        logger.warning(f"Couldn't get current price data for region {region.name}.")
+        raise HTTPException(503)
+
+    finder = below.get_finder(price_entry)
+    runs = finder.find(Decimal(str(value)), tax, Decimal(str(base_fee)))
+
+    return below.parse_to_response_data(runs)
+
+
+def get_archived_region_data(
+    region: Region, config: Config, start: Optional[int], end: Optional[int]
+) -> PriceSeries:
+    """Get the archived price data of a region which overlaps a time range."""
+    if start is None:
+        start = 0
+    if end is None:
+        end = sys.maxsize
+    if start >= end:
+        raise HTTPException(400)
+
+    try:
+        price_data = archive.query_range(region, config, start, end)
+    except PriceFileError as exc:
+        logger.exception(f"Couldn't read price archive of region {region.name}: {exc}.")
+        raise HTTPException(500)
+
+    return price_data
+
+
+@logger.catch
+@router.get("/data")
+async def get_regions_data(request: Request, regions: Optional[str] = None, resolution: Optional[int] = None):
+    """Get current price data for multiple regions in one response.
+
+    The price data of all regions is fetched concurrently. Regions with up to date price data are served from
+    their rendered responses.
+
+    :param regions: Comma separated region values, e.g. 'DE,AT'. If not set all regions are included.
+    :param resolution: Resolution in seconds to aggregate the price data to like for single regions.
+    """
+    if regions is None:
+        selected_regions = list(Region)
+    else:
+        try:
+            selected_regions = list(dict.fromkeys(Region(value.strip()) for value in regions.split(",")))
+        except ValueError:
+            raise HTTPException(400)
+
+    config = request.app.state.config
+    resolution = get_resolution(resolution, config)
+    price_entries = await asyncio.gather(*(get_current_price_entry(region, config) for region in selected_regions))
+    if all(price_entry is None for price_entry in price_entries):
+        logger.warning(f"Couldn't get current price data for any of the regions {regions}.")
+        raise HTTPException(503)
+    if resolution:
+        price_entries = [
+            None if price_entry is None else variants.get_aggregated(price_entry, resolution)
+            for price_entry in price_entries
+        ]
+
+    return responses.build_batch_price_data_response(
+        dict(zip(selected_regions, price_entries)), request.headers.get("if-none-match")
+    )
+
+
+async def get_metrics():
+    """Get the metrics of this process in the Prometheus text format. Only served if metrics are enabled."""
+    return Response(metrics.registry.render(), media_type=metrics.MEDIA_TYPE)
+
+
+@admin_router.get("/tracing")
+async def get_tracing(request: Request):
+    """Get the share of requests traced by all worker processes."""
+    return {"sample_rate": tracing.get_sample_rate(request.app.state.config)}
+
+
+@admin_router.put("/tracing")
+async def set_tracing(request: Request, sample_rate: float = Query(..., ge=0, le=1)):
+    """Set the share of requests traced by all worker processes.
+
+    The sample rate applies until it is set again, also across restarts. Requests are always traced if their
+    trace header holds the admin token.
+    """
+    config = request.app.state.config
+    tracing.set_sample_rate(sample_rate, config)
+    return {"sample_rate": tracing.get_sample_rate(config)}
+
+
+@admin_router.get("/profile")
+async def get_profile(duration: float = Query(..., gt=0, le=defaults.PROFILE_MAX_DURATION)):
+    """Profile this process for some seconds and download the profile.
+
+    The profile can be loaded with pstats or viewers like snakeviz. Only the worker process handling this request
+    is profiled.
+    """
+    try:
+        profile = await tracing.profile(duration)
+    except ProfilerBusyError:
+        raise HTTPException(409)
+    file_name = f"awattprice-{os.getpid()}-{int(time.time())}.prof"
+    return Response(
+        profile,
+        media_type="application/octet-stream",
+        headers={"content-disposition": f'attachment; filename="{file_name}"'},
+    )
 
 
 @logger.catch
-@app.post("/notifications/save_configuration/")
+@router.post("/notifications/save_configuration/")
 async def handle_notification_configuration(request: Request):
     """Runs one or multiple notification setting update tasks for a token."""
     try:
@@ -79,4 +468,4 @@ async def handle_notification_configuration(request: Request):
     if configuration is None:
         raise HTTPException(400)
 
-    await notifications.save_notification_configuration(database_engine, configuration)
+    await notifications.save_notification_configuration(request.app.state.database_engine, configuration)
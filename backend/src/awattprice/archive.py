@@ -0,0 +1,286 @@
+"""Archive all downloaded price data so that past prices can be queried by time range.
+
+The archive of a region is split into partitions, one per calendar month (UTC) in which its price points start.
+Each partition is a price data file (see the store module) holding its points sorted by start timestamp.
+Partitions of completed months are compressed. Downloads are merged into the archive by start timestamp: points
+which aren't archived yet are added, archived points are never changed.
+
+The partitions of a region form a sparse index. The start of each partition is known from its file name and
+points inside of a partition are found with a binary search. A range query thus only reads the partitions which
+overlap the range and only copies the points inside of it.
+"""
+import bisect
+import calendar
+import gzip
+
+from array import array
+from datetime import datetime
+from datetime import timezone
+from pathlib import Path
+from typing import Optional
+
+from liteconfig import Config
+from loguru import logger
+
+from awattprice import cache
+from awattprice import defaults
+from awattprice import store
+from awattprice.cache import FileSignature
+from awattprice.defaults import Region
+from awattprice.series import PRICE_TYPECODE
+from awattprice.series import TIMESTAMP_TYPECODE
+from awattprice.series import PriceSeries
+from awattprice.store import PriceFileError
+
+
+class Partition:
+    """Archive file holding the price points which start within one month."""
+
+    start: int
+    end: int
+    path: Path
+
+    def __init__(self, start: int, end: int, path: Path):
+        """Constructor for a new partition.
+
+        :param start, end: Epoch seconds of the start and end of the month of the partition.
+        """
+        self.start = start
+        self.end = end
+        self.path = path
+
+    @property
+    def is_compressed(self) -> bool:
+        return self.path.name.endswith(defaults.PRICE_ARCHIVE_COMPRESSED_SUFFIX)
+
+
+class PartitionIndex:
+    """Sorted partitions of a region together with the signature of the dir they were listed from."""
+
+    signature: Optional[FileSignature]
+    partitions: list[Partition]
+    starts: list[int]
+
+    def __init__(self, signature: Optional[FileSignature], partitions: list[Partition]):
+        self.signature = signature
+        self.partitions = sorted(partitions, key=lambda partition: partition.start)
+        self.starts = [partition.start for partition in self.partitions]
+
+
+_indexes: dict[Region, PartitionIndex] = {}
+# Price data of read partitions by their path together with the signature of the file it was read from.
+_partition_data: dict[Path, tuple[Optional[FileSignature], PriceSeries]] = {}
+
+
+def get_archive_dir(region: Region, config: Config) -> Path:
+    """Get the dir which holds the partitions of the archive of a region."""
+    return config.paths.price_archive_dir / region.value.lower()
+
+
+def get_partition_bounds(timestamp: int) -> tuple[int, int]:
+    """Get the start and end in epoch seconds of the partition which holds points starting at the timestamp."""
+    time = datetime.fromtimestamp(timestamp, timezone.utc)
+    start = calendar.timegm((time.year, time.month, 1, 0, 0, 0))
+    if time.month == 12:
+        end = calendar.timegm((time.year + 1, 1, 1, 0, 0, 0))
+    else:
+        end = calendar.timegm((time.year, time.month + 1, 1, 0, 0, 0))
+    return start, end
+
+
+def get_partition_path(region: Region, config: Config, partition_start: int, compressed: bool) -> Path:
+    """Get the path of the file of the partition starting at the timestamp."""
+    month = datetime.fromtimestamp(partition_start, timezone.utc).strftime("%Y-%m")
+    file_name = defaults.PRICE_ARCHIVE_PARTITION_FILE_NAME.format(month)
+    if compressed:
+        file_name += defaults.PRICE_ARCHIVE_COMPRESSED_SUFFIX
+    return get_archive_dir(region, config) / file_name
+
+
+def parse_partition_path(path: Path) -> Optional[Partition]:
+    """Get the partition stored at a path from its file name.
+
+    :returns None: If the path is no partition file.
+    """
+    file_name = path.name.removesuffix(defaults.PRICE_ARCHIVE_COMPRESSED_SUFFIX)
+    month, _, _ = file_name.partition(".")
+    if defaults.PRICE_ARCHIVE_PARTITION_FILE_NAME.format(month) != file_name:
+        return None
+    try:
+        month_start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    start, end = get_partition_bounds(int(month_start.timestamp()))
+    return Partition(start, end, path)
+
+
+def get_partition_index(region: Region, config: Config) -> PartitionIndex:
+    """Get the partitions of a region. They are only listed again if the archive dir changed."""
+    archive_dir = get_archive_dir(region, config)
+    signature = cache.get_file_signature(archive_dir)
+    index = _indexes.get(region)
+    if index is not None and index.signature == signature:
+        return index
+
+    partitions: dict[int, Partition] = {}
+    if signature is not None:
+        for path in archive_dir.iterdir():
+            partition = parse_partition_path(path)
+            if partition is None:
+                continue
+            # While a partition is compressed both files exist for a moment. They hold the same points.
+            if partition.start not in partitions or partition.is_compressed:
+                partitions[partition.start] = partition
+    index = PartitionIndex(signature, list(partitions.values()))
+    _indexes[region] = index
+    return index
+
+
+def read_partition(partition: Partition) -> Optional[PriceSeries]:
+    """Read the price points of a partition. They are only read again if its file changed.
+
+    :returns None: If the partition file doesn't exist (anymore).
+    :raises PriceFileError: If the partition file isn't a valid price data file.
+    """
+    signature = cache.get_file_signature(partition.path)
+    cached = _partition_data.get(partition.path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    if signature is None:
+        _partition_data.pop(partition.path, None)
+        return None
+
+    if partition.is_compressed:
+        try:
+            contents = gzip.decompress(partition.path.read_bytes())
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError) as exc:
+            raise PriceFileError(f"Archive partition {partition.path} can't be decompressed: {exc}.") from exc
+        stored_data = store.unpack_price_file(contents)
+    else:
+        stored_data = store.read_price_file(partition.path)
+        if stored_data is None:
+            return None
+    _partition_data[partition.path] = (signature, stored_data.data)
+    return stored_data.data
+
+
+def merge_points(archived: Optional[PriceSeries], new: PriceSeries, indices: list[int]) -> Optional[PriceSeries]:
+    """Merge new price points into the archived points of a partition.
+
+    :param indices: Indices of the new points which belong to the partition.
+    :returns: All points of the partition sorted by start timestamp.
+    :returns None: If all new points are archived already.
+    """
+    if archived is not None:
+        archived_starts = set(archived.start_timestamps)
+    else:
+        archived_starts = set()
+    added_indices = [index for index in indices if new.start_timestamps[index] not in archived_starts]
+    if len(added_indices) == 0:
+        return None
+
+    rows = [(new.start_timestamps[i], new.end_timestamps[i], new.marketprices[i]) for i in added_indices]
+    if archived is not None:
+        rows.extend(zip(archived.start_timestamps, archived.end_timestamps, archived.marketprices))
+    rows.sort(key=lambda row: row[0])
+    return PriceSeries.from_columns(
+        new.region,
+        (row[0] for row in rows),
+        (row[1] for row in rows),
+        (row[2] for row in rows),
+    )
+
+
+def check_partition_completed(partition_end: int, now: int) -> bool:
+    """Check if a partition won't receive new points anymore because its month lies in the past."""
+    current_partition_start, _ = get_partition_bounds(now)
+    return partition_end <= current_partition_start
+
+
+async def write_partition(
+    region: Region, config: Config, partition_start: int, data: PriceSeries, compressed: bool
+):
+    """Write the points of a partition, replacing its file. A file of the other compression state is removed."""
+    path = get_partition_path(region, config, partition_start, compressed)
+    contents = store.pack_price_file(data)
+    if compressed:
+        contents = gzip.compress(contents, compresslevel=defaults.PRICE_ARCHIVE_COMPRESSION_LEVEL, mtime=0)
+    await store.write_file_atomically(path, contents)
+    get_partition_path(region, config, partition_start, not compressed).unlink(missing_ok=True)
+
+
+async def compress_completed_partitions(region: Region, config: Config, now: int):
+    """Compress all uncompressed partitions of months which lie in the past."""
+    for partition in get_partition_index(region, config).partitions:
+        if partition.is_compressed or not check_partition_completed(partition.end, now):
+            continue
+        data = read_partition(partition)
+        if data is None:
+            continue
+        logger.debug(f"Compressing archive partition {partition.path}.")
+        await write_partition(region, config, partition.start, data, compressed=True)
+
+
+async def merge_data(data: PriceSeries, config: Config, now: int):
+    """Merge downloaded price data into the archive of its region.
+
+    Must be called while holding the refresh lock of the region.
+
+    :param now: Current epoch seconds. Decides which partitions are completed and get compressed.
+    """
+    region = data.region
+    get_archive_dir(region, config).mkdir(exist_ok=True)
+
+    partition_indices: dict[int, list[int]] = {}
+    for index, start_timestamp in enumerate(data.start_timestamps):
+        partition_start, _ = get_partition_bounds(start_timestamp)
+        partition_indices.setdefault(partition_start, []).append(index)
+
+    index = get_partition_index(region, config)
+    for partition_start, indices in partition_indices.items():
+        position = bisect.bisect_left(index.starts, partition_start)
+        if position < len(index.starts) and index.starts[position] == partition_start:
+            archived = read_partition(index.partitions[position])
+        else:
+            archived = None
+        merged = merge_points(archived, data, indices)
+        if merged is None:
+            continue
+        _, partition_end = get_partition_bounds(partition_start)
+        compressed = check_partition_completed(partition_end, now)
+        logger.debug(f"Archiving {len(merged) - len(archived or ())} new {region.name} price points.")
+        await write_partition(region, config, partition_start, merged, compressed)
+
+    await compress_completed_partitions(region, config, now)
+
+
+def query_range(region: Region, config: Config, start: int, end: int) -> PriceSeries:
+    """Get all archived price points of a region which overlap a time range.
+
+    :param start, end: Epoch seconds. The end is exclusive.
+    """
+    start_timestamps = array(TIMESTAMP_TYPECODE)
+    end_timestamps = array(TIMESTAMP_TYPECODE)
+    marketprices = array(PRICE_TYPECODE)
+
+    index = get_partition_index(region, config)
+    # Points are stored in the partition in which they start, so the partition holding the range start may
+    # hold points overlapping it.
+    first = max(bisect.bisect_right(index.starts, start) - 1, 0)
+    last = bisect.bisect_left(index.starts, end)
+    for partition in index.partitions[first:last]:
+        data = read_partition(partition)
+        if data is None:
+            continue
+        # Points don't overlap, so both their start and end timestamps are sorted.
+        low = bisect.bisect_right(data.end_timestamps, start)
+        high = bisect.bisect_left(data.start_timestamps, end)
+        if low >= high:
+            continue
+        start_timestamps.extend(data.start_timestamps[low:high])
+        end_timestamps.extend(data.end_timestamps[low:high])
+        marketprices.extend(data.marketprices[low:high])
+
+    return PriceSeries(region, start_timestamps, end_timestamps, marketprices)
@@ -0,0 +1,141 @@
+"""Find the runs of contiguous price points whose prices are on or below a value.
+
+Prices are compared the way the price below notification service compares them: converted to cent per kWh,
+optionally taxed, rounded and with the base fee added. They are compared as fixed-point millicents. The runs are
+collected in a single pass over the price points sorted by start timestamp. A gap in the price data ends a run.
+
+Runs depend on the data version, the tax option and the value minus the base fee. Found runs are cached per data
+version for a limited number of values.
+"""
+from decimal import ROUND_FLOOR
+from decimal import Decimal
+from typing import Optional
+
+from awattprice import defaults
+from awattprice.cache import PriceDataCacheEntry
+from awattprice.series import PriceSeries
+
+
+class PriceRun:
+    """Contiguous price points whose prices are all on or below a value."""
+
+    start_timestamp: int
+    end_timestamp: int
+    point_count: int
+
+    def __init__(self, start_timestamp: int, end_timestamp: int, point_count: int):
+        self.start_timestamp = start_timestamp
+        self.end_timestamp = end_timestamp
+        self.point_count = point_count
+
+    @property
+    def duration(self) -> int:
+        """Duration of the run in seconds."""
+        return self.end_timestamp - self.start_timestamp
+
+
+class PriceRuns:
+    """All runs on or below a value together with the longest one."""
+
+    runs: list[PriceRun]
+    longest: Optional[PriceRun]
+
+    def __init__(self, runs: list[PriceRun]):
+        """Constructor for new price runs.
+
+        :param runs: Runs sorted by their start. The longest run is the earliest of the runs with the longest
+            duration.
+        """
+        self.runs = runs
+        self.longest = None
+        for run in runs:
+            if self.longest is None or run.duration > self.longest.duration:
+                self.longest = run
+
+
+def find_runs(data: PriceSeries, prices: list[int], limit: int) -> PriceRuns:
+    """Find all runs of price points with prices on or below a limit.
+
+    :param prices: Price of each price point in the same order as the points of the price data.
+    """
+    runs = []
+    run_start = None
+    run_end = None
+    point_count = 0
+    for index in sorted(range(len(data)), key=data.start_timestamps.__getitem__):
+        start_timestamp = data.start_timestamps[index]
+        if run_start is not None and (prices[index] > limit or start_timestamp != run_end):
+            runs.append(PriceRun(run_start, run_end, point_count))
+            run_start = None
+        if prices[index] > limit:
+            continue
+        if run_start is None:
+            run_start = start_timestamp
+            point_count = 0
+        run_end = data.end_timestamps[index]
+        point_count += 1
+    if run_start is not None:
+        runs.append(PriceRun(run_start, run_end, point_count))
+    return PriceRuns(runs)
+
+
+class PriceRunFinder:
+    """Find runs on or below values in the price data of one data version."""
+
+    data: PriceSeries
+
+    # Rounded cent per kWh prices as millicents for each tax option.
+    _ct_kwh_prices: dict[bool, list[int]]
+    # Found runs by tax option and limit as millicents in the order they were found.
+    _runs: dict[tuple[bool, int], PriceRuns]
+
+    def __init__(self, data: PriceSeries):
+        self.data = data
+        self._ct_kwh_prices = {}
+        self._runs = {}
+
+    def get_ct_kwh_prices(self, taxed: bool) -> list[int]:
+        """Get the rounded prices as cent per kWh in millicents.
+
+        They are only converted once for each tax option.
+        """
+        if taxed not in self._ct_kwh_prices:
+            self._ct_kwh_prices[taxed] = self.data.ct_kwh_millicents(taxed)
+        return self._ct_kwh_prices[taxed]
+
+    def find(self, value: Decimal, taxed: bool = False, base_fee: Decimal = Decimal(0)) -> PriceRuns:
+        """Find all runs of price points whose prices are on or below a value.
+
+        :param value: Value as cent per kWh.
+        :param taxed: If set compare taxed prices. This doesn't affect the value.
+        :param base_fee: Fee as cent per kWh added to each price before comparing.
+        """
+        # Prices are whole millicents, so they are on or below the limit exactly if they are on or below its floor.
+        limit = int(((value - base_fee) * defaults.MILLICENTS_PER_CENT).to_integral_value(ROUND_FLOOR))
+        key = (taxed, limit)
+        runs = self._runs.get(key)
+        if runs is None:
+            runs = find_runs(self.data, self.get_ct_kwh_prices(taxed), limit)
+            if len(self._runs) >= defaults.BELOW_RUNS_CACHE_SIZE:
+                del self._runs[next(iter(self._runs))]
+            self._runs[key] = runs
+        return runs
+
+
+def get_finder(entry: PriceDataCacheEntry) -> PriceRunFinder:
+    """Get the price run finder of a cache entry. It is only created on first access."""
+    return entry.get_derived("price_run_finder", lambda: PriceRunFinder(entry.data))
+
+
+def parse_run_to_response_data(run: PriceRun) -> dict:
+    """Transform a run to the format in which it is sent in a response."""
+    return {"start_timestamp": run.start_timestamp, "end_timestamp": run.end_timestamp}
+
+
+def parse_to_response_data(runs: PriceRuns) -> dict:
+    """Transform runs to the format in which they are sent in a response."""
+    if runs.longest is not None:
+        longest = parse_run_to_response_data(runs.longest)
+    else:
+        longest = None
+    return {"runs": [parse_run_to_response_data(run) for run in runs.runs], "longest": longest}
@@ -0,0 +1,203 @@
+"""Stop downloading from aWATTar for a while when it keeps failing, so that requests are answered with the stored
+price data right away instead of sitting through retries.
+
+Downloads of each region pass a circuit breaker. While it is closed downloads are attempted and retried as usual.
+After a number of consecutive failed attempts it opens. While open no downloads are attempted and stored price data
+is served as it is. Once it was open for some time it is half-open: downloads are attempted again as probes with a
+single attempt each. A failed probe opens the circuit again, enough successful probes in a row close it.
+
+The state of the circuits is shared by all processes through a small memory-mapped file, like the generations of
+the price data. It is only changed by downloads, which hold the refresh lock of their region, so the circuit of a
+region is never changed concurrently and only one probe runs at a time. A torn read at worst causes a single
+needless download or short circuit.
+"""
+import enum
+import mmap
+import os
+import struct
+import time
+
+from pathlib import Path
+
+from liteconfig import Config
+from loguru import logger
+from tenacity import RetryCallState
+
+from awattprice import defaults
+from awattprice import metrics
+from awattprice.defaults import Region
+
+# State, consecutive failed attempts, consecutive successful probes and time the circuit opened as epoch seconds.
+CIRCUIT_STRUCT = struct.Struct("<BIId")
+BOARD_SIZE = len(Region) * CIRCUIT_STRUCT.size
+
+
+class CircuitState(enum.IntEnum):
+    """States of a circuit breaker. The values are exposed as metric."""
+
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitBoard:
+    """Circuits of the downloads of all regions in a memory-mapped file."""
+
+    path: Path
+
+    _mapping: mmap.mmap
+
+    def __init__(self, path: Path):
+        """Open a circuit board, creating its file if it doesn't exist yet. New circuits are closed."""
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Growing the file fills it with zeros. Concurrent processes growing it to the same size is harmless.
+            if os.fstat(fd).st_size < BOARD_SIZE:
+                os.ftruncate(fd, BOARD_SIZE)
+            self._mapping = mmap.mmap(fd, BOARD_SIZE, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def get_offset(region: Region) -> int:
+        """Get the offset of the circuit of a region."""
+        return list(Region).index(region) * CIRCUIT_STRUCT.size
+
+    def read(self, region: Region) -> tuple[CircuitState, int, int, float]:
+        """Read the stored state, failed attempts, successful probes and open time of the circuit of a region."""
+        state, failures, probes, opened_at = CIRCUIT_STRUCT.unpack_from(self._mapping, self.get_offset(region))
+        return CircuitState(state), failures, probes, opened_at
+
+    def write(self, region: Region, state: CircuitState, failures: int, probes: int, opened_at: float):
+        """Store the circuit of a region.
+
+        Must be called while holding the refresh lock of the region.
+        """
+        CIRCUIT_STRUCT.pack_into(self._mapping, self.get_offset(region), state, failures, probes, opened_at)
+
+
+class CircuitBreaker:
+    """Circuit breaker of the downloads of a region."""
+
+    region: Region
+    board: CircuitBoard
+    failure_threshold: int
+    open_duration: float
+    half_open_probes: int
+
+    def __init__(
+        self,
+        region: Region,
+        board: CircuitBoard,
+        failure_threshold: int,
+        open_duration: float,
+        half_open_probes: int,
+    ):
+        """Constructor for a new circuit breaker.
+
+        :param failure_threshold: Consecutive failed download attempts after which the circuit opens.
+        :param open_duration: Seconds the circuit stays open before it is half-open.
+        :param half_open_probes: Consecutive successful probes after which a half-open circuit closes.
+        """
+        self.region = region
+        self.board = board
+        self.failure_threshold = failure_threshold
+        self.open_duration = open_duration
+        self.half_open_probes = half_open_probes
+
+    @property
+    def state(self) -> CircuitState:
+        """Current state of the circuit. An open circuit is half-open once it was open long enough."""
+        state, _, _, opened_at = self.board.read(self.region)
+        if state == CircuitState.OPEN and time.time() - opened_at >= self.open_duration:
+            state = CircuitState.HALF_OPEN
+        metrics.upstream_circuit_state.set(state, self.region.name)
+        return state
+
+    @property
+    def is_open(self) -> bool:
+        """Check if downloads are short circuited."""
+        return self.state == CircuitState.OPEN
+
+    def check_download(self) -> bool:
+        """Check if a download may be attempted. If the circuit is half-open the download is a probe.
+
+        Must be called while holding the refresh lock of the region.
+        """
+        state = self.state
+        stored_state, failures, _, _ = self.board.read(self.region)
+        if state == CircuitState.HALF_OPEN and stored_state == CircuitState.OPEN:
+            self._transition(CircuitState.HALF_OPEN, failures, 0, 0)
+        return state != CircuitState.OPEN
+
+    def stop_if_open(self, retry_state: RetryCallState) -> bool:
+        """Stop strategy which stops retrying a download once the circuit is open."""
+        return self.is_open
+
+    def record_success(self):
+        """Record a successful download attempt.
+
+        Must be called while holding the refresh lock of the region.
+        """
+        state, failures, probes, _ = self.board.read(self.region)
+        if state == CircuitState.CLOSED:
+            if failures != 0:
+                self.board.write(self.region, CircuitState.CLOSED, 0, 0, 0)
+            return
+        probes += 1
+        if probes >= self.half_open_probes:
+            self._transition(CircuitState.CLOSED, 0, 0, 0)
+        else:
+            self.board.write(self.region, CircuitState.HALF_OPEN, 0, probes, 0)
+
+    def record_failure(self):
+        """Record a failed download attempt. It opens the circuit if it is half-open or failed often enough.
+
+        Must be called while holding the refresh lock of the region.
+        """
+        state, failures, _, _ = self.board.read(self.region)
+        failures += 1
+        if state == CircuitState.CLOSED and failures < self.failure_threshold:
+            self.board.write(self.region, CircuitState.CLOSED, failures, 0, 0)
+            return
+        self._transition(CircuitState.OPEN, failures, 0, time.time())
+
+    def _transition(self, state: CircuitState, failures: int, probes: int, opened_at: float):
+        self.board.write(self.region, state, failures, probes, opened_at)
+        metrics.upstream_circuit_state.set(state, self.region.name)
+        metrics.upstream_circuit_transitions.inc(self.region.name, state.name.lower())
+        if state == CircuitState.OPEN:
+            logger.warning(
+                f"Opened the circuit of {self.region.name} downloads after {failures} consecutive failed "
+                f"attempts. Serving stored price data for {self.open_duration}s."
+            )
+        elif state == CircuitState.HALF_OPEN:
+            logger.info(f"Circuit of {self.region.name} downloads is half-open. Probing aWATTar.")
+        else:
+            logger.info(f"Closed the circuit of {self.region.name} downloads.")
+
+
+_boards: dict[Path, CircuitBoard] = {}
+
+
+def get_board(config: Config) -> CircuitBoard:
+    """Get the circuit board of the configured price data directory. It is only opened on first access."""
+    path = config.paths.price_data_dir / defaults.UPSTREAM_CIRCUIT_BOARD_FILE_NAME
+    board = _boards.get(path)
+    if board is None:
+        board = CircuitBoard(path)
+        _boards[path] = board
+    return board
+
+
+def get_breaker(region: Region, config: Config) -> CircuitBreaker:
+    """Get the circuit breaker of the downloads of a region as configured in the `[upstream]` config section."""
+    upstream_config = config.upstream
+    return CircuitBreaker(
+        region,
+        get_board(config),
+        failure_threshold=upstream_config.breaker_failure_threshold,
+        open_duration=upstream_config.breaker_open_duration,
+        half_open_probes=upstream_config.breaker_half_open_probes,
+    )
@@ -0,0 +1,153 @@
+"""Keep price data in memory so that requests can be answered without touching the filesystem.
+
+The cache holds the parsed price data of each region together with metadata which would otherwise be
+recomputed on every request. An entry is replaced when this process stores new data. Data written by other
+processes is detected by comparing the signatures (inode, modification time and size) of the underlying files.
+This happens right away when another process publishes a new version of the files, otherwise periodically.
+"""
+import os
+import time
+
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import Hashable
+from typing import Optional
+
+from arrow import Arrow
+
+from awattprice import defaults
+from awattprice.defaults import Region
+from awattprice.series import PriceSeries
+
+FileSignature = tuple[int, int, int]
+
+
+def get_file_signature(path: Path) -> Optional[FileSignature]:
+    """Get a signature of a file which changes whenever the file is replaced or written to.
+
+    :returns None: If the file doesn't exist.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class PriceDataCacheEntry:
+    """Price data of a single region held in memory together with precomputed metadata."""
+
+    data: Optional[PriceSeries]
+    last_update_time: Optional[Arrow]
+    latest_end_timestamp: Optional[Arrow]
+    next_update_time: Arrow
+    data_signature: Optional[FileSignature]
+    update_ts_signature: Optional[FileSignature]
+    version: int
+    generation: int
+
+    validated_at: float
+    # Values derived from the data, like rendered responses. They are dropped together with the entry.
+    derived: dict[Hashable, Any]
+
+    def __init__(
+        self,
+        data: Optional[PriceSeries],
+        last_update_time: Optional[Arrow],
+        latest_end_timestamp: Optional[Arrow],
+        next_update_time: Arrow,
+        data_signature: Optional[FileSignature],
+        update_ts_signature: Optional[FileSignature],
+        version: int,
+        generation: int,
+    ):
+        """Constructor for a new cache entry.
+
+        :param latest_end_timestamp: End timestamp of the latest price point in the data.
+        :param next_update_time: Time at which the data will be due for an update.
+        :param version: Number identifying the data. It increases each time the data of the region changes.
+        :param generation: Generation of the region's stored price data published on the version board, which the
+            cached data was read at.
+        """
+        self.data = data
+        self.last_update_time = last_update_time
+        self.latest_end_timestamp = latest_end_timestamp
+        self.next_update_time = next_update_time
+        self.data_signature = data_signature
+        self.update_ts_signature = update_ts_signature
+        self.version = version
+        self.generation = generation
+        self.validated_at = time.monotonic()
+        self.derived = {}
+
+    @property
+    def is_due(self) -> bool:
+        """Check if the cached data is due for update."""
+        return time.time() >= self.next_update_time.int_timestamp
+
+    @property
+    def staleness(self) -> float:
+        """Seconds since the cached data became due for update. 0 if it isn't due."""
+        return max(time.time() - self.next_update_time.int_timestamp, 0.0)
+
+    @property
+    def needs_revalidation(self) -> bool:
+        """Check if the file signatures should be compared again to detect writes by other processes."""
+        validated_since = time.monotonic() - self.validated_at
+        return validated_since >= defaults.PRICE_DATA_CACHE_REVALIDATE_INTERVAL
+
+    def mark_validated(self, generation: int):
+        """Remember that the file signatures were just confirmed to match at a published generation."""
+        self.generation = generation
+        self.validated_at = time.monotonic()
+
+    def derive(self, data: PriceSeries) -> "PriceDataCacheEntry":
+        """Create an entry for price data derived from the cached data. It shares the metadata of this entry."""
+        return PriceDataCacheEntry(
+            data=data,
+            last_update_time=self.last_update_time,
+            latest_end_timestamp=self.latest_end_timestamp,
+            next_update_time=self.next_update_time,
+            data_signature=self.data_signature,
+            update_ts_signature=self.update_ts_signature,
+            version=self.version,
+            generation=self.generation,
+        )
+
+    def get_derived(self, key: Hashable, derive: Callable[[], Any]) -> Any:
+        """Get a value derived from the cached data, computing it on first access.
+
+        :param key: Identifies the derived value within this entry.
+        :param derive: Called without arguments to compute the value if it isn't known yet.
+        """
+        try:
+            return self.derived[key]
+        except KeyError:
+            value = derive()
+            self.derived[key] = value
+            return value
+
+
+_entries: dict[Region, PriceDataCacheEntry] = {}
+
+
+def get_entry(region: Region) -> Optional[PriceDataCacheEntry]:
+    """Get the cache entry of a region.
+
+    :returns None: If nothing is cached for the region.
+    """
+    return _entries.get(region)
+
+
+def set_entry(region: Region, entry: PriceDataCacheEntry):
+    """Set the cache entry of a region, replacing any previous entry."""
+    _entries[region] = entry
+
+
+def next_version(region: Region) -> int:
+    """Get the version number to use for new data of a region."""
+    entry = _entries.get(region)
+    if entry is None:
+        return 1
+    return entry.version + 1
@@ -0,0 +1,207 @@
+"""Find the time window in which consuming energy is cheapest.
+
+Energy is assumed to be consumed evenly over the window. The cost of a window is then proportional to the
+integral of the price over it, which is the difference of two prefix sums over the price points. Taken as a
+function of the window start the integral is piecewise linear and only bends where the window start or end
+crosses the boundary of a price point. Its minimum thus lies at one of these starts or at the ends of the range
+of possible starts. All of them are evaluated in a single sweep, so a search is linear in the number of price
+points independent of the window duration.
+
+Taxes and base fees are per kWh. They scale respectively shift the cost of all windows equally, so the cheapest
+window only depends on its duration and earliest start. These searches are cached per data version.
+"""
+from decimal import Decimal
+from typing import Optional
+
+from awattprice import defaults
+from awattprice import utils
+from awattprice.cache import PriceDataCacheEntry
+from awattprice.series import PriceSeries
+
+
+class CheapestWindow:
+    """Cheapest window found for a certain duration and energy amount."""
+
+    start_timestamp: int
+    end_timestamp: int
+    average_price: Decimal
+    cost: Decimal
+
+    def __init__(self, start_timestamp: int, end_timestamp: int, average_price: Decimal, cost: Decimal):
+        """Constructor for a new cheapest window.
+
+        :param average_price: Average price over the window as cent per kWh.
+        :param cost: Cost of consuming the energy in the window as cent.
+        """
+        self.start_timestamp = start_timestamp
+        self.end_timestamp = end_timestamp
+        self.average_price = average_price
+        self.cost = cost
+
+
+class PricePrefixSums:
+    """Prefix sums of the untaxed price over a run of contiguous price points."""
+
+    boundaries: list[int]
+    prices: list[Decimal]
+    sums: list[Decimal]
+
+    def __init__(self, boundaries: list[int], prices: list[Decimal]):
+        """Constructor for new prefix sums.
+
+        :param boundaries: Start timestamp of each price point and the end timestamp of the last one.
+        :param prices: Untaxed price of each price point as cent per kWh.
+        """
+        self.boundaries = boundaries
+        self.prices = prices
+        self.sums = [Decimal(0)]
+        for index, price in enumerate(prices):
+            self.sums.append(self.sums[-1] + price * (boundaries[index + 1] - boundaries[index]))
+
+    @property
+    def start(self) -> int:
+        return self.boundaries[0]
+
+    @property
+    def end(self) -> int:
+        return self.boundaries[-1]
+
+    def get_candidate_starts(self, duration: int, earliest_start: int) -> list[int]:
+        """Get the sorted window starts at which the integral of the price may be minimal."""
+        lowest = max(self.start, earliest_start)
+        highest = self.end - duration
+        if lowest > highest:
+            return []
+        candidates = [lowest, highest]
+        candidates.extend(boundary for boundary in self.boundaries if lowest < boundary < highest)
+        candidates.extend(
+            boundary - duration for boundary in self.boundaries if lowest < boundary - duration < highest
+        )
+        # The candidates consist of few sorted runs, which sorting merges in linear time.
+        candidates.sort()
+        return candidates
+
+    def find_lowest_integral(self, duration: int, earliest_start: int) -> Optional[tuple[int, Decimal]]:
+        """Find the window start for which the integral of the price over the window is lowest.
+
+        :param duration, earliest_start: In seconds.
+        :returns: The window start and the integral as cent per kWh times seconds. The earliest window wins ties.
+        :returns None: If no window of the duration fits.
+        """
+        lowest = None
+        start_index = 0
+        end_index = 0
+        for start in self.get_candidate_starts(duration, earliest_start):
+            end = start + duration
+            # Both window start and end only move forward, so both point indices do as well.
+            while self.boundaries[start_index + 1] <= start:
+                start_index += 1
+            while end_index + 1 < len(self.prices) and self.boundaries[end_index + 1] <= end:
+                end_index += 1
+            start_sum = self.sums[start_index] + self.prices[start_index] * (start - self.boundaries[start_index])
+            end_sum = self.sums[end_index] + self.prices[end_index] * (end - self.boundaries[end_index])
+            integral = end_sum - start_sum
+            if lowest is None or integral < lowest[1]:
+                lowest = (start, integral)
+        return lowest
+
+
+class CheapestWindowFinder:
+    """Find cheapest windows in the price data of one data version."""
+
+    data: PriceSeries
+    runs: list[PricePrefixSums]
+
+    # Found windows by duration. They are only valid for the earliest start they were found for.
+    _lowest_integrals: dict[int, Optional[tuple[int, Decimal]]]
+    _earliest_start: Optional[int]
+
+    def __init__(self, data: PriceSeries):
+        self.data = data
+        self.runs = self._get_runs(data)
+        self._lowest_integrals = {}
+        self._earliest_start = None
+
+    @staticmethod
+    def _get_runs(data: PriceSeries) -> list[PricePrefixSums]:
+        """Split the price data into runs of contiguous price points. Windows can't span gaps."""
+        prices = data.ct_kwh()
+        runs = []
+        boundaries: list[int] = []
+        run_prices: list[Decimal] = []
+        for index in sorted(range(len(data)), key=data.start_timestamps.__getitem__):
+            start_timestamp = data.start_timestamps[index]
+            if boundaries and boundaries[-1] != start_timestamp:
+                runs.append(PricePrefixSums(boundaries, run_prices))
+                boundaries, run_prices = [], []
+            if not boundaries:
+                boundaries.append(start_timestamp)
+            boundaries.append(data.end_timestamps[index])
+            run_prices.append(prices[index])
+        if boundaries:
+            runs.append(PricePrefixSums(boundaries, run_prices))
+        return runs
+
+    def find_lowest_integral(self, duration: int, earliest_start: int) -> Optional[tuple[int, Decimal]]:
+        """Find the window start with the lowest integral of the untaxed price over all runs."""
+        if earliest_start != self._earliest_start:
+            self._lowest_integrals = {}
+            self._earliest_start = earliest_start
+        if duration in self._lowest_integrals:
+            return self._lowest_integrals[duration]
+
+        lowest = None
+        for run in self.runs:
+            run_lowest = run.find_lowest_integral(duration, earliest_start)
+            if run_lowest is not None and (lowest is None or run_lowest[1] < lowest[1]):
+                lowest = run_lowest
+        self._lowest_integrals[duration] = lowest
+        return lowest
+
+    def find(
+        self,
+        duration: int,
+        energy: Decimal,
+        earliest_start: int,
+        taxed: bool = False,
+        base_fee: Decimal = Decimal(0),
+    ) -> Optional[CheapestWindow]:
+        """Find the cheapest window to consume energy in.
+
+        :param duration: Duration of the window in seconds. Use whole minutes to get windows at minute resolution.
+        :param energy: Energy consumed over the window in kWh.
+        :param earliest_start: Epoch seconds before which the window mustn't start.
+        :param taxed: If set use taxed prices.
+        :param base_fee: Fee as cent per kWh added to each price.
+        :returns None: If no window of the duration fits into the price data.
+        """
+        lowest = self.find_lowest_integral(duration, earliest_start)
+        if lowest is None:
+            return None
+        start, integral = lowest
+
+        average_price = integral / duration
+        if taxed and self.data.region.tax:
+            average_price *= self.data.region.tax
+        average_price += base_fee
+        return CheapestWindow(start, start + duration, average_price, average_price * energy)
+
+
+def get_finder(entry: PriceDataCacheEntry) -> CheapestWindowFinder:
+    """Get the cheapest window finder of a cache entry. It is only created on first access."""
+    return entry.get_derived("cheapest_window_finder", lambda: CheapestWindowFinder(entry.data))
+
+
+def get_earliest_start(now: float) -> int:
+    """Get the earliest start of a window at minute resolution, which is the next full minute."""
+    return -(-int(now) // defaults.MINUTE_TO_SEC) * defaults.MINUTE_TO_SEC
+
+
+def parse_to_response_data(window: CheapestWindow) -> dict:
+    """Transform a cheapest window to the format in which it is sent in a response."""
+    return {
+        "start_timestamp": window.start_timestamp,
+        "end_timestamp": window.end_timestamp,
+        "average_price": float(utils.round_ctkwh(window.average_price)),
+        "cost": float(utils.round_ctkwh(window.cost)),
+    }
@@ -5,6 +5,7 @@ from pathlib import Path
 from typing import Optional
 from typing import TypeVar
 
+from box import Box
 from liteconfig import Config
 from loguru import logger
 
@@ -27,13 +28,32 @@ def _check_config_none(config_value: ConfigValue) -> Optional[ConfigValue]:
     return config_value
 
 
+def _get_optional_section(config: Config, section_name: str, section_defaults: dict) -> Box:
+    """Get a config section which config files of previous versions may lack.
+
+    :param section_defaults: Fields of the section with their default values. Only these fields are read.
+    :returns: Section with the configured values and the default values for fields which aren't configured.
+    """
+    section = Box(section_defaults)
+    if config.has_section(section_name):
+        configured_section = getattr(config, section_name)
+        for field_name in section_defaults:
+            if config.has_property(field_name, section_name):
+                section[field_name] = getattr(configured_section, field_name)
+    return section
+
+
 def _transform_config(config: Config):
     """Transform certain config fields to another data type and/or value."""
+    for section_name, section_defaults in defaults.OPTIONAL_CONFIG_DEFAULTS.items():
+        setattr(config, section_name, _get_optional_section(config, section_name, section_defaults))
+
     config.general.log_level = config.general.log_level.upper()
 
     config.paths.log_dir = Path(config.paths.log_dir).expanduser()
     config.paths.data_dir = Path(config.paths.data_dir).expanduser()
     config.paths.price_data_dir = config.paths.data_dir / defaults.PRICE_DATA_SUBDIR_NAME
+    config.paths.price_archive_dir = config.paths.price_data_dir / defaults.PRICE_ARCHIVE_SUBDIR_NAME
     config.paths.apns_dir = Path(config.paths.apns_dir).expanduser()
 
     config.paths.old_database = _check_config_none(config.paths.old_database)
@@ -62,6 +82,7 @@ def _ensure_config_dirs(config: Config):
     _ensure_dir(config.paths.log_dir)
     _ensure_dir(config.paths.data_dir)
     _ensure_dir(config.paths.price_data_dir)
+    _ensure_dir(config.paths.price_archive_dir)
     _ensure_dir(config.paths.apns_dir)
 
 
@@ -4,9 +4,12 @@ from typing import Optional
 from typing import Union
 
 from awattprice import defaults
+from awattprice.exceptions import DatabaseNotMigratedError
 from liteconfig import Config
 from loguru import logger
 from sqlalchemy import create_engine
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
 from sqlalchemy.engine import Engine
 from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.ext.asyncio import create_async_engine
@@ -36,4 +39,39 @@ def get_engine(database_file: Path, ignore_database_not_found=False, async_=Fals
 def get_awattprice_engine(config: Config, ignore_database_not_found=False, async_=False) -> Optional[Union[Engine, AsyncEngine]]:
     database_dir = config.paths.data_dir
     database_file = database_dir / defaults.DATABASE_FILE_NAME
-    return get_engine(database_file, ignore_database_not_found=ignore_database_not_found, async_=async_)
\ No newline at end of file
+    return get_engine(database_file, ignore_database_not_found=ignore_database_not_found, async_=async_)
+
+
+def get_base_fee_column_type(connection: Connection) -> Optional[str]:
+    """Get the declared type of the base fee column of the token table, e.g. 'INTEGER'.
+
+    :returns None: If the token table doesn't exist or has no base fee column.
+    """
+    token_table_name = defaults.ORM_TABLE_NAMES.token_table
+    columns = connection.execute(text(f"PRAGMA table_info({token_table_name})")).mappings().all()
+    return next((column["type"].upper() for column in columns if column["name"] == "base_fee"), None)
+
+
+def check_migrated(connection: Connection):
+    """Check that the database stores base fees as fixed-point integer millicents.
+
+    Databases created before stored them as decimal cent strings. These can't be told apart from millicents by
+    their values, so the backend doesn't run on them.
+
+    :raises DatabaseNotMigratedError: If base fees are stored in another type of column.
+    """
+    base_fee_type = get_base_fee_column_type(connection)
+    if base_fee_type is not None and base_fee_type != "INTEGER":
+        raise DatabaseNotMigratedError(
+            f"Base fees are stored as {base_fee_type} instead of millicents. Stop the backend, back up the "
+            "database and run 'misc/migrate_base_fee_millicents.py'."
+        )
+
+
+async def check_migrated_async(engine: AsyncEngine):
+    """Check that the database of an async engine stores base fees as millicents. See `check_migrated`.
+
+    :raises DatabaseNotMigratedError: If base fees are stored in another type of column.
+    """
+    async with engine.connect() as connection:
+        await connection.run_sync(check_migrated)
@@ -18,9 +18,25 @@ class Region(str, Enum):
         tax = REGION_TAXES[self]
         return tax
 
+    @property
+    def tax_ratio(self) -> tuple[int, int]:
+        """Multiplier to get the taxed price as integer numerator and denominator."""
+        if not self.tax:
+            return (1, 1)
+        return self.tax.as_integer_ratio()
+
+
+class PriceUnit(str, Enum):
+    """Unit in which prices are sent."""
+
+    EUR_MWH = "eur_mwh"
+    CT_KWH = "ct_kwh"
+
 
 # Multipliers to get the taxed price.
 REGION_TAXES = {Region.DE: Decimal("1.19"), Region.AT: Decimal("1.20")}
+# Region served if a client doesn't specify one.
+DEFAULT_REGION = Region.DE
 
 AWATTPRICE_SERVICE_NAME = "awattprice"
 APP_BUNDLE_ID = Box()
@@ -35,9 +51,13 @@ log_level = DEBUG
 
 [awattar.de]
 url = https://api.awattar.de/v1/marketdata/
+# Urls of equivalent sources, like mirrors or caching proxies of the url, separated by commas. They are requested
+# in order when the sources before are slow to answer or fail.
+mirrors =
 
 [awattar.at]
 url = https://api.awattar.at/v1/marketdata/
+mirrors =
 
 [paths]
 log_dir = ~/awattprice/logs/
@@ -48,8 +68,84 @@ old_database =
 [apns]
 team_id = 
 key_id = 
+
+[refresh]
+# If true a background task of the web app refreshes price data on a schedule and requests only read the stored
+# data. If false requests refresh price data when they find it due, which suits single-process setups.
+background = false
+# Seconds for which requests are answered right away with price data which is due for update, while a single
+# refresh runs in the background. Requests for data which is due for longer wait for the refresh. 0 always waits.
+max_staleness = 3600
+
+[responses]
+# Resolution in seconds to which price data is aggregated for requests which don't ask for one, e.g. 3600 to serve
+# hourly prices to app versions which don't handle quarter-hourly prices. 0 serves prices as aWATTar sends them.
+default_resolution = 0
+
+[admin]
+# Token with which admins authorize as bearer token to switch tracing and capture profiles at runtime. Admin
+# endpoints are only served if a token is set.
+token =
+
+[metrics]
+# If true the web app exposes metrics in the Prometheus text format at /metrics.
+enabled = false
+
+[upstream]
+# Use http/2 when downloading from aWATTar.
+http2 = true
+# Pool limits of the http client shared by all downloads of a process.
+max_connections = 10
+max_keepalive_connections = 5
+# Seconds after which idle connections are closed.
+keepalive_expiry = 60
+# Timeouts in seconds when requesting from aWATTar.
+connect_timeout = 3
+read_timeout = 7
+write_timeout = 7
+pool_timeout = 3
+# Seconds to wait for an answer of a source of price data before also requesting the next source of the region.
+hedge_delay = 1
+# Consecutive failed download attempts of a region after which its circuit breaker opens. While open, price data
+# isn't downloaded and requests are answered with the stored price data right away.
+breaker_failure_threshold = 4
+# Seconds a circuit breaker stays open before downloads are probed again with a single attempt each.
+breaker_open_duration = 60
+# Consecutive successful probes after which a circuit breaker closes again.
+breaker_half_open_probes = 1
 """
 
+# Defaults for config sections and fields which config files of previous versions may not contain yet.
+OPTIONAL_CONFIG_DEFAULTS = {
+    "refresh": {
+        "background": False,
+        "max_staleness": 3600,
+    },
+    "responses": {
+        "default_resolution": 0,
+    },
+    "admin": {
+        "token": "",
+    },
+    "metrics": {
+        "enabled": False,
+    },
+    "upstream": {
+        "http2": True,
+        "max_connections": 10,
+        "max_keepalive_connections": 5,
+        "keepalive_expiry": 60,
+        "connect_timeout": 3,
+        "read_timeout": 7,
+        "write_timeout": 7,
+        "pool_timeout": 3,
+        "hedge_delay": 1,
+        "breaker_failure_threshold": 4,
+        "breaker_open_duration": 60,
+        "breaker_half_open_probes": 1,
+    },
+}
+
 ORM_TABLE_NAMES = Box(
     {
         "token_table": "token",
@@ -59,12 +155,21 @@ ORM_TABLE_NAMES = Box(
 
 # Factors to convert between sizes.
 SEC_TO_MILLISEC = 1000
+MINUTE_TO_SEC = 60
 EURMWH_TO_CENTWKWH = Decimal("100") * Decimal("0.001")
 
 # Number of places to round a cent per kwh price.
 CENT_KWH_ROUNDING_PLACES = 2
 
-AWATTAR_TIMEOUT = 7 # Timeout in seconds when requesting from aWATTar.
+# Prices are computed as fixed-point integers of millicent per kWh. One millicent per kWh is a hundredth euro
+# per MWh, so market prices as received from aWATTar are represented exactly.
+MILLICENTS_PER_CENT = 1000
+EURMWH_TO_MILLICENTKWH = 100
+# Decimal places of a millicent value when expressed as cent.
+MILLICENT_PLACES = 3
+# Step in millicents to which cent per kwh prices are rounded.
+CENT_KWH_ROUNDING_STEP = 10 ** (MILLICENT_PLACES - CENT_KWH_ROUNDING_PLACES)
+
 AWATTAR_RETRY_MAX_ATTEMPTS = 4
 AWATTAR_RETRY_STOP_DELAY = 7 # Delay after which to stop retrying.
 # After polling the API wait x seconds before requesting again. When a download attempt failed it won't count
@@ -73,6 +178,17 @@ AWATTAR_COOLDOWN_INTERVAL = 60
 # Attempt to update aWATTar prices if its past this hour of the day.
 # Always will update at x hour regardless of summer and winter times.
 AWATTAR_UPDATE_HOUR = 13
+# Hour of the day until which new prices are expected to be published. Between the update hour and this hour the
+# background refresher polls frequently.
+AWATTAR_UPDATE_WINDOW_END_HOUR = 15
+# Intervals in seconds in which the background refresher polls a region inside and outside the update window.
+REFRESH_WINDOW_POLL_INTERVAL = 60
+REFRESH_IDLE_POLL_INTERVAL = 900
+# Maximal random delay in seconds added to each poll interval, so that regions and processes don't poll in sync.
+REFRESH_POLL_JITTER = 15
+# Bounds in seconds of the exponential backoff the background refresher waits after failed refreshes.
+REFRESH_BACKOFF_MIN = 30
+REFRESH_BACKOFF_MAX = 600
 
 EUROPE_BERLIN_TIMEZONE = "Europe/Berlin"
 
@@ -101,14 +217,63 @@ AWATTAR_API_PRICE_DATA_SCHEMA = {
     },
     "required": ["data", "url"],
 }
-PRICE_DATA_FILE_NAME = "awattar-data-{}.pickle"  # formatted with lowercase region name
+PRICE_DATA_FILE_NAME = "awattar-data-{}.prices"  # formatted with lowercase region name
+# Name of the pickle file which stored price data before. It is migrated to the binary format on first read.
+LEGACY_PRICE_DATA_FILE_NAME = "awattar-data-{}.pickle"  # formatted with lowercase region name
 # Name of the subdir in which to store cached price data.
 # This subdir is relative to the data dir specified in the config file.
 PRICE_DATA_SUBDIR_NAME = "price_data"
+# Name of the subdir of the price data dir which holds the price archive of each region in a further subdir.
+PRICE_ARCHIVE_SUBDIR_NAME = "archive"
+# Name of an archive partition file. Formatted with the year and month of the partition, e.g. '2022-03'.
+PRICE_ARCHIVE_PARTITION_FILE_NAME = "{}.prices"
+# Suffix appended to the names of compressed archive partition files.
+PRICE_ARCHIVE_COMPRESSED_SUFFIX = ".gz"
+# Gzip compression level of archive partitions of completed months.
+PRICE_ARCHIVE_COMPRESSION_LEVEL = 9
 # Timeout in seconds to wait when needing the refresh price data lock to be unlocked.
 PRICE_DATA_REFRESH_LOCK_TIMEOUT = 10
+# Bounds in seconds of the exponentially growing interval in which a held refresh lock is polled.
+PRICE_DATA_REFRESH_LOCK_MIN_POLL_INTERVAL = 0.01
+PRICE_DATA_REFRESH_LOCK_MAX_POLL_INTERVAL = 0.25
 # Name of file which stores the timestamp when prices were updated last.
 PRICE_DATA_UPDATE_TS_FILE_NAME = "update-ts-{}.info"  # formatted with lowercase region name
+# Name of the memory-mapped file through which processes publish new versions of the stored price data.
+PRICE_DATA_VERSION_BOARD_FILE_NAME = "price-data.versions"
+# Name of the memory-mapped file through which processes share the circuit breakers of downloads from aWATTar.
+UPSTREAM_CIRCUIT_BOARD_FILE_NAME = "upstream.circuits"
+# Name of the memory-mapped file through which processes share the sample rate of traced requests. This file is
+# relative to the data dir specified in the config file.
+TRACING_SAMPLE_RATE_BOARD_FILE_NAME = "tracing.sample-rate"
+# Interval in seconds in which processes which don't refresh price data check for newly published versions.
+PRICE_DATA_VERSION_WATCH_INTERVAL = 1
+# Name of the lock file held by the one process which refreshes price data in the background.
+REFRESHER_LOCK_FILE_NAME = "refresher.lock"
+# Interval in seconds in which the other processes try to take over refreshing, e.g. after the refresher exited.
+REFRESHER_ELECTION_INTERVAL = 10
+
+# Interval in seconds in which the lag of the event loop is measured if metrics are enabled.
+EVENT_LOOP_LAG_INTERVAL = 0.5
+
+# Header of responses with price data which is due for update. Its value is the number of seconds since it's due.
+STALE_RESPONSE_HEADER = "x-awattprice-stale"
+
+# Header with which admins request a trace of a single request. Its value is the admin token.
+TRACE_REQUEST_HEADER = "x-awattprice-trace"
+# Maximal duration in seconds of profiles captured on demand.
+PROFILE_MAX_DURATION = 60
+
+# Interval in seconds after which the in-memory price data cache compares the signatures of the stored files again
+# to pick up data written by other processes.
+PRICE_DATA_CACHE_REVALIDATE_INTERVAL = 30
+# Number of values per data version for which found runs of prices on or below them are cached.
+BELOW_RUNS_CACHE_SIZE = 256
+# Maximal estimated number of bytes taken by the personalized price variants cached by each process.
+PRICE_VARIANT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+# Gzip compression level and brotli quality of compressed price data responses. Responses are compressed once per
+# data version, so the strongest compression is affordable.
+RESPONSE_GZIP_COMPRESSION_LEVEL = 9
+RESPONSE_BROTLI_QUALITY = 11
 
 region_enum_names = [element.name for element in Region]
 
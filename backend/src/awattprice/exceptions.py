@@ -3,3 +3,29 @@
 
 class RefreshLockAcquireError(Exception):
     pass
+
+
+class ProfilerBusyError(Exception):
+    pass
+
+
+class DatabaseNotMigratedError(Exception):
+    pass
+
+
+class UpstreamStatusError(Exception):
+    """A source of price data answered with a server error.
+
+    Only holds the status code and url, so that it can be pickled for the enqueued log sink.
+    """
+
+    status_code: int
+    url: str
+
+    def __init__(self, status_code: int, url: str):
+        super().__init__(status_code, url)
+        self.status_code = status_code
+        self.url = url
+
+    def __str__(self) -> str:
+        return f"Server error {self.status_code} from {self.url}"
@@ -0,0 +1,136 @@
+"""Turn price data downloaded from aWATTar into a price series.
+
+Ingesting happens in stages: the response body is decoded, validated against the aWATTar price data schema and
+parsed into the columns of a price series. The schema validator is built once at import.
+Decoding works on the raw response bytes and parsing fills each column in a single pass over the price points,
+without intermediate objects per point. The duration of each stage is recorded for diagnostics and metrics.
+"""
+import json
+import time
+
+from array import array
+from contextlib import contextmanager
+from operator import itemgetter
+from typing import Iterable
+from typing import Iterator
+
+import jsonschema
+
+from loguru import logger
+
+from awattprice import defaults
+from awattprice import metrics
+from awattprice import tracing
+from awattprice.defaults import Region
+from awattprice.series import PRICE_TYPECODE
+from awattprice.series import TIMESTAMP_TYPECODE
+from awattprice.series import PriceSeries
+
+_get_start_timestamp = itemgetter("start_timestamp")
+_get_end_timestamp = itemgetter("end_timestamp")
+_get_marketprice = itemgetter("marketprice")
+
+
+class IngestTimer:
+    """Record how long each stage of ingesting the price data of a region took."""
+
+    region: Region
+    stages: dict[str, float]
+    # Stages which ran within another stage. Their durations are part of the duration of the enclosing stage.
+    nested: set[str]
+
+    _depth: int
+
+    def __init__(self, region: Region):
+        self.region = region
+        self.stages = {}
+        self.nested = set()
+        self._depth = 0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure the duration of a stage. It is recorded even if the stage raises.
+
+        Stages may be nested, e.g. decoding each response within the download.
+        """
+        if self._depth > 0:
+            self.nested.add(name)
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            duration = time.perf_counter() - start
+            self.stages[name] = duration
+            metrics.price_data_stage_duration.observe(duration, self.region.name, name)
+            tracing.record(name, duration)
+
+    @property
+    def total(self) -> float:
+        """Summed duration of all recorded stages in seconds. Nested stages are part of their enclosing stage."""
+        return sum(duration for name, duration in self.stages.items() if name not in self.nested)
+
+    def log(self):
+        """Log the durations of all recorded stages."""
+        durations = ", ".join(f"{name} {duration * 1000:.2f}ms" for name, duration in self.stages.items())
+        logger.debug(f"Ingest of region {self.region.name} took {self.total * 1000:.2f}ms ({durations}).")
+
+
+def build_validator(schema: dict) -> jsonschema.protocols.Validator:
+    """Build a validator for a json schema. Unlike `jsonschema.validate` the schema is only checked against its
+    meta-schema once, when building the validator.
+
+    :raises jsonschema.SchemaError: If the schema is invalid.
+    """
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+PRICE_DATA_VALIDATOR = build_validator(defaults.AWATTAR_API_PRICE_DATA_SCHEMA)
+
+
+def decode_price_data(content: bytes) -> dict:
+    """Decode the raw body of a price data response.
+
+    Numbers are parsed straight from the body. Prices thus become floats only once and aren't converted
+    through strings or decimals.
+
+    :raises json.JSONDecodeError: If the body isn't valid json.
+    """
+    return json.loads(content)
+
+
+def validate_price_data(data: dict):
+    """Validate decoded price data with the prebuilt schema validator.
+
+    :raises jsonschema.ValidationError: If the data doesn't match the aWATTar price data schema.
+    """
+    PRICE_DATA_VALIDATOR.validate(data)
+
+
+def _milliseconds_to_seconds(timestamps: Iterable[int]) -> array:
+    """Convert timestamps in epoch milliseconds to a timestamp column in epoch seconds.
+
+    Json schema counts floats without fraction as integers. They are converted so that they fit the column.
+    """
+    return array(TIMESTAMP_TYPECODE, [int(timestamp) // defaults.SEC_TO_MILLISEC for timestamp in timestamps])
+
+
+def parse_price_data(region: Region, data: dict) -> PriceSeries:
+    """Parse validated price data into a price series.
+
+    Each column is filled in one pass and the points are sorted by their start timestamps. Timestamps are
+    converted from milliseconds to epoch seconds and stay timezone independent. They are converted to
+    Europe/Berlin time only when single points are shown.
+    """
+    points = data["data"]
+    series = PriceSeries(
+        region,
+        _milliseconds_to_seconds(map(_get_start_timestamp, points)),
+        _milliseconds_to_seconds(map(_get_end_timestamp, points)),
+        array(PRICE_TYPECODE, map(_get_marketprice, points)),
+    )
+    # aWATTar sends sorted points. Keeping them sorted lets later lookups use binary searches.
+    return series.sort()
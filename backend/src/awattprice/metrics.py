@@ -0,0 +1,361 @@
+"""Collect metrics of the web app and expose them in the Prometheus text format.
+
+Metrics are plain counters and histograms with fixed buckets kept in dictionaries, so recording a value costs a
+dictionary lookup and an addition. Instrumented code records values whether or not metrics are exposed. Request
+latencies and the event loop lag are only measured if metrics are enabled in the config.
+
+Each process keeps its own metrics. With multiple worker processes every scrape of /metrics is answered by one of
+them.
+"""
+import asyncio
+import bisect
+import time
+
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Optional
+from typing import TypeVar
+
+from awattprice import defaults
+
+LabelValues = tuple[str, ...]
+
+# Media type of the Prometheus text format. The charset is added by the response.
+MEDIA_TYPE = "text/plain; version=0.0.4"
+
+# Upper bounds in seconds of the buckets of latency histograms.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_value(value: float) -> str:
+    """Format a sample value like Prometheus clients do."""
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def format_labels(label_names: tuple[str, ...], label_values: LabelValues, **extra_labels: str) -> str:
+    """Format the labels of a sample."""
+    labels = [*zip(label_names, label_values), *extra_labels.items()]
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    """Metric with samples for each combination of label values."""
+
+    type_name: str = "untyped"
+
+    name: str
+    documentation: str
+    label_names: tuple[str, ...]
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+
+    def render_samples(self) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Render the metric in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.render_samples())
+        return "\n".join(lines) + "\n"
+
+
+class Counter(Metric):
+    """Value which only increases."""
+
+    type_name = "counter"
+
+    _values: dict[LabelValues, float]
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        """Increase the value of the sample with the label values."""
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> float:
+        """Get the value of the sample with the label values."""
+        return self._values.get(label_values, 0)
+
+    def render_samples(self) -> list[str]:
+        return [
+            f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}"
+            for label_values, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """Value which is set to the current value of something."""
+
+    type_name = "gauge"
+
+    _values: dict[LabelValues, float]
+
+    def __init__(self, name: str, documentation: str, label_names: tuple[str, ...] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values = {}
+
+    def set(self, value: float, *label_values: str):
+        """Set the value of the sample with the label values."""
+        self._values[label_values] = value
+
+    def get(self, *label_values: str) -> float:
+        """Get the value of the sample with the label values."""
+        return self._values.get(label_values, 0)
+
+    def render_samples(self) -> list[str]:
+        return [
+            f"{self.name}{format_labels(self.label_names, label_values)} {format_value(value)}"
+            for label_values, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(Metric):
+    """Distribution of observed values over buckets with fixed upper bounds."""
+
+    type_name = "histogram"
+
+    buckets: tuple[float, ...]
+
+    # Count of observations in each bucket, not cumulated, followed by their sum.
+    _observations: dict[LabelValues, list[float]]
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = buckets
+        self._observations = {}
+
+    def observe(self, value: float, *label_values: str):
+        """Record an observation in the sample with the label values."""
+        observations = self._observations.get(label_values)
+        if observations is None:
+            # One bucket for each upper bound, one for values above all bounds and one for the sum.
+            observations = [0] * (len(self.buckets) + 2)
+            self._observations[label_values] = observations
+        observations[bisect.bisect_left(self.buckets, value)] += 1
+        observations[-1] += value
+
+    def render_samples(self) -> list[str]:
+        lines = []
+        for label_values, observations in sorted(self._observations.items()):
+            cumulative = 0
+            for upper_bound, count in zip((*self.buckets, float("inf")), observations):
+                cumulative += count
+                labels = format_labels(self.label_names, label_values, le=format_value(upper_bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {format_value(observations[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+MetricType = TypeVar("MetricType", bound=Metric)
+
+
+class Registry:
+    """Collection of the metrics of a process."""
+
+    _metrics: dict[str, Metric]
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: MetricType) -> MetricType:
+        """Add a metric to the collection.
+
+        :raises ValueError: If a metric with the same name is registered already.
+        """
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        return "".join(metric.render() for metric in self._metrics.values())
+
+
+registry = Registry()
+
+request_duration = registry.register(
+    Histogram(
+        "awattprice_request_duration_seconds",
+        "Time taken to respond to requests.",
+        ("method", "route", "status"),
+    )
+)
+price_data_stage_duration = registry.register(
+    Histogram(
+        "awattprice_price_data_stage_duration_seconds",
+        "Time taken by each stage of reading and refreshing price data.",
+        ("region", "stage"),
+    )
+)
+price_data_cache_lookups = registry.register(
+    Counter(
+        "awattprice_price_data_cache_lookups_total",
+        "Lookups of cached price data by result: hit without file access, revalidated or loaded from the files.",
+        ("region", "result"),
+    )
+)
+upstream_attempts = registry.register(
+    Counter("awattprice_upstream_attempts_total", "Attempts to download price data from aWATTar.", ("region",))
+)
+upstream_retries = registry.register(
+    Counter("awattprice_upstream_retries_total", "Attempts which retried a failed download.", ("region",))
+)
+upstream_failures = registry.register(
+    Counter("awattprice_upstream_failures_total", "Downloads which failed after all attempts.", ("region",))
+)
+upstream_source_requests = registry.register(
+    Counter(
+        "awattprice_upstream_source_requests_total",
+        "Requests to each source of price data by its index, 0 being aWATTar. Others were hedged or failed over.",
+        ("region", "source"),
+    )
+)
+upstream_source_wins = registry.register(
+    Counter(
+        "awattprice_upstream_source_wins_total",
+        "Downloads for which each source was the first to answer with valid price data.",
+        ("region", "source"),
+    )
+)
+upstream_short_circuits = registry.register(
+    Counter(
+        "awattprice_upstream_short_circuits_total",
+        "Refreshes which didn't download because the circuit breaker of the region was open.",
+        ("region",),
+    )
+)
+upstream_circuit_state = registry.register(
+    Gauge(
+        "awattprice_upstream_circuit_state",
+        "State of the circuit breaker of downloads as last seen by this process: 0 closed, 1 open, 2 half-open.",
+        ("region",),
+    )
+)
+upstream_circuit_transitions = registry.register(
+    Counter(
+        "awattprice_upstream_circuit_transitions_total",
+        "Transitions of the circuit breaker of downloads made by this process, by the state transitioned to.",
+        ("region", "state"),
+    )
+)
+refresh_joins = registry.register(
+    Counter("awattprice_refresh_joins_total", "Callers which joined a refresh already in flight.", ("region",))
+)
+stale_serves = registry.register(
+    Counter(
+        "awattprice_stale_serves_total",
+        "Requests answered with price data due for update while it is refreshed in the background.",
+        ("region",),
+    )
+)
+refresh_lock_wait_duration = registry.register(
+    Histogram(
+        "awattprice_refresh_lock_wait_duration_seconds",
+        "Time waited for refresh locks held by other processes. Locks acquired immediately aren't included.",
+    )
+)
+refresh_lock_timeouts = registry.register(
+    Counter("awattprice_refresh_lock_timeouts_total", "Refresh locks which couldn't be acquired in time.")
+)
+event_loop_lag = registry.register(
+    Histogram(
+        "awattprice_event_loop_lag_seconds",
+        "Delay of the event loop in running a callback beyond the time it was scheduled for.",
+    )
+)
+
+
+class MetricsMiddleware:
+    """Measure the time taken to respond to requests for each route."""
+
+    app: Callable[..., Awaitable[Any]]
+
+    # Path templates of the routes of the app by their endpoint.
+    _route_paths: Optional[dict[Callable, str]]
+
+    def __init__(self, app: Callable[..., Awaitable[Any]]):
+        self.app = app
+        self._route_paths = None
+
+    def get_route_path(self, scope: dict) -> str:
+        """Get the path template of the route which handled a request."""
+        if self._route_paths is None:
+            self._route_paths = {route.endpoint: route.path for route in scope["app"].routes}
+        # The router stores the endpoint of the matching route in the scope.
+        endpoint = scope.get("endpoint")
+        return self._route_paths.get(endpoint, "unmatched")
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: dict):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_duration.observe(
+                time.perf_counter() - start, scope["method"], self.get_route_path(scope), str(status)
+            )
+
+
+class EventLoopLagMonitor:
+    """Measure how late the event loop runs callbacks, e.g. because of blocking work on the loop."""
+
+    _task: Optional[asyncio.Task]
+
+    def __init__(self):
+        self._task = None
+
+    def start(self):
+        """Start measuring. Must be called from within a running event loop."""
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._measure())
+
+    async def stop(self):
+        """Stop measuring and wait until the measuring task finished."""
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def _measure(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + defaults.EVENT_LOOP_LAG_INTERVAL
+            await asyncio.sleep(defaults.EVENT_LOOP_LAG_INTERVAL)
+            event_loop_lag.observe(max(0.0, loop.time() - expected))
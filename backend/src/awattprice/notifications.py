@@ -96,9 +96,10 @@ def parse_notification_configuration_body(configuration: Box) -> Optional[Box]:
 		return None
 
 	configuration.general.region = Region[configuration.general.region]
+	# Base fees are stored as fixed-point millicent per kWh.
 	if "base_fee" in configuration.general: # Needed to ensure backwards compatibility with prior AWattPrice app versions.
-		configuration.general.base_fee = Decimal(str(configuration.general.base_fee))
+		configuration.general.base_fee = utils.ctkwh_to_millicents(Decimal(str(configuration.general.base_fee)))
 	else:
-		configuration.general.base_fee = Decimal("0")
+		configuration.general.base_fee = 0
 
 	return configuration
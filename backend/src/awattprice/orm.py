@@ -1,6 +1,4 @@
 """Database tables represented as orms."""
-from decimal import Decimal
-
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import Enum
@@ -9,7 +7,6 @@ from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
 from sqlalchemy import MetaData
 from sqlalchemy import String
-from sqlalchemy import types
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import registry as Registry
 
@@ -24,15 +21,6 @@ metadata = MetaData()
 registry = Registry(metadata)
 Base = registry.generate_base()
 
-class DatabaseDecimalType(types.TypeDecorator):
-    impl = String
-    cache_ok = True
-    
-    def process_bind_param(self, value: Decimal, dialect):
-        return str(value)
-        
-    def process_result_value(self, value: String, dialect):
-        return Decimal(value)
 
 # pylint: disable=too-few-public-methods
 class PriceBelowNotification(Base):
@@ -60,7 +48,9 @@ class Token(Base):
     token = Column(String, unique=True, nullable=False)
     region = Column(Enum(Region), nullable=False)
     tax = Column(Boolean, default=False, nullable=False)
-    base_fee = Column(DatabaseDecimalType, default=0, nullable=False)
+    # Fee as fixed-point millicent per kWh. Databases created before stored cent values as decimal strings and must
+    # be migrated with 'misc/migrate_base_fee_millicents.py'.
+    base_fee = Column(Integer, default=0, nullable=False)
 
     price_below = relationship(
         PriceBelowNotification, back_populates="token", cascade="all, delete-orphan", uselist=False
@@ -1,23 +1,20 @@
 """Poll and process price data."""
 import asyncio
-import json
+import functools
 import pickle
+import time
 
-from copy import deepcopy
 from decimal import Decimal
+from pathlib import Path
 from typing import Optional
 from typing import Union
 
 import arrow
-import filelock
 import httpx
-import jsonschema
 
 from aiofile import async_open
 from arrow import Arrow
 from box import Box
-from box import BoxList
-from fastapi import HTTPException
 from liteconfig import Config
 from loguru import logger
 from tenacity import (
@@ -29,11 +26,25 @@ from tenacity import (
     wait_fixed,
 )
 
+from awattprice import archive
+from awattprice import breaker
+from awattprice import cache
 from awattprice import defaults
 from awattprice import exceptions
+from awattprice import ingest
+from awattprice import metrics
+from awattprice import refresh
+from awattprice import snapshot
+from awattprice import store
+from awattprice import tracing
+from awattprice import upstream
 from awattprice import utils
+from awattprice.cache import PriceDataCacheEntry
 from awattprice.defaults import Region
-from awattprice.utils import ExtendedFileLock
+from awattprice.refresh import AsyncFileLock
+from awattprice.series import PriceSeries
+from awattprice.store import PriceFileError
+from awattprice.store import StoredPriceData
 from awattprice.utils import log_attempts
 
 
@@ -41,6 +52,8 @@ class MarketPrice:
     """Provide extra helper functions next to storing the marketprice."""
 
     value: Decimal
+    # Price as fixed-point millicent per kWh.
+    millicents: int
     region: Region
 
     def __init__(self, price: Decimal, region: Region):
@@ -50,6 +63,7 @@ class MarketPrice:
         :param tax: Multiplier to get the taxed price.
         """
         self.value = price
+        self.millicents = utils.euromwh_to_millicents(price)
         self.region = region
 
     @property
@@ -60,47 +74,161 @@ class MarketPrice:
         else:
             return self.value
 
+    def ct_kwh_millicents(self, taxed: bool = False) -> int:
+        """Convert the price to cent per kWh rounded naturally, as fixed-point millicents.
+
+        :param taxed: If set convert the taxed price.
+        """
+        if taxed:
+            numerator, denominator = self.region.tax_ratio
+        else:
+            numerator, denominator = 1, 1
+        return utils.round_millicents(self.millicents * numerator, denominator)
+
     def ct_kwh(self, taxed: bool = False, round_: bool = False) -> Decimal:
         """Convert the price to cent per kWh.
 
         :param taxed: If set convert the taxed price.
-        :param round_: If set round the price naturally before returning.
+        :param round_: If set round the price naturally before returning. It is rounded as fixed-point millicents.
         """
+        if round_ is True:
+            return utils.millicents_to_ctkwh(self.ct_kwh_millicents(taxed))
         if taxed:
             price = self.taxed
         else:
             price = self.value
         ct_kwh_price = utils.euromwh_to_ctkwh(price)
 
-        if round_ is True:
-            ct_kwh_price = utils.round_ctkwh(ct_kwh_price)
-
         return ct_kwh_price
 
 
-async def get_stored_data(region: Region, config: Config) -> Optional[Box]:
-    """Get locally cached price data.
-
-    :returns: Price data wrapped as a Box. If file not found returns None.
-    """
+def get_price_data_file_path(region: Region, config: Config) -> Path:
+    """Get the path of the file which stores the price data of a region."""
     file_dir = config.paths.price_data_dir
     file_name = defaults.PRICE_DATA_FILE_NAME.format(region.value.lower())
-    file_path = file_dir / file_name
+    return file_dir / file_name
 
+
+def get_update_ts_file_path(region: Region, config: Config) -> Path:
+    """Get the path of the file which stores the last update time of a region."""
+    file_dir = config.paths.price_data_dir
+    file_name = defaults.PRICE_DATA_UPDATE_TS_FILE_NAME.format(region.name.lower())
+    return file_dir / file_name
+
+
+def get_price_point(data: PriceSeries, index: int) -> Box:
+    """Get a single price point of the price data with its times as arrow objects and its market price."""
+    price_point = Box()
+    price_point.start_timestamp = data.start_time(index)
+    price_point.end_timestamp = data.end_time(index)
+    price_point.marketprice = MarketPrice(data.marketprice(index), data.region)
+    return price_point
+
+
+def convert_legacy_data(region: Region, data: Box) -> PriceSeries:
+    """Convert price data stored in the former format of Box price points to a price series."""
+    series = PriceSeries.from_columns(
+        region,
+        (point.start_timestamp.int_timestamp for point in data.prices),
+        (point.end_timestamp.int_timestamp for point in data.prices),
+        (float(point.marketprice.value) for point in data.prices),
+    )
+    return series.sort()
+
+
+def get_legacy_price_data_file_path(region: Region, config: Config) -> Path:
+    """Get the path of the pickle file which stored the price data of a region before the binary format."""
+    file_dir = config.paths.price_data_dir
+    file_name = defaults.LEGACY_PRICE_DATA_FILE_NAME.format(region.value.lower())
+    return file_dir / file_name
+
+
+async def migrate_legacy_data(region: Region, config: Config) -> Optional[StoredPriceData]:
+    """Convert the legacy pickle file of a region to a price data file.
+
+    :returns: The price data read from the new price data file. If no legacy file exists returns None.
+    """
+    legacy_file_path = get_legacy_price_data_file_path(region, config)
     try:
-        async with async_open(file_path, "rb") as file:
+        async with async_open(legacy_file_path, "rb") as file:
             unpickled_data = await file.read()
-    except FileNotFoundError as exc:
-        logger.debug(f"No stored price data found: {exc}.")
+    except FileNotFoundError:
         return None
 
     if len(unpickled_data) == 0:
-        logger.debug("Stored price data found, but is empty.")
+        logger.debug("Legacy price data found, but is empty.")
         return None
 
     data = pickle.loads(unpickled_data)
+    if isinstance(data, Box):
+        data = convert_legacy_data(region, data)
 
-    return data
+    file_path = get_price_data_file_path(region, config)
+    logger.info(f"Migrating {region.name} price data from {legacy_file_path} to {file_path}.")
+    await store.write_price_file(file_path, data)
+
+    return store.read_price_file(file_path)
+
+
+async def read_price_data_file(region: Region, config: Config) -> Optional[StoredPriceData]:
+    """Read the price data file of a region together with its header.
+
+    If there is no price data file yet the legacy pickle file gets migrated.
+
+    :returns None: If neither a price data file nor a legacy file exists or the price data file is empty.
+    """
+    file_path = get_price_data_file_path(region, config)
+    stored_price_data = store.read_price_file(file_path)
+    if stored_price_data is None:
+        stored_price_data = await migrate_legacy_data(region, config)
+    return stored_price_data
+
+
+async def get_stored_data(region: Region, config: Config) -> Optional[PriceSeries]:
+    """Get locally cached price data.
+
+    The returned price series is backed by the memory mapped price data file.
+
+    :returns: Price data as a price series. If file not found returns None.
+    """
+    stored_price_data = await read_price_data_file(region, config)
+    if stored_price_data is None:
+        logger.debug(f"No stored {region.name} price data found.")
+        return None
+
+    return stored_price_data.data
+
+
+async def get_notified_endtime(region: Region, config: Config) -> Optional[int]:
+    """Get the end timestamp of the price data about which price below notifications were sent last.
+
+    :returns None: If no notifications were sent yet or there is no price data file.
+    """
+    stored_price_data = await read_price_data_file(region, config)
+    if stored_price_data is None:
+        return None
+    return stored_price_data.header.notified_endtime
+
+
+async def store_notified_endtime(region: Region, config: Config, notified_endtime: int):
+    """Set the end timestamp of the price data about which price below notifications were sent last.
+
+    It is stored in the header of the price data file. The refresh lock is held to not interfere with new price
+    data being stored at the same time.
+    """
+    refresh_lock = get_data_refresh_lock(region, config)
+    await refresh_lock.acquire()
+    try:
+        stored_price_data = await read_price_data_file(region, config)
+        if stored_price_data is not None:
+            data = stored_price_data.data
+        else:
+            data = PriceSeries.empty(region)
+        file_path = get_price_data_file_path(region, config)
+        await store.write_price_file(file_path, data, notified_endtime)
+        snapshot.publish(region, config)
+    finally:
+        refresh_lock.release()
 
 
 async def get_last_update_time(region: Region, config: Config) -> Optional[Arrow]:
@@ -109,9 +237,7 @@ async def get_last_update_time(region: Region, config: Config) -> Optional[Arrow
     :returns None: If file not found.
     :returns arrow.Arrow: Last update time.
     """
-    file_dir = config.paths.price_data_dir
-    file_name = defaults.PRICE_DATA_UPDATE_TS_FILE_NAME.format(region.name.lower())
-    file_path = file_dir / file_name
+    file_path = get_update_ts_file_path(region, config)
 
     try:
         async with async_open(file_path, "r") as file:
@@ -125,7 +251,45 @@ async def get_last_update_time(region: Region, config: Config) -> Optional[Arrow
     return time
 
 
-def check_update_data(data: Optional[Box], last_update_time: Optional[Arrow]) -> bool:
+def get_latest_end_timestamp(data: Optional[PriceSeries]) -> Optional[Arrow]:
+    """Get the end timestamp of the latest price point.
+
+    :returns None: If there is no price data.
+    """
+    if data is None or len(data) == 0:
+        return None
+    return arrow.get(data.latest_end_timestamp).to(defaults.EUROPE_BERLIN_TIMEZONE)
+
+
+def get_next_update_time(latest_end_timestamp: Optional[Arrow], last_update_time: Optional[Arrow]) -> Arrow:
+    """Get the time from which on price data will be due for update.
+
+    The rules are evaluated once for the data instead of on each request. Price data is due if it doesn't reach
+    until the following day's midnight and either doesn't cover the current day or it's past the update hour.
+
+    :param latest_end_timestamp: End timestamp of the latest price point. None if there is no price data.
+    :param last_update_time: Time data was last polled from the awattar api.
+    """
+    if latest_end_timestamp is None:
+        next_update_time = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE)
+    else:
+        latest_end_berlin = latest_end_timestamp.to(defaults.EUROPE_BERLIN_TIMEZONE)
+        # First day on which the price points don't reach until the following day's midnight anymore.
+        update_day_start = latest_end_berlin.shift(days=-2).floor("day").shift(days=+1)
+        update_day_end = update_day_start.shift(days=+1)
+        if (update_day_end - latest_end_berlin).total_seconds() >= 3600:
+            next_update_time = update_day_start
+        else:
+            next_update_time = update_day_start.replace(hour=defaults.AWATTAR_UPDATE_HOUR)
+
+    if last_update_time is not None:
+        cooldown_end = last_update_time.shift(seconds=defaults.AWATTAR_COOLDOWN_INTERVAL)
+        next_update_time = max(next_update_time, cooldown_end)
+
+    return next_update_time
+
+
+def check_update_data(data: Optional[PriceSeries], last_update_time: Optional[Arrow]) -> bool:
     """Check if price data is due for update.
 
     :param last_update_time: Time data was last polled from the awattar api.
@@ -134,81 +298,137 @@ def check_update_data(data: Optional[Box], last_update_time: Optional[Arrow]) ->
     if data is None:
         return True
 
+    latest_end_timestamp = get_latest_end_timestamp(data)
+    next_update_time = get_next_update_time(latest_end_timestamp, last_update_time)
     now_berlin = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE)
-
-    if last_update_time is not None:
-        next_update_time = last_update_time.shift(seconds=defaults.AWATTAR_COOLDOWN_INTERVAL)
-        if now_berlin < next_update_time:
-            seconds_remaining = (next_update_time - now_berlin).total_seconds()
-            logger.debug(f"AWATTar cooldown has {seconds_remaining}s remaining.")
-            return False
-
-    midnight_tomorrow_berlin = now_berlin.floor("day").shift(days=+2)
-    latest_price = max(data.prices, key=lambda point: point.end_timestamp)
-    if latest_price.end_timestamp >= midnight_tomorrow_berlin:
-        logger.debug("Price points still available until tomorrow midnight.")
+    if now_berlin < next_update_time:
+        logger.debug(f"Price data not due for update until {next_update_time}.")
         return False
 
-    midnight_today_berlin = now_berlin.floor("day").shift(days=+1)
-    latest_price_end_berlin = latest_price.end_timestamp.to(defaults.EUROPE_BERLIN_TIMEZONE)
-    midnight_today_latest_price_end_diff = midnight_today_berlin - latest_price_end_berlin
-    if midnight_today_latest_price_end_diff.total_seconds() >= 3600:
-        return True
+    return True
 
-    if now_berlin.hour < defaults.AWATTAR_UPDATE_HOUR:
-        logger.debug(f"Not past update hour ({defaults.AWATTAR_UPDATE_HOUR}).")
-        return False
 
-    return True
+async def load_cache_entry(region: Region, config: Config) -> PriceDataCacheEntry:
+    """Read the stored price data and its last update time into a new cache entry."""
+    data_path = get_price_data_file_path(region, config)
+    update_ts_path = get_update_ts_file_path(region, config)
+    # Take the generation and signatures before reading. If a file is replaced while reading, the next validation
+    # reloads it.
+    generation = snapshot.get_generation(region, config)
+    data_signature = cache.get_file_signature(data_path)
+    update_ts_signature = cache.get_file_signature(update_ts_path)
 
+    stored_data, last_update_time = await asyncio.gather(
+        get_stored_data(region, config),
+        get_last_update_time(region, config),
+        return_exceptions=True,
+    )
+    if isinstance(stored_data, Exception):
+        raise stored_data
+    if isinstance(last_update_time, Exception):
+        logger.exception(
+            f"Couldn't get the {region.name} last update time and thus will assume it is none: {last_update_time}."
+        )
+        last_update_time = None
+
+    latest_end_timestamp = get_latest_end_timestamp(stored_data)
+    entry = PriceDataCacheEntry(
+        data=stored_data,
+        last_update_time=last_update_time,
+        latest_end_timestamp=latest_end_timestamp,
+        next_update_time=get_next_update_time(latest_end_timestamp, last_update_time),
+        data_signature=data_signature,
+        update_ts_signature=update_ts_signature,
+        version=cache.next_version(region),
+        generation=generation,
+    )
+    return entry
+
+
+async def get_cache_entry(region: Region, config: Config, revalidate: bool = False) -> PriceDataCacheEntry:
+    """Get the cached price data of a region, loading it from the filesystem if needed.
+
+    Usually no file access happens. The signatures of the stored files are only compared if the entry is due for
+    update, another process published a new version of the files or the entry wasn't validated for some time.
 
-def get_data_refresh_lock(region: Region, config: Config) -> ExtendedFileLock:
-    """Get file lock used when refreshing price data."""
+    :param revalidate: If true always compare the file signatures.
+    """
+    entry = cache.get_entry(region)
+    if entry is not None:
+        generation = snapshot.get_generation(region, config)
+        published = generation != entry.generation
+        if not (revalidate or published or entry.is_due or entry.needs_revalidation):
+            metrics.price_data_cache_lookups.inc(region.name, "hit")
+            return entry
+        start = time.perf_counter()
+        data_signature = cache.get_file_signature(get_price_data_file_path(region, config))
+        update_ts_signature = cache.get_file_signature(get_update_ts_file_path(region, config))
+        duration = time.perf_counter() - start
+        metrics.price_data_stage_duration.observe(duration, region.name, "revalidate")
+        tracing.record("revalidate", duration)
+        if data_signature == entry.data_signature and update_ts_signature == entry.update_ts_signature:
+            entry.mark_validated(generation)
+            metrics.price_data_cache_lookups.inc(region.name, "revalidated")
+            return entry
+        logger.debug(f"Stored {region.name} price data changed on disk. Reloading it.")
+
+    start = time.perf_counter()
+    entry = await load_cache_entry(region, config)
+    duration = time.perf_counter() - start
+    metrics.price_data_stage_duration.observe(duration, region.name, "read")
+    tracing.record("read", duration)
+    metrics.price_data_cache_lookups.inc(region.name, "loaded")
+    cache.set_entry(region, entry)
+    return entry
+
+
+def get_data_refresh_lock(region: Region, config: Config) -> AsyncFileLock:
+    """Get the inter-process lock used when refreshing price data."""
     lock_dir = config.paths.price_data_dir
     lock_file_name = defaults.PRICE_DATA_FILE_NAME.format(region.value.lower()) + ".lock"
     lock_file_path = lock_dir / lock_file_name
-    lock = ExtendedFileLock(lock_file_path)
+    lock = AsyncFileLock(lock_file_path)
     return lock
 
 
-async def acquire_refresh_lock_immediate(
-    lock: ExtendedFileLock, timeout: float = defaults.PRICE_DATA_REFRESH_LOCK_TIMEOUT
-) -> bool:
-    """Acquire the refresh lock either immediately or with waiting.
+async def fetch_price_data(
+    client: httpx.AsyncClient, url: str, params: dict, region: Region, source: int, timer: ingest.IngestTimer
+) -> dict:
+    """Request price data from a single source and check it.
 
-    :returns: As soon as lock was acquired.
-    :returns True: Acquired lock immediately.
-    :returns False: Acquired lock after waiting.
-    :raises filelock.Timeout: Lock couldn't be acquired - even after waiting.
+    :param source: Index of the source among the sources of the region.
+    :param timer: Records decoding and validating the response.
+    :returns: The decoded and validated price data.
+    :raises httpx.HTTPError: If the request failed.
+    :raises UpstreamStatusError: If the source answered with a server error.
+    :raises json.JSONDecodeError: If the response body isn't valid json.
+    :raises jsonschema.ValidationError: If the price data doesn't match the aWATTar price data schema.
     """
-    async_acquire = utils.async_wrap(lock.acquire)
-    try:
-        await async_acquire(timeout=0)
-    except filelock.Timeout:
-        # Lock couldn't be acquired immediately.
-        pass
-    else:
-        logger.debug("Lock acquired immediately.")
-        return True
+    logger.info(f"Polling {region.value.upper()} price data from {url}.")
+    metrics.upstream_source_requests.inc(region.name, str(source))
+    response = await client.get(url, params=params)
+    # Server errors mean that the source is down, so they count as failed requests.
+    if response.is_server_error:
+        raise exceptions.UpstreamStatusError(response.status_code, str(response.url))
+    with timer.stage("decode"):
+        data = ingest.decode_price_data(response.content)
+    with timer.stage("validate"):
+        ingest.validate_price_data(data)
+    return data
 
-    try:
-        await async_acquire(timeout=timeout)
-    except filelock.Timeout as exc:
-        logger.exception(f"Lock couldn't be acquired at all: {exc}.")
-        raise
-    else:
-        logger.debug("Lock acquired after waiting.")
-        return False
 
+async def download_data(region: Region, config: Config, timer: ingest.IngestTimer) -> Optional[dict]:
+    """Download price data from the aWATTar API or one of the equivalent sources configured for the region.
 
-async def download_data(region: Region, config: Config) -> Optional[Box]:
-    """Download price data from the aWATTar API and extract the json.
+    Each attempt requests the sources hedged, in the configured order. The first source which answers with valid
+    price data wins. Must be called while holding the refresh lock. Attempts pass the circuit breaker of the
+    region. While it is open nothing is downloaded. Retrying stops once it opens.
 
-    :returns price data: As a box object.
-    :returns None: If price data couldn't be downloaded or is no valid json.
+    :param timer: Records decoding and validating the responses.
+    :returns price data: Decoded and validated.
+    :returns None: If price data couldn't be downloaded.
     """
-    region_config_identifier = f"awattar.{region.value.lower()}"
-    url = getattr(config, region_config_identifier).url
+    sources = upstream.get_sources(region, config)
 
     now = arrow.utcnow()
     now_berlin = now.to(defaults.EUROPE_BERLIN_TIMEZONE)
@@ -219,150 +439,249 @@ async def download_data(region: Region, config: Config) -> Optional[Box]:
         "start": today_start.int_timestamp * defaults.SEC_TO_MILLISEC,
         "end": tomorrow_end.int_timestamp * defaults.SEC_TO_MILLISEC,
     }
-    logger.info(f"Polling {region.value.upper()} price data from {url}.")
-
+    circuit = breaker.get_breaker(region, config)
+    if not circuit.check_download():
+        logger.debug(f"Circuit of {region.name} downloads is open. Not polling price data.")
+        metrics.upstream_short_circuits.inc(region.name)
+        return None
 
-    async with httpx.AsyncClient() as client:
+    async with upstream.client_session(config) as client:
+        requests = [
+            functools.partial(fetch_price_data, client, url, url_parameters, region, source, timer)
+            for source, url in enumerate(sources)
+        ]
         try:
             async for attempt in AsyncRetrying(
                 before=log_attempts(logger.debug, "download awattar price data"),
                 stop=(
                     stop_after_attempt(defaults.AWATTAR_RETRY_MAX_ATTEMPTS)
                     | stop_after_delay(defaults.AWATTAR_RETRY_STOP_DELAY)
+                    | circuit.stop_if_open
                 ),
-                wait=wait_exponential(multiplier=1.5, min=0, max=4)
+                wait=wait_exponential(multiplier=1.5, min=0, max=4),
+                reraise=True,
             ):
-                with attempt:
-                    response = await client.get(url, params=url_parameters, timeout=defaults.AWATTAR_TIMEOUT)
+                metrics.upstream_attempts.inc(region.name)
+                if attempt.retry_state.attempt_number > 1:
+                    metrics.upstream_retries.inc(region.name)
+                with attempt, tracing.stage("upstream_attempt"):
+                    try:
+                        source, data = await upstream.hedge(requests, config.upstream.hedge_delay)
+                    except Exception:
+                        circuit.record_failure()
+                        raise
+                    circuit.record_success()
+        except httpx.HTTPError as exc:
+            # Errors of httpx hold their request, which can't be pickled for the enqueued log sink.
+            logger.error(f"Requests - also after retrying -  failed when downloading price data: {exc!r}.")
+            metrics.upstream_failures.inc(region.name)
+            return None
         except Exception as exc:
             logger.exception(f"Requests - also after retrying -  failed when downloading price data: {exc}.")
+            metrics.upstream_failures.inc(region.name)
             return None
 
-    try:
-        data_raw = response.json()
-    except json.JSONDecodeError as exc:
-        logger.exception(f"Couldn't decode downloaded price data as json: {exc}.")
-        return None
-    data = Box(data_raw)
-
+    metrics.upstream_source_wins.inc(region.name, str(source))
+    if source != 0:
+        logger.info(f"Got {region.name} price data from {sources[source]}.")
     return data
 
 
 async def update_last_update_time(region: Region, config: Config):
     """Set the time the price data was updated last to the current time."""
-    file_dir = config.paths.price_data_dir
-    file_name = defaults.PRICE_DATA_UPDATE_TS_FILE_NAME.format(region.name.lower())
-    file_path = file_dir / file_name
+    file_path = get_update_ts_file_path(region, config)
 
     now = arrow.now()
     now_string = str(now.int_timestamp)
     async with async_open(file_path, "w") as file:
         await file.write(now_string)
+    generation = snapshot.publish(region, config)
 
-
-def parse_downloaded_data(region: Region, data: Box) -> Box:
-    """Parse the downloaded price data into the app internal format."""
-    new_data = Box()
-    new_data.prices = BoxList()
-    for point in data.data:
-        new_point = Box()
-        start_timestamp = point.start_timestamp / defaults.SEC_TO_MILLISEC
-        new_point.start_timestamp = arrow.get(start_timestamp).to(defaults.EUROPE_BERLIN_TIMEZONE)
-        end_timestamp = point.end_timestamp / defaults.SEC_TO_MILLISEC
-        new_point.end_timestamp = arrow.get(end_timestamp).to(defaults.EUROPE_BERLIN_TIMEZONE)
-        marketprice = Decimal(str(point.marketprice))
-        new_point.marketprice = MarketPrice(marketprice, region)
-        new_data.prices.append(new_point)
-
-    return new_data
+    entry = cache.get_entry(region)
+    if entry is not None:
+        # Time is stored with second precision. Keep the cached value identical to what a reload would yield.
+        entry.last_update_time = arrow.get(now.int_timestamp)
+        entry.next_update_time = get_next_update_time(entry.latest_end_timestamp, entry.last_update_time)
+        entry.update_ts_signature = cache.get_file_signature(file_path)
+        entry.generation = generation
 
 
-def check_data_new(old_data: Optional[Box], new_data: Box) -> bool:
+def check_data_new(old_data: Optional[PriceSeries], new_data: PriceSeries) -> bool:
     """Check if new price points were added relative to the max price point of the old price data."""
-    if old_data is None:
+    if len(new_data) == 0:
+        return False
+    if old_data is None or len(old_data) == 0:
         return True
 
-    max_end_compare_key = lambda point: point.end_timestamp
-    max_end_old = max(old_data.prices, key=max_end_compare_key)
-    max_end_new = max(new_data.prices, key=max_end_compare_key)
-
-    if max_end_new.end_timestamp > max_end_old.end_timestamp:
+    if new_data.latest_end_timestamp > old_data.latest_end_timestamp:
         return True
     else:
         return False
 
 
-async def store_data(data: Box, region: Region, config: Config):
-    """Store new price data to the filesystem."""
-    store_dir = config.paths.price_data_dir
-    file_name = defaults.PRICE_DATA_FILE_NAME.format(region.value.lower())
-    file_path = store_dir / file_name
+async def store_data(data: PriceSeries, region: Region, config: Config):
+    """Store new price data to the filesystem, replace the cached data of the region and archive the data.
 
-    pickled_data = pickle.dumps(data)
+    Must be called while holding the refresh lock. Metadata of the previous price data file is kept.
+    """
+    file_path = get_price_data_file_path(region, config)
+
+    try:
+        previous_price_data = store.read_price_file(file_path)
+    except PriceFileError as exc:
+        logger.warning(f"Couldn't read previous {region.name} price data file. Its metadata is lost: {exc}.")
+        previous_price_data = None
+    if previous_price_data is not None:
+        notified_endtime = previous_price_data.header.notified_endtime
+    else:
+        notified_endtime = None
 
     logger.info(f"Storing aWATTar {region.value} price data to {file_path}.")
-    async with async_open(file_path, "wb") as file:
-        await file.write(pickled_data)
+    await store.write_price_file(file_path, data, notified_endtime)
+    generation = snapshot.publish(region, config)
+
+    previous_entry = cache.get_entry(region)
+    if previous_entry is not None:
+        last_update_time = previous_entry.last_update_time
+        update_ts_signature = previous_entry.update_ts_signature
+    else:
+        last_update_time = None
+        update_ts_signature = None
+    latest_end_timestamp = get_latest_end_timestamp(data)
+    entry = PriceDataCacheEntry(
+        data=data,
+        last_update_time=last_update_time,
+        latest_end_timestamp=latest_end_timestamp,
+        next_update_time=get_next_update_time(latest_end_timestamp, last_update_time),
+        data_signature=cache.get_file_signature(file_path),
+        update_ts_signature=update_ts_signature,
+        version=cache.next_version(region),
+        generation=generation,
+    )
+    cache.set_entry(region, entry)
 
+    try:
+        await archive.merge_data(data, config, arrow.utcnow().int_timestamp)
+    except Exception as exc:
+        # The current price data is stored already. The points are archived with the next download.
+        logger.exception(f"Couldn't archive {region.name} price data: {exc}.")
 
-async def get_latest_new_prices(stored_data: None, region: Region, config: Config) -> Optional[Box]:
-    """Download the latest new prices.
+
+async def download_latest_new_prices(
+    stored_data: Optional[PriceSeries], region: Region, config: Config
+) -> Optional[PriceSeries]:
+    """Download the latest new prices while holding the inter-process refresh lock.
 
     :returns downloaded price data: If all went well.
     :returns None: There are no latest new prices.
     """
     refresh_lock = get_data_refresh_lock(region, config)
-    could_acquire_immediately = await acquire_refresh_lock_immediate(refresh_lock)
+    could_acquire_immediately = await refresh_lock.acquire()
 
     # See 'energy_prices.get' doc for an explanation of these update steps.
     if could_acquire_immediately:
-        with refresh_lock.context(acquire=False):
-            new_data = await download_data(region, config)
-            if new_data is None:
+        try:
+            # Another process may have stored new data since the caller checked if the data is due.
+            entry = await get_cache_entry(region, config, revalidate=True)
+            if not entry.is_due:
+                logger.debug(f"Region {region.name} was refreshed by another process in the meantime.")
+                return entry.data
+            if entry.data is not None:
+                stored_data = entry.data
+
+            timer = ingest.IngestTimer(region)
+            with timer.stage("download"):
+                decoded_data = await download_data(region, config, timer)
+            if decoded_data is None:
                 return None
             try:
                 await update_last_update_time(region, config)
             except Exception as exc:
                 logger.exception(f"Couldn't write last update time: {exc}.")
                 # Not ideal, but also not essential to provide the latest new prices.
-            jsonschema.validate(new_data, defaults.AWATTAR_API_PRICE_DATA_SCHEMA)
-            new_data = parse_downloaded_data(region, new_data)
+            with timer.stage("parse"):
+                new_data = ingest.parse_price_data(region, decoded_data)
             data_is_new = check_data_new(stored_data, new_data)
             if not data_is_new:
                 logger.debug(f"Downloaded data for region {region.name} includes no new prices.")
+                timer.log()
                 return None
             else:
                 logger.debug(f"Got fresh new data for region {region.name}.")
-            await store_data(new_data, region, config)
+            with timer.stage("store"):
+                await store_data(new_data, region, config)
+            timer.log()
             latest_prices = new_data
+        finally:
+            refresh_lock.release()
     else:
         refresh_lock.release()
-        latest_prices = await get_stored_data(region, config)
+        entry = await get_cache_entry(region, config, revalidate=True)
+        latest_prices = entry.data
 
     return latest_prices
 
 
-async def get_current_prices(region: Region, config: Config, fall_back=False) -> Optional[dict]:
-    """Get the currently up to date price data.
+async def get_latest_new_prices(
+    stored_data: Optional[PriceSeries], region: Region, config: Config
+) -> Optional[PriceSeries]:
+    """Download the latest new prices.
+
+    Concurrent calls for the same region share a single download.
+
+    :returns downloaded price data: If all went well.
+    :returns None: There are no latest new prices.
+    """
+    return await refresh.coordinator.run(region, lambda: download_latest_new_prices(stored_data, region, config))
+
+
+def revalidate_in_background(stored_data: Optional[PriceSeries], region: Region, config: Config):
+    """Download the latest new prices in the background unless a download is in flight already.
+
+    Callers which download the latest new prices meanwhile join the background download.
+    """
+    started = refresh.coordinator.revalidate(
+        region, lambda: download_latest_new_prices(stored_data, region, config)
+    )
+    if started:
+        logger.debug(f"Revalidating {region.name} prices in the background.")
+
+
+async def get_current_cache_entry(
+    region: Region, config: Config, fall_back=False, refresh=True, max_staleness: float = 0
+) -> Optional[PriceDataCacheEntry]:
+    """Get the cache entry holding the currently up to date price data.
 
     :param fall_back: If true function will fall back to the stored data in certain situations when an
         error retrieving the actual current prices occurrs. If false none will be returned in such cases.
+    :param refresh: If true download new prices if the stored data is due. If false only return the stored data,
+        for example because a background task takes care of refreshing.
+    :param max_staleness: Seconds for which stored data which is due is returned right away while new prices are
+        downloaded in the background. Data which is due for longer is only returned after the download. If 0
+        always wait for the download.
+
+    Stored data which is due is also returned right away while the circuit breaker of the region is open.
     """
-    stored_data, last_update_time = await asyncio.gather(
-        get_stored_data(region, config),
-        get_last_update_time(region, config),
-        return_exceptions=True,
-    )
-    if isinstance(stored_data, Exception):
-        logger.exception(f"Couldn't get stored {region.name} data: {stored_data}.")
+    try:
+        entry = await get_cache_entry(region, config)
+    except Exception as exc:
+        logger.exception(f"Couldn't get stored {region.name} data: {exc}.")
         return None
-    if isinstance(last_update_time, Exception):
-        logger.exception(
-            f"Couldn't get the {region.name} last update time and thus will assume it is none: {last_update_time}."
-        )
-        last_update_time = None
+    stored_data = entry.data
+
+    do_update_data = refresh and entry.is_due
+    if do_update_data and breaker.get_breaker(region, config).is_open:
+        logger.debug(f"Circuit of {region.name} downloads is open. Not getting latest new prices.")
+        metrics.upstream_short_circuits.inc(region.name)
+        if not fall_back or stored_data is None:
+            return None
+        return entry
+
+    if do_update_data and stored_data is not None and entry.staleness < max_staleness:
+        revalidate_in_background(stored_data, region, config)
+        metrics.stale_serves.inc(region.name)
+        return entry
 
-    do_update_data = check_update_data(stored_data, last_update_time)
     price_data = None
     if do_update_data:
         try:
@@ -382,19 +701,52 @@ async def get_current_prices(region: Region, config: Config, fall_back=False) ->
         logger.debug(f"Local {region.name} prices still up to date.")
         price_data = stored_data
 
-    return price_data
+    if price_data is None:
+        return None
+    # Storing new data replaced the entry, so always return the latest one.
+    return cache.get_entry(region)
+
+
+async def get_current_prices(region: Region, config: Config, fall_back=False) -> Optional[PriceSeries]:
+    """Get the currently up to date price data.
+
+    :param fall_back: If true function will fall back to the stored data in certain situations when an
+        error retrieving the actual current prices occurrs. If false none will be returned in such cases.
+    """
+    entry = await get_current_cache_entry(region, config, fall_back=fall_back)
+    if entry is None:
+        return None
+    return entry.data
 
 
-def parse_to_response_data(price_data: Box) -> Box:
+def parse_to_response_data(price_data: PriceSeries) -> dict:
     """Parse app interal format to the response format."""
-    # Don't create copy to need to explicitly make data included in response opt-in.
-    response_data = Box()
-    response_data.prices = []
-    for price_point in price_data.prices:
-        response_point = Box()
-        response_point.start_timestamp = price_point.start_timestamp.int_timestamp
-        response_point.end_timestamp = price_point.end_timestamp.int_timestamp
-        response_point.marketprice = float(price_point.marketprice.value)
-        response_data.prices.append(response_point)
+    # Build each point explicitly so that data included in the response stays opt-in.
+    response_prices = [
+        {"start_timestamp": start_timestamp, "end_timestamp": end_timestamp, "marketprice": marketprice}
+        for start_timestamp, end_timestamp, marketprice in zip(
+            price_data.start_timestamps, price_data.end_timestamps, price_data.marketprices
+        )
+    ]
+    response_data = {"prices": response_prices}
+
+    return response_data
+
+
+def parse_to_columnar_response_data(price_data: PriceSeries) -> dict:
+    """Parse app internal format to the columnar response format.
+
+    Start timestamps and prices are sent as parallel arrays. If all price points have the same duration, it is
+    sent once as interval and end timestamps are implicit. Otherwise the end timestamps are sent as another array.
+    """
+    response_data = {
+        "start_timestamps": list(price_data.start_timestamps),
+        "marketprices": list(price_data.marketprices),
+    }
+    resolution = price_data.resolution
+    if resolution is not None:
+        response_data["interval"] = resolution
+    else:
+        response_data["end_timestamps"] = list(price_data.end_timestamps)
 
     return response_data
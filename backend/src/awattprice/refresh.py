@@ -0,0 +1,221 @@
+"""Coordinate refreshes of price data so that each region is only downloaded once at a time.
+
+Within a process all callers which want to refresh the same region share one in-flight refresh. Across processes
+a lock file is used. It is acquired without blocking and polled with asyncio sleeps, so waiting for it neither
+blocks the event loop nor parks executor threads.
+
+When price data is refreshed in the background and the web app runs in multiple worker processes, only one of
+them refreshes. It is elected by holding another lock file for its whole lifetime. The lock is released by the
+operating system when the process exits, after which one of the other processes takes over.
+"""
+import asyncio
+import fcntl
+import os
+
+from pathlib import Path
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Optional
+from typing import TypeVar
+
+from loguru import logger
+
+from awattprice import defaults
+from awattprice import metrics
+from awattprice import tracing
+from awattprice.defaults import Region
+from awattprice.exceptions import RefreshLockAcquireError
+
+RefreshResult = TypeVar("RefreshResult")
+
+
+class AsyncFileLock:
+    """Exclusive inter-process lock on a file which can be awaited without blocking the event loop."""
+
+    path: Path
+    _fd: Optional[int]
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def is_locked(self) -> bool:
+        """Check if this instance currently holds the lock."""
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        """Try to acquire the lock without waiting.
+
+        :returns: True if the lock was acquired, false if it is held by someone else.
+        """
+        if self._fd is not None:
+            raise RuntimeError(f"Lock {self.path} is already held by this instance.")
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return True
+
+    async def acquire(self, timeout: float = defaults.PRICE_DATA_REFRESH_LOCK_TIMEOUT) -> bool:
+        """Acquire the lock either immediately or with waiting.
+
+        :returns: As soon as lock was acquired.
+        :returns True: Acquired lock immediately.
+        :returns False: Acquired lock after waiting.
+        :raises RefreshLockAcquireError: Lock couldn't be acquired - even after waiting.
+        """
+        if self.try_acquire():
+            logger.debug("Lock acquired immediately.")
+            return True
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        deadline = start + timeout
+        poll_interval = defaults.PRICE_DATA_REFRESH_LOCK_MIN_POLL_INTERVAL
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.error(f"Lock {self.path} couldn't be acquired within {timeout}s.")
+                metrics.refresh_lock_timeouts.inc()
+                raise RefreshLockAcquireError(self.path)
+            await asyncio.sleep(min(poll_interval, remaining))
+            if self.try_acquire():
+                logger.debug("Lock acquired after waiting.")
+                duration = loop.time() - start
+                metrics.refresh_lock_wait_duration.observe(duration)
+                tracing.record("lock_wait", duration)
+                return False
+            poll_interval = min(poll_interval * 2, defaults.PRICE_DATA_REFRESH_LOCK_MAX_POLL_INTERVAL)
+
+    def release(self):
+        """Release the lock. Does nothing if the lock isn't held."""
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class RefreshCoordinator:
+    """Run at most one refresh per region at a time and share its result with all callers."""
+
+    _in_flight: dict[Region, asyncio.Future]
+
+    def __init__(self):
+        self._in_flight = {}
+
+    def is_refreshing(self, region: Region) -> bool:
+        """Check if a refresh of the region is currently in flight."""
+        return region in self._in_flight
+
+    def start(self, region: Region, refresh: Callable[[], Awaitable[RefreshResult]]) -> asyncio.Future:
+        """Start refreshing a region unless a refresh is already in flight for it.
+
+        :param refresh: Called to start a new refresh if none is in flight.
+        :returns: Future of the refresh in flight.
+        """
+        future = self._in_flight.get(region)
+        if future is None:
+            future = asyncio.ensure_future(refresh())
+            self._in_flight[region] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(region, None))
+        else:
+            logger.debug(f"Joining in-flight refresh of region {region.name}.")
+            metrics.refresh_joins.inc(region.name)
+        return future
+
+    async def run(self, region: Region, refresh: Callable[[], Awaitable[RefreshResult]]) -> RefreshResult:
+        """Refresh a region or join the refresh which is already in flight for it.
+
+        :param refresh: Called to start a new refresh if none is in flight. Its result is returned to all callers
+            which joined. If it raises, the exception is raised to all of them.
+        """
+        future = self.start(region, refresh)
+        # A caller which is cancelled, e.g. because its client disconnected, mustn't cancel the shared refresh.
+        with tracing.stage("refresh"):
+            return await asyncio.shield(future)
+
+    def revalidate(self, region: Region, refresh: Callable[[], Awaitable[Any]]) -> bool:
+        """Refresh a region in the background unless a refresh is already in flight for it.
+
+        Nobody waits for the refresh, so if it raises the exception is logged.
+
+        :param refresh: Called to start a new refresh if none is in flight.
+        :returns: True if a new refresh was started, false if one was in flight already.
+        """
+        if self.is_refreshing(region):
+            return False
+        future = self.start(region, refresh)
+        future.add_done_callback(lambda done: self._log_failure(region, done))
+        return True
+
+    async def wait(self):
+        """Wait until all refreshes in flight finished, e.g. background refreshes before shutting down."""
+        await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+
+    @staticmethod
+    def _log_failure(region: Region, future: asyncio.Future):
+        if future.cancelled():
+            return
+        try:
+            future.result()
+        except Exception as exc:
+            logger.exception(f"Couldn't revalidate {region.name} price data: {exc}.")
+
+
+class RefresherElection:
+    """Elect the one process which refreshes price data in the background."""
+
+    lock: AsyncFileLock
+    on_elected: Callable[[], Any]
+
+    _task: Optional[asyncio.Task]
+
+    def __init__(self, path: Path, on_elected: Callable[[], Any]):
+        """Constructor for a new election.
+
+        :param path: Path of the lock file shared by all processes taking part.
+        :param on_elected: Called once when this process is elected.
+        """
+        self.lock = AsyncFileLock(path)
+        self.on_elected = on_elected
+        self._task = None
+
+    @property
+    def is_elected(self) -> bool:
+        """Check if this process is the elected refresher."""
+        return self.lock.is_locked
+
+    def start(self):
+        """Take part in the election until elected. Must be called from within a running event loop."""
+        if self._task is not None or self.is_elected:
+            return
+        self._task = asyncio.create_task(self._campaign())
+
+    async def stop(self):
+        """Stop taking part and step down if elected, so that another process can take over."""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        self.lock.release()
+
+    async def _campaign(self):
+        """Try to get elected until it succeeds."""
+        while not self.lock.try_acquire():
+            await asyncio.sleep(defaults.REFRESHER_ELECTION_INTERVAL)
+        logger.info(f"Process {os.getpid()} was elected to refresh price data.")
+        self.on_elected()
+
+
+coordinator = RefreshCoordinator()
@@ -0,0 +1,423 @@
+"""Render price data responses once per data version and serve them with http caching headers.
+
+Price data can be served in multiple media types and content codings, negotiated with the Accept and
+Accept-Encoding request headers. Each variant is rendered on first request and then cached for the data version.
+"""
+import gzip
+import hashlib
+import json
+import time
+
+from typing import Callable
+from typing import Optional
+
+from fastapi import Response
+
+from awattprice import defaults
+from awattprice import prices
+from awattprice import tracing
+from awattprice import wire
+from awattprice.cache import PriceDataCacheEntry
+from awattprice.defaults import Region
+from awattprice.series import PriceSeries
+
+try:
+    import brotli
+except ImportError:
+    # Brotli compression is only offered if the optional brotli package is installed.
+    brotli = None
+
+PRICE_DATA_MEDIA_TYPE = "application/json"
+COLUMNAR_PRICE_DATA_MEDIA_TYPE = "application/vnd.awattprice.columnar+json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CBOR_MEDIA_TYPE = "application/cbor"
+# Alternative names clients may use for a media type.
+MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK_MEDIA_TYPE}
+# Headers by which responses of negotiated price data vary.
+NEGOTIATION_VARY = "Accept, Accept-Encoding"
+
+
+def serialize_json(response_data: dict) -> bytes:
+    """Serialize response data as json.
+
+    The serialization matches the one FastAPI applies to json responses.
+    """
+    return json.dumps(
+        response_data, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+# Functions to transform price data to response data and to serialize the response data, by media type. All
+# compact media types use the columnar layout.
+PRICE_DATA_SERIALIZERS: dict[str, tuple[Callable[[PriceSeries], dict], Callable[[dict], bytes]]] = {
+    PRICE_DATA_MEDIA_TYPE: (prices.parse_to_response_data, serialize_json),
+    COLUMNAR_PRICE_DATA_MEDIA_TYPE: (prices.parse_to_columnar_response_data, serialize_json),
+    MSGPACK_MEDIA_TYPE: (prices.parse_to_columnar_response_data, wire.encode_msgpack),
+    CBOR_MEDIA_TYPE: (prices.parse_to_columnar_response_data, wire.encode_cbor),
+}
+
+
+def compress_gzip(body: bytes) -> bytes:
+    """Compress a response body with gzip. The output doesn't depend on the time to keep entity tags stable."""
+    return gzip.compress(body, compresslevel=defaults.RESPONSE_GZIP_COMPRESSION_LEVEL, mtime=0)
+
+
+def compress_brotli(body: bytes) -> bytes:
+    """Compress a response body with brotli."""
+    return brotli.compress(body, quality=defaults.RESPONSE_BROTLI_QUALITY)
+
+
+# Compression functions by content coding in order of preference.
+COMPRESSORS: dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    COMPRESSORS["br"] = compress_brotli
+COMPRESSORS["gzip"] = compress_gzip
+# Alternative names clients may use for a content coding.
+ENCODING_ALIASES = {"x-gzip": "gzip"}
+
+
+class ResponseFormat:
+    """Media type and content coding in which a response is sent."""
+
+    media_type: str
+    # Content coding or None if the body isn't compressed.
+    encoding: Optional[str]
+
+    def __init__(self, media_type: str = PRICE_DATA_MEDIA_TYPE, encoding: Optional[str] = None):
+        self.media_type = media_type
+        self.encoding = encoding
+
+    @property
+    def uncompressed(self) -> "ResponseFormat":
+        """Same format without compression."""
+        return ResponseFormat(self.media_type)
+
+
+class RenderedResponse:
+    """Serialized response body together with its entity tag.
+
+    Each media type and content coding of the same data has its own entity tag.
+    """
+
+    body: bytes
+    etag: str
+    media_type: str
+    encoding: Optional[str]
+
+    def __init__(self, body: bytes, media_type: str = PRICE_DATA_MEDIA_TYPE, encoding: Optional[str] = None):
+        self.body = body
+        self.media_type = media_type
+        self.encoding = encoding
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.etag = f'"{digest}"'
+
+    def compress(self, encoding: str) -> "RenderedResponse":
+        """Compress the body with a content coding.
+
+        :returns self: If compressing doesn't make the body smaller, which happens for very small bodies.
+        """
+        with tracing.stage("compress"):
+            body = COMPRESSORS[encoding](self.body)
+        if len(body) >= len(self.body):
+            return self
+        return RenderedResponse(body, self.media_type, encoding)
+
+
+def parse_quality_values(header: str) -> dict[str, float]:
+    """Parse the values listed in a header like Accept or Accept-Encoding together with their quality values.
+
+    Parameters other than the quality value are ignored. Values without valid quality value get a quality of 1.
+
+    :returns: Lowercase values mapped to their quality value.
+    """
+    quality_values = {}
+    for item in header.split(","):
+        value, *parameters = item.split(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            name, _, parameter_value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(parameter_value)
+                except ValueError:
+                    pass
+        quality_values[value] = max(quality, quality_values.get(value, 0.0))
+    return quality_values
+
+
+def negotiate_media_type(accept: Optional[str]) -> Optional[str]:
+    """Select the media type of price data which the client accepts most.
+
+    Media types accepted equally are preferred in the order of the price data serializers, so wildcards select
+    the verbose json format.
+
+    :param accept: Value of the Accept request header.
+    :returns: Media type or None if the client accepts none of the media types.
+    """
+    if accept is None or not accept.strip():
+        return PRICE_DATA_MEDIA_TYPE
+    quality_values = {}
+    for value, quality in parse_quality_values(accept).items():
+        value = MEDIA_TYPE_ALIASES.get(value, value)
+        quality_values[value] = max(quality, quality_values.get(value, 0.0))
+
+    selected_media_type = None
+    selected_quality = 0.0
+    for media_type in PRICE_DATA_SERIALIZERS:
+        main_type = media_type.split("/")[0]
+        for pattern in [media_type, f"{main_type}/*", "*/*"]:
+            if pattern in quality_values:
+                quality = quality_values[pattern]
+                break
+        else:
+            continue
+        if quality > selected_quality:
+            selected_media_type = media_type
+            selected_quality = quality
+    return selected_media_type
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Select the content coding which the client accepts most.
+
+    :param accept_encoding: Value of the Accept-Encoding request header.
+    :returns: Content coding or None to send the body uncompressed.
+    """
+    if accept_encoding is None:
+        return None
+    quality_values = {}
+    for value, quality in parse_quality_values(accept_encoding).items():
+        value = ENCODING_ALIASES.get(value, value)
+        quality_values[value] = max(quality, quality_values.get(value, 0.0))
+
+    selected_encoding = None
+    selected_quality = 0.0
+    for encoding in COMPRESSORS:
+        quality = quality_values.get(encoding, quality_values.get("*", 0.0))
+        if quality > selected_quality:
+            selected_encoding = encoding
+            selected_quality = quality
+    return selected_encoding
+
+
+def negotiate_format(accept: Optional[str], accept_encoding: Optional[str]) -> Optional[ResponseFormat]:
+    """Select the format of a price data response from the Accept and Accept-Encoding request headers.
+
+    :returns: Response format or None if the client accepts none of the media types.
+    """
+    media_type = negotiate_media_type(accept)
+    if media_type is None:
+        return None
+    return ResponseFormat(media_type, negotiate_encoding(accept_encoding))
+
+
+def render_price_series(data: PriceSeries, response_format: ResponseFormat = ResponseFormat()) -> RenderedResponse:
+    """Serialize price data to a response body in a response format."""
+    parse, serialize = PRICE_DATA_SERIALIZERS[response_format.media_type]
+    with tracing.stage("serialize"):
+        rendered = RenderedResponse(serialize(parse(data)), response_format.media_type)
+    if response_format.encoding is not None:
+        rendered = rendered.compress(response_format.encoding)
+    return rendered
+
+
+def get_rendered_variant(
+    entry: PriceDataCacheEntry, key: tuple, get_data: Callable[[], PriceSeries], response_format: ResponseFormat
+) -> RenderedResponse:
+    """Get a rendered response derived from the price data of a cache entry in a response format.
+
+    Each variant is only rendered on first access. Compressed variants are compressed from the cached
+    uncompressed variant, so the price data is serialized only once per media type.
+
+    :param key: Identifies the response within the cache entry, independent of the response format.
+    :param get_data: Called without arguments to get the price data to render.
+    """
+    derived_key = (*key, response_format.media_type, response_format.encoding)
+
+    def render() -> RenderedResponse:
+        if response_format.encoding is None:
+            return render_price_series(get_data(), response_format)
+        uncompressed = get_rendered_variant(entry, key, get_data, response_format.uncompressed)
+        return uncompressed.compress(response_format.encoding)
+
+    return entry.get_derived(derived_key, render)
+
+
+def get_rendered_price_data(
+    entry: PriceDataCacheEntry, response_format: ResponseFormat = ResponseFormat()
+) -> RenderedResponse:
+    """Get the rendered price data response of a cache entry. It is only rendered on first access."""
+    return get_rendered_variant(entry, ("rendered_price_data",), lambda: entry.data, response_format)
+
+
+def get_max_age(entry: PriceDataCacheEntry) -> int:
+    """Get the number of seconds for which clients can reuse the price data of a cache entry.
+
+    Price data won't change before it's due for update next, which depends on the aWATTar update hour.
+    """
+    max_age = int(entry.next_update_time.int_timestamp - time.time())
+    return max(max_age, 0)
+
+
+def get_cache_control(entry: PriceDataCacheEntry) -> str:
+    """Get the Cache-Control header value allowing clients to reuse the response until it may change."""
+    return f"public, max-age={get_max_age(entry)}"
+
+
+def get_price_data_headers(entry: PriceDataCacheEntry) -> dict[str, str]:
+    """Get the headers of a price data response which don't describe the body.
+
+    Price data which is due for update is marked as stale with the number of seconds since it's due.
+    """
+    headers = {"Cache-Control": get_cache_control(entry), "Vary": NEGOTIATION_VARY}
+    if entry.is_due:
+        headers[defaults.STALE_RESPONSE_HEADER] = str(int(entry.staleness))
+    return headers
+
+
+def check_etag_match(if_none_match: Optional[str], etag: str) -> bool:
+    """Check if the If-None-Match header value of a request matches the entity tag.
+
+    As required for If-None-Match the weak comparison is used.
+    """
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def build_rendered_response(
+    rendered: RenderedResponse, headers: dict[str, str], if_none_match: Optional[str]
+) -> Response:
+    """Build the response for a rendered response body.
+
+    :param headers: Headers to send besides the ones describing the body.
+    :param if_none_match: Value of the If-None-Match request header. If it matches the body a 304 response
+        without body is returned.
+    """
+    headers["ETag"] = rendered.etag
+    if check_etag_match(if_none_match, rendered.etag):
+        return Response(status_code=304, headers=headers)
+    if rendered.encoding is not None:
+        headers["Content-Encoding"] = rendered.encoding
+    return Response(content=rendered.body, media_type=rendered.media_type, headers=headers)
+
+
+def build_price_data_response(
+    entry: PriceDataCacheEntry, if_none_match: Optional[str], response_format: ResponseFormat = ResponseFormat()
+) -> Response:
+    """Build the response for price data.
+
+    :param if_none_match: Value of the If-None-Match request header. If it matches the data a 304 response
+        without body is returned.
+    :param response_format: Negotiated format of the response.
+    """
+    rendered = get_rendered_price_data(entry, response_format)
+    return build_rendered_response(rendered, get_price_data_headers(entry), if_none_match)
+
+
+def get_rendered_price_data_since(
+    entry: PriceDataCacheEntry, index: int, response_format: ResponseFormat = ResponseFormat()
+) -> RenderedResponse:
+    """Get the rendered response with the price points of a cache entry from an index on.
+
+    The response is rendered once per data version, index and response format, so it is shared by all clients
+    holding the same points.
+    """
+    return get_rendered_variant(
+        entry, ("rendered_price_data_since", index), lambda: entry.data.slice(index), response_format
+    )
+
+
+def build_price_data_since_response(
+    entry: PriceDataCacheEntry,
+    since: int,
+    if_none_match: Optional[str],
+    response_format: ResponseFormat = ResponseFormat(),
+) -> Response:
+    """Build the response for the price points starting at or after a timestamp.
+
+    Clients pass the end timestamp of the latest price point they hold to only receive newer points.
+
+    :param response_format: Negotiated format of the response.
+    :returns 304 response: If no price point starts at or after the timestamp, or if the If-None-Match request
+        header matches the data.
+    """
+    index = entry.data.index_since(since)
+    headers = get_price_data_headers(entry)
+    if index == len(entry.data):
+        headers["ETag"] = get_rendered_price_data(entry, response_format).etag
+        return Response(status_code=304, headers=headers)
+
+    rendered = get_rendered_price_data_since(entry, index, response_format)
+    return build_rendered_response(rendered, headers, if_none_match)
+
+
+def build_batch_price_data_response(
+    entries: dict[Region, Optional[PriceDataCacheEntry]], if_none_match: Optional[str]
+) -> Response:
+    """Build the response for the price data of multiple regions.
+
+    The body maps the value of each region to its price data, or null if its price data isn't available. It is
+    assembled from the rendered json responses of the single regions, so no price data is serialized again.
+    Batch responses are always sent as uncompressed verbose json.
+
+    :param if_none_match: Value of the If-None-Match request header. If it matches the data a 304 response
+        without body is returned.
+    """
+    parts = []
+    etags = []
+    for region, entry in entries.items():
+        if entry is None:
+            parts.append(json.dumps(region.value).encode("utf-8") + b":null")
+            etags.append("null")
+            continue
+        rendered = get_rendered_price_data(entry)
+        parts.append(json.dumps(region.value).encode("utf-8") + b":" + rendered.body)
+        etags.append(rendered.etag)
+    body = b"{" + b",".join(parts) + b"}"
+    digest = hashlib.blake2b(",".join(etags).encode("utf-8"), digest_size=16).hexdigest()
+    etag = f'"{digest}"'
+
+    if all(entry is not None for entry in entries.values()):
+        max_ages = [get_max_age(entry) for entry in entries.values()]
+        cache_control = f"public, max-age={min(max_ages, default=0)}"
+    else:
+        # Missing price data may become available any moment.
+        cache_control = "no-cache"
+
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    stale_entries = [entry for entry in entries.values() if entry is not None and entry.is_due]
+    if stale_entries:
+        headers[defaults.STALE_RESPONSE_HEADER] = str(int(max(entry.staleness for entry in stale_entries)))
+    if check_etag_match(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=PRICE_DATA_MEDIA_TYPE, headers=headers)
+
+
+def build_price_range_response(
+    data: PriceSeries, if_none_match: Optional[str], response_format: ResponseFormat = ResponseFormat()
+) -> Response:
+    """Build the response for archived price data of a time range.
+
+    Ranges reaching into the future change as new prices are archived. Clients thus must revalidate the
+    response with its ETag before reusing it. Ranges are arbitrary, so their responses are rendered for each
+    request.
+
+    :param if_none_match: Value of the If-None-Match request header. If it matches the data a 304 response
+        without body is returned.
+    :param response_format: Negotiated format of the response.
+    """
+    rendered = render_price_series(data, response_format)
+    headers = {"Cache-Control": "no-cache", "Vary": NEGOTIATION_VARY}
+    return build_rendered_response(rendered, headers, if_none_match)
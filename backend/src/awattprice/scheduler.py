@@ -0,0 +1,164 @@
+"""Refresh price data in the background on a schedule instead of on the request path.
+
+Each region is polled in its own task. Inside the update window, when aWATTar publishes the prices of the next
+day, regions are polled frequently. Outside of it they are polled rarely, but never later than the time their
+data is due for update. Failed refreshes are retried with an exponential backoff. Polling only downloads if the
+stored data is due, so most polls don't contact aWATTar at all.
+
+Processes which don't refresh watch for new versions of the price data published by the refreshing process.
+"""
+import asyncio
+import random
+
+from typing import Optional
+
+import arrow
+
+from liteconfig import Config
+from loguru import logger
+
+from awattprice import cache
+from awattprice import defaults
+from awattprice import prices
+from awattprice.defaults import Region
+
+
+def get_poll_interval(now_berlin: arrow.Arrow) -> float:
+    """Get the regular interval until the next poll, depending on whether it is inside the update window."""
+    if defaults.AWATTAR_UPDATE_HOUR <= now_berlin.hour < defaults.AWATTAR_UPDATE_WINDOW_END_HOUR:
+        return defaults.REFRESH_WINDOW_POLL_INTERVAL
+    return defaults.REFRESH_IDLE_POLL_INTERVAL
+
+
+def get_backoff_delay(failures: int) -> float:
+    """Get the delay until the next attempt after a number of consecutive failed refreshes."""
+    delay = defaults.REFRESH_BACKOFF_MIN * 2 ** (failures - 1)
+    return min(delay, defaults.REFRESH_BACKOFF_MAX)
+
+
+class PriceRefreshScheduler:
+    """Keep the stored price data of multiple regions up to date in the background."""
+
+    config: Config
+    regions: list[Region]
+
+    _tasks: list[asyncio.Task]
+
+    def __init__(self, config: Config, regions: list[Region]):
+        self.config = config
+        self.regions = regions
+        self._tasks = []
+
+    @property
+    def is_running(self) -> bool:
+        return len(self._tasks) != 0
+
+    def start(self):
+        """Start polling all regions. Must be called from within a running event loop."""
+        if self.is_running:
+            return
+        logger.info(f"Starting background price refresh for {', '.join(region.name for region in self.regions)}.")
+        self._tasks = [asyncio.create_task(self._poll_region(region)) for region in self.regions]
+
+    async def stop(self):
+        """Stop polling and wait until all polling tasks finished."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def refresh_region(self, region: Region) -> bool:
+        """Refresh the price data of a region if it is due.
+
+        :returns: True if the data is up to date afterwards, false if the refresh failed.
+        """
+        entry = await prices.get_cache_entry(region, self.config)
+        if not entry.is_due:
+            return True
+        logger.debug(f"Background refresh of region {region.name}.")
+        await prices.get_latest_new_prices(entry.data, region, self.config)
+        # Downloads which didn't fail always move the time the data is due next into the future.
+        entry = await prices.get_cache_entry(region, self.config)
+        return not entry.is_due
+
+    def get_next_poll_delay(self, region: Region, failures: int) -> float:
+        """Get the delay in seconds until a region should be polled next."""
+        if failures > 0:
+            delay = get_backoff_delay(failures)
+        else:
+            now_berlin = arrow.now(defaults.EUROPE_BERLIN_TIMEZONE)
+            delay = get_poll_interval(now_berlin)
+            entry = cache.get_entry(region)
+            if entry is not None:
+                due_in = entry.next_update_time.int_timestamp - now_berlin.int_timestamp
+                delay = min(delay, max(due_in, 0))
+        return delay + random.uniform(0, defaults.REFRESH_POLL_JITTER)
+
+    async def _poll_region(self, region: Region):
+        """Poll a region until cancelled."""
+        failures = 0
+        while True:
+            try:
+                refreshed = await self.refresh_region(region)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.exception(f"Background refresh of region {region.name} failed: {exc}.")
+                refreshed = False
+
+            if refreshed:
+                failures = 0
+            else:
+                failures += 1
+                logger.warning(f"Background refresh of region {region.name} failed {failures} time(s) in a row.")
+
+            delay = self.get_next_poll_delay(region, failures)
+            logger.debug(f"Polling region {region.name} again in {delay:.0f}s.")
+            await asyncio.sleep(delay)
+
+
+class SnapshotWatcher:
+    """Reload the price data of regions into the cache as soon as another process publishes a new version.
+
+    Requests notice new versions by themselves. Reloading in the background keeps this work off the request path.
+    """
+
+    config: Config
+    regions: list[Region]
+
+    _task: Optional[asyncio.Task]
+
+    def __init__(self, config: Config, regions: list[Region]):
+        self.config = config
+        self.regions = regions
+        self._task = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Start watching. Must be called from within a running event loop."""
+        if self.is_running:
+            return
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        """Stop watching and wait until the watching task finished."""
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def _watch(self):
+        """Check for new versions until cancelled. Cache entries of unchanged regions are returned right away."""
+        while True:
+            for region in self.regions:
+                try:
+                    await prices.get_cache_entry(region, self.config)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    logger.exception(f"Couldn't reload published {region.name} price data: {exc}.")
+            await asyncio.sleep(defaults.PRICE_DATA_VERSION_WATCH_INTERVAL)
@@ -0,0 +1,281 @@
+"""Compact columnar representation of price data."""
+import bisect
+
+from array import array
+from decimal import Decimal
+from typing import Iterable
+from typing import Optional
+from typing import Sequence
+
+import arrow
+
+from arrow import Arrow
+
+from awattprice import defaults
+from awattprice import utils
+from awattprice.defaults import Region
+
+TIMESTAMP_TYPECODE = "q"
+PRICE_TYPECODE = "d"
+
+
+class PriceSeries:
+    """Price points of a region stored as parallel typed arrays.
+
+    Timestamps are stored as epoch seconds. Market prices are stored as euro per MWh exactly as they were
+    received from aWATTar. Helpers which convert prices work on the whole series in one pass.
+
+    Instead of arrays the columns may also be memoryviews, for example on a memory mapped price data file.
+    """
+
+    __slots__ = ("region", "start_timestamps", "end_timestamps", "marketprices")
+
+    region: Region
+    start_timestamps: Sequence[int]
+    end_timestamps: Sequence[int]
+    marketprices: Sequence[float]
+
+    def __init__(
+        self,
+        region: Region,
+        start_timestamps: Sequence[int],
+        end_timestamps: Sequence[int],
+        marketprices: Sequence[float],
+    ):
+        """Constructor for a new price series.
+
+        :param start_timestamps, end_timestamps: Arrays or memoryviews of epoch seconds.
+        :param marketprices: Array or memoryview of prices as euro per MWh.
+        """
+        if not len(start_timestamps) == len(end_timestamps) == len(marketprices):
+            raise ValueError("All columns of a price series must have the same length.")
+        self.region = region
+        self.start_timestamps = start_timestamps
+        self.end_timestamps = end_timestamps
+        self.marketprices = marketprices
+
+    @classmethod
+    def from_columns(
+        cls,
+        region: Region,
+        start_timestamps: Iterable[int],
+        end_timestamps: Iterable[int],
+        marketprices: Iterable[float],
+    ) -> "PriceSeries":
+        """Create a price series from any iterables holding the columns."""
+        return cls(
+            region,
+            array(TIMESTAMP_TYPECODE, start_timestamps),
+            array(TIMESTAMP_TYPECODE, end_timestamps),
+            array(PRICE_TYPECODE, marketprices),
+        )
+
+    @classmethod
+    def empty(cls, region: Region) -> "PriceSeries":
+        """Create a price series without price points."""
+        return cls.from_columns(region, (), (), ())
+
+    def __len__(self) -> int:
+        return len(self.start_timestamps)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PriceSeries):
+            return NotImplemented
+        return (
+            self.region == other.region
+            and self.start_timestamps == other.start_timestamps
+            and self.end_timestamps == other.end_timestamps
+            and self.marketprices == other.marketprices
+        )
+
+    def __repr__(self) -> str:
+        return f"<PriceSeries {self.region.value} with {len(self)} points>"
+
+    def __getstate__(self):
+        # Memoryview columns can't be pickled. Always pickle copies as arrays.
+        return (
+            self.region,
+            array(TIMESTAMP_TYPECODE, self.start_timestamps),
+            array(TIMESTAMP_TYPECODE, self.end_timestamps),
+            array(PRICE_TYPECODE, self.marketprices),
+        )
+
+    def __setstate__(self, state):
+        self.region, self.start_timestamps, self.end_timestamps, self.marketprices = state
+
+    @property
+    def latest_end_timestamp(self) -> Optional[int]:
+        """End timestamp of the latest price point. None if the series is empty."""
+        if len(self) == 0:
+            return None
+        return max(self.end_timestamps)
+
+    @property
+    def resolution(self) -> Optional[int]:
+        """Duration in seconds shared by all price points, e.g. 3600 for hourly or 900 for quarter-hourly prices.
+
+        :returns None: If the series is empty or its price points differ in duration.
+        """
+        if len(self) == 0:
+            return None
+        durations = {end - start for start, end in zip(self.start_timestamps, self.end_timestamps)}
+        if len(durations) != 1:
+            return None
+        return durations.pop()
+
+    def start_time(self, index: int) -> Arrow:
+        """Get the start of a price point as Europe/Berlin time."""
+        return arrow.get(self.start_timestamps[index]).to(defaults.EUROPE_BERLIN_TIMEZONE)
+
+    def end_time(self, index: int) -> Arrow:
+        """Get the end of a price point as Europe/Berlin time."""
+        return arrow.get(self.end_timestamps[index]).to(defaults.EUROPE_BERLIN_TIMEZONE)
+
+    def marketprice(self, index: int) -> Decimal:
+        """Get the exact market price of a price point as euro per MWh."""
+        # The repr of a float is the shortest string which reads back to it. This matches the received value.
+        return Decimal(repr(self.marketprices[index]))
+
+    def select(self, indices: Iterable[int]) -> "PriceSeries":
+        """Get a new price series only containing the price points at the given indices."""
+        indices = list(indices)
+        return PriceSeries.from_columns(
+            self.region,
+            (self.start_timestamps[index] for index in indices),
+            (self.end_timestamps[index] for index in indices),
+            (self.marketprices[index] for index in indices),
+        )
+
+    def slice(self, start: int, stop: Optional[int] = None) -> "PriceSeries":
+        """Get a new price series containing the price points from the start up to the stop index."""
+        return PriceSeries(
+            self.region,
+            self.start_timestamps[start:stop],
+            self.end_timestamps[start:stop],
+            self.marketprices[start:stop],
+        )
+
+    def is_sorted(self) -> bool:
+        """Check if the price points are sorted by their start timestamps."""
+        starts = self.start_timestamps
+        return all(starts[index] <= starts[index + 1] for index in range(len(starts) - 1))
+
+    def sort(self) -> "PriceSeries":
+        """Get the price series with its price points sorted by their start timestamps."""
+        if self.is_sorted():
+            return self
+        return self.select(sorted(range(len(self)), key=self.start_timestamps.__getitem__))
+
+    def aggregate(self, resolution: int) -> "PriceSeries":
+        """Get the price series with price points shorter than a resolution averaged into periods of it.
+
+        Periods are counted from the epoch. Time zone offsets are whole hours, so hourly periods are the hours of
+        local time. The price of a period is the mean of the prices of its points weighted by their duration,
+        rounded half to even to two decimal places like aWATTar sends them. A period only partly covered by price
+        points spans the covered part. Price points which aren't shorter than the resolution are kept.
+
+        The price points must be sorted by their start timestamps, as they are after ingesting them.
+
+        :param resolution: Duration of the periods in seconds.
+        """
+        if all(end - start >= resolution for start, end in zip(self.start_timestamps, self.end_timestamps)):
+            return self
+
+        starts = array(TIMESTAMP_TYPECODE)
+        ends = array(TIMESTAMP_TYPECODE)
+        # Sums of the millicent prices weighted by duration and of the durations of each new price point.
+        weighted_sums = []
+        durations = []
+        period = None
+        for start, end, price in zip(self.start_timestamps, self.end_timestamps, self.millicents()):
+            duration = end - start
+            if duration < resolution and start // resolution == period:
+                ends[-1] = end
+                weighted_sums[-1] += price * duration
+                durations[-1] += duration
+                continue
+            period = start // resolution if duration < resolution else None
+            starts.append(start)
+            ends.append(end)
+            weighted_sums.append(price * duration)
+            durations.append(duration)
+
+        prices = array(
+            PRICE_TYPECODE,
+            (
+                utils.divide_round_half_even(weighted_sum, duration) / defaults.EURMWH_TO_MILLICENTKWH
+                for weighted_sum, duration in zip(weighted_sums, durations)
+            ),
+        )
+        return PriceSeries(self.region, starts, ends, prices)
+
+    def covers(self, start: int, end: int) -> bool:
+        """Check if the price points cover a time range exactly, without gaps or overlaps.
+
+        The price points must be sorted by their start timestamps.
+
+        :param start, end: Epoch seconds. The end is exclusive.
+        """
+        if len(self) == 0:
+            return start == end
+        starts, ends = self.start_timestamps, self.end_timestamps
+        if starts[0] != start or ends[-1] != end:
+            return False
+        return all(ends[index] == starts[index + 1] for index in range(len(self) - 1))
+
+    def index_since(self, timestamp: int) -> int:
+        """Get the index of the first price point starting at or after the timestamp.
+
+        The price points must be sorted by their start timestamps, as they are after ingesting them.
+        """
+        return bisect.bisect_left(self.start_timestamps, timestamp)
+
+    def lowest_index(self) -> Optional[int]:
+        """Get the index of the price point with the lowest market price. None if the series is empty."""
+        if len(self) == 0:
+            return None
+        return min(range(len(self)), key=self.marketprices.__getitem__)
+
+    def decimal_marketprices(self) -> list[Decimal]:
+        """Get all exact market prices as euro per MWh."""
+        return [Decimal(repr(price)) for price in self.marketprices]
+
+    def taxed(self) -> list[Decimal]:
+        """Get all taxed market prices as euro per MWh."""
+        tax = self.region.tax
+        if not tax:
+            return self.decimal_marketprices()
+        return [Decimal(repr(price)) * tax for price in self.marketprices]
+
+    def millicents(self) -> list[int]:
+        """Get all market prices as fixed-point millicent per kWh."""
+        return [utils.euromwh_to_millicents(price) for price in self.marketprices]
+
+    def ct_kwh_millicents(self, taxed: bool = False) -> list[int]:
+        """Get all market prices as cent per kWh rounded naturally, as fixed-point millicents.
+
+        The results are identical to converting and rounding the decimal prices with `ct_kwh`.
+
+        :param taxed: If set convert the taxed prices.
+        """
+        if taxed:
+            numerator, denominator = self.region.tax_ratio
+        else:
+            numerator, denominator = 1, 1
+        return [utils.round_millicents(price * numerator, denominator) for price in self.millicents()]
+
+    def ct_kwh(self, taxed: bool = False, round_: bool = False) -> list[Decimal]:
+        """Get all market prices as cent per kWh.
+
+        The results are identical to converting each price on its own with the MarketPrice helpers.
+
+        :param taxed: If set convert the taxed prices.
+        :param round_: If set round the prices naturally. They are rounded as fixed-point millicents.
+        """
+        if round_:
+            return [utils.millicents_to_ctkwh(price) for price in self.ct_kwh_millicents(taxed)]
+        if taxed:
+            prices = self.taxed()
+        else:
+            prices = self.decimal_marketprices()
+        return [utils.euromwh_to_ctkwh(price) for price in prices]
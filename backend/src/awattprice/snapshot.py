@@ -0,0 +1,95 @@
+"""Publish new versions of the stored price data to all worker processes of the web app.
+
+Price data files are mapped into memory when read, so all workers share the current snapshot of each region
+through the page cache without copying it. What workers need to learn is when a snapshot changes. For this a
+small version board file is mapped into the memory of every process. It holds a generation counter for each
+region, which is incremented whenever files of the region's snapshot are replaced. Checking for a new version is
+a read from the mapping and needs no system call, so it is done on every access of the price data cache.
+
+Writers of the files of a region hold its refresh lock, so the counter of a region is never incremented
+concurrently. A torn read of a counter at worst causes a needless revalidation.
+"""
+import mmap
+import os
+import struct
+
+from pathlib import Path
+
+from liteconfig import Config
+from loguru import logger
+
+from awattprice import defaults
+from awattprice.defaults import Region
+
+GENERATION_STRUCT = struct.Struct("<Q")
+BOARD_SIZE = len(Region) * GENERATION_STRUCT.size
+
+
+class VersionBoard:
+    """Generation counters of the price data of all regions in a memory-mapped file."""
+
+    path: Path
+
+    _mapping: mmap.mmap
+
+    def __init__(self, path: Path):
+        """Open a version board, creating its file if it doesn't exist yet."""
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Growing the file fills it with zeros. Concurrent processes growing it to the same size is harmless.
+            if os.fstat(fd).st_size < BOARD_SIZE:
+                os.ftruncate(fd, BOARD_SIZE)
+            self._mapping = mmap.mmap(fd, BOARD_SIZE, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def get_offset(region: Region) -> int:
+        """Get the offset of the generation counter of a region."""
+        return list(Region).index(region) * GENERATION_STRUCT.size
+
+    def get_generation(self, region: Region) -> int:
+        """Get the current generation of the price data of a region."""
+        return GENERATION_STRUCT.unpack_from(self._mapping, self.get_offset(region))[0]
+
+    def publish(self, region: Region) -> int:
+        """Announce that the price data of a region changed.
+
+        Must be called while holding the refresh lock of the region.
+
+        :returns: The new generation of the region's price data.
+        """
+        generation = self.get_generation(region) + 1
+        GENERATION_STRUCT.pack_into(self._mapping, self.get_offset(region), generation)
+        return generation
+
+
+_boards: dict[Path, VersionBoard] = {}
+
+
+def get_board(config: Config) -> VersionBoard:
+    """Get the version board of the configured price data directory. It is only opened on first access."""
+    path = config.paths.price_data_dir / defaults.PRICE_DATA_VERSION_BOARD_FILE_NAME
+    board = _boards.get(path)
+    if board is None:
+        board = VersionBoard(path)
+        _boards[path] = board
+    return board
+
+
+def get_generation(region: Region, config: Config) -> int:
+    """Get the current generation of the price data of a region."""
+    return get_board(config).get_generation(region)
+
+
+def publish(region: Region, config: Config) -> int:
+    """Announce to all processes that the stored price data of a region changed.
+
+    Must be called while holding the refresh lock of the region after the files were replaced.
+
+    :returns: The new generation of the region's price data.
+    """
+    generation = get_board(config).publish(region)
+    logger.debug(f"Published generation {generation} of the {region.name} price data.")
+    return generation
@@ -0,0 +1,187 @@
+"""Read and write price data files in a versioned binary format.
+
+A price data file starts with a fixed size header followed by fixed width rows. Each row holds the start and
+end timestamp as epoch seconds and the market price as euro per MWh. All values are little endian.
+
+Files are written to a temporary file first and then atomically renamed, so readers never see partially written
+data. Readers map the file into memory and expose the rows without copying them.
+"""
+import mmap
+import os
+import struct
+import sys
+import time
+
+from pathlib import Path
+from typing import Optional
+
+from aiofile import async_open
+
+from awattprice.defaults import Region
+from awattprice.series import PRICE_TYPECODE
+from awattprice.series import TIMESTAMP_TYPECODE
+from awattprice.series import PriceSeries
+
+MAGIC = b"AWPRICES"
+FORMAT_VERSION = 1
+# Magic, format version, header size, region, row size, row count, flags, creation time and the end time of
+# the price data about which notifications were sent last. A notified end time of zero means none is set.
+HEADER_STRUCT = struct.Struct("<8sHH2sHIIqq24x")
+ROW_STRUCT = struct.Struct("<qqd")
+HEADER_SIZE = HEADER_STRUCT.size
+ROW_SIZE = ROW_STRUCT.size
+# Number of values in a row when it is interpreted as a sequence of 8 byte values.
+ROW_VALUES = ROW_SIZE // 8
+
+
+class PriceFileError(Exception):
+    """Raised if a price data file can't be read because it is corrupt or of an unknown format version."""
+
+
+class PriceFileHeader:
+    """Metadata stored at the beginning of a price data file."""
+
+    region: Region
+    row_count: int
+    created_at: int
+    notified_endtime: Optional[int]
+
+    def __init__(self, region: Region, row_count: int, created_at: int, notified_endtime: Optional[int] = None):
+        """Constructor for a new header.
+
+        :param created_at: Epoch seconds at which the file was written.
+        :param notified_endtime: End timestamp in epoch seconds of the price data about which price below
+            notifications were sent last.
+        """
+        self.region = region
+        self.row_count = row_count
+        self.created_at = created_at
+        self.notified_endtime = notified_endtime
+
+    def pack(self) -> bytes:
+        """Serialize the header."""
+        return HEADER_STRUCT.pack(
+            MAGIC,
+            FORMAT_VERSION,
+            HEADER_SIZE,
+            self.region.value.encode("ascii"),
+            ROW_SIZE,
+            self.row_count,
+            0,
+            self.created_at,
+            self.notified_endtime or 0,
+        )
+
+    @classmethod
+    def unpack(cls, buffer) -> "PriceFileHeader":
+        """Deserialize the header from the beginning of a buffer.
+
+        :raises PriceFileError: If the buffer holds no valid header.
+        """
+        if len(buffer) < HEADER_SIZE:
+            raise PriceFileError("Price data file is shorter than its header.")
+        fields = HEADER_STRUCT.unpack_from(buffer)
+        magic, version, header_size, region, row_size, row_count, _, created_at, notified_endtime = fields
+        if magic != MAGIC:
+            raise PriceFileError("Price data file has no valid magic number.")
+        if version != FORMAT_VERSION or header_size != HEADER_SIZE or row_size != ROW_SIZE:
+            raise PriceFileError(f"Price data file has the unsupported format version {version}.")
+        if len(buffer) < HEADER_SIZE + row_count * ROW_SIZE:
+            raise PriceFileError("Price data file is shorter than its header states.")
+        try:
+            region = Region(region.decode("ascii"))
+        except ValueError as exc:
+            raise PriceFileError(f"Price data file has an unknown region {region}.") from exc
+        return cls(region, row_count, created_at, notified_endtime or None)
+
+
+class StoredPriceData:
+    """Price data read from a price data file together with its header."""
+
+    header: PriceFileHeader
+    data: PriceSeries
+
+    def __init__(self, header: PriceFileHeader, data: PriceSeries):
+        self.header = header
+        self.data = data
+
+
+def pack_price_file(data: PriceSeries, notified_endtime: Optional[int] = None) -> bytes:
+    """Serialize price data to the contents of a price data file."""
+    header = PriceFileHeader(data.region, len(data), int(time.time()), notified_endtime)
+    contents = bytearray(HEADER_SIZE + len(data) * ROW_SIZE)
+    contents[:HEADER_SIZE] = header.pack()
+    offset = HEADER_SIZE
+    for row in zip(data.start_timestamps, data.end_timestamps, data.marketprices):
+        ROW_STRUCT.pack_into(contents, offset, *row)
+        offset += ROW_SIZE
+    return bytes(contents)
+
+
+def unpack_price_file(buffer) -> StoredPriceData:
+    """Deserialize the contents of a price data file.
+
+    The columns of the returned price series are views on the buffer. No rows are copied as long as the
+    machine is little endian.
+
+    :raises PriceFileError: If the buffer isn't a valid price data file.
+    """
+    header = PriceFileHeader.unpack(buffer)
+    rows = memoryview(buffer)[HEADER_SIZE : HEADER_SIZE + header.row_count * ROW_SIZE]
+    if sys.byteorder == "little":
+        timestamps = rows.cast(TIMESTAMP_TYPECODE)
+        prices = rows.cast(PRICE_TYPECODE)
+        data = PriceSeries(
+            header.region,
+            timestamps[0::ROW_VALUES],
+            timestamps[1::ROW_VALUES],
+            prices[2::ROW_VALUES],
+        )
+    else:
+        unpacked_rows = list(ROW_STRUCT.iter_unpack(rows))
+        data = PriceSeries.from_columns(
+            header.region,
+            (row[0] for row in unpacked_rows),
+            (row[1] for row in unpacked_rows),
+            (row[2] for row in unpacked_rows),
+        )
+    return StoredPriceData(header, data)
+
+
+def read_price_file(path: Path) -> Optional[StoredPriceData]:
+    """Map a price data file into memory and read it.
+
+    :returns None: If the file doesn't exist or is empty.
+    :raises PriceFileError: If the file isn't a valid price data file.
+    """
+    try:
+        with path.open("rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return None
+            mapped_file = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+    # The mapping stays valid after closing the file. It is released once no view on it is left.
+    return unpack_price_file(mapped_file)
+
+
+async def write_file_atomically(path: Path, contents: bytes):
+    """Atomically write a file.
+
+    The contents are written and flushed to a temporary file in the same directory, which then replaces the
+    file at the path.
+    """
+    temporary_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        async with async_open(temporary_path, "wb") as file:
+            await file.write(contents)
+            await file.flush()
+        os.replace(temporary_path, path)
+    except BaseException:
+        temporary_path.unlink(missing_ok=True)
+        raise
+
+
+async def write_price_file(path: Path, data: PriceSeries, notified_endtime: Optional[int] = None):
+    """Atomically write a price data file."""
+    await write_file_atomically(path, pack_price_file(data, notified_endtime))
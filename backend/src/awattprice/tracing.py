@@ -0,0 +1,238 @@
+"""Trace the stages of single requests and profile the running process on demand.
+
+A trace records how long each stage of handling a request took, e.g. reading the stored price data, downloading
+from aWATTar or serializing the response. Traces are only started for a sample of requests and for requests
+explicitly asking for one, so that other requests only pay a context variable lookup per stage. The active trace
+is kept in a context variable and thus follows the request across awaits.
+
+The sample rate and profiles are switched at runtime by admins. The sample rate is shared by all processes
+through a small memory-mapped file, like the generations of the price data, and applies until it is changed
+again. Profiles only apply to the process receiving the admin request.
+"""
+import asyncio
+import cProfile
+import hmac
+import marshal
+import mmap
+import os
+import random
+import struct
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+
+from liteconfig import Config
+from loguru import logger
+
+from awattprice import defaults
+from awattprice.exceptions import ProfilerBusyError
+
+# Share of requests which are traced.
+SAMPLE_RATE_STRUCT = struct.Struct("<d")
+
+
+class Trace:
+    """Durations of the stages of handling a single request or run."""
+
+    name: str
+    start: float
+    stages: list[tuple[str, float]]
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.stages = []
+
+    @property
+    def duration(self) -> float:
+        """Seconds since the trace started."""
+        return time.perf_counter() - self.start
+
+    def get_server_timing(self) -> str:
+        """Get the stage durations as value of a Server-Timing header. Stages may occur multiple times."""
+        timings = [f"{name};dur={duration * 1000:.3f}" for name, duration in self.stages]
+        timings.append(f"total;dur={self.duration * 1000:.3f}")
+        return ", ".join(timings)
+
+    def log(self):
+        """Log the duration of the trace and its stages. The durations are attached to the log record."""
+        message = f"Trace of {self.name} took {self.duration * 1000:.2f}ms"
+        if self.stages:
+            durations = ", ".join(f"{name} {duration * 1000:.2f}ms" for name, duration in self.stages)
+            message += f" ({durations})"
+        logger.bind(trace=self.stages).info(f"{message}.")
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+class SampleRateBoard:
+    """Sample rate of the traced requests of all processes in a memory-mapped file."""
+
+    path: Path
+
+    _mapping: mmap.mmap
+
+    def __init__(self, path: Path):
+        """Open a sample rate board, creating its file if it doesn't exist yet. New boards trace no requests."""
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Growing the file fills it with zeros. Concurrent processes growing it to the same size is harmless.
+            if os.fstat(fd).st_size < SAMPLE_RATE_STRUCT.size:
+                os.ftruncate(fd, SAMPLE_RATE_STRUCT.size)
+            self._mapping = mmap.mmap(fd, SAMPLE_RATE_STRUCT.size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+
+    @property
+    def sample_rate(self) -> float:
+        """Share of requests which are traced."""
+        return SAMPLE_RATE_STRUCT.unpack_from(self._mapping)[0]
+
+    @sample_rate.setter
+    def sample_rate(self, rate: float):
+        SAMPLE_RATE_STRUCT.pack_into(self._mapping, 0, rate)
+
+
+_boards: dict[Path, SampleRateBoard] = {}
+
+
+def get_board(config: Config) -> SampleRateBoard:
+    """Get the sample rate board of the configured data directory. It is only opened on first access."""
+    path = config.paths.data_dir / defaults.TRACING_SAMPLE_RATE_BOARD_FILE_NAME
+    board = _boards.get(path)
+    if board is None:
+        board = SampleRateBoard(path)
+        _boards[path] = board
+    return board
+
+
+def get_sample_rate(config: Config) -> float:
+    """Get the share of requests which are traced."""
+    return get_board(config).sample_rate
+
+
+def set_sample_rate(rate: float, config: Config):
+    """Set the share of requests which are traced in all processes."""
+    get_board(config).sample_rate = rate
+    logger.info(f"Tracing {rate:.1%} of requests.")
+
+
+def check_sampled(board: SampleRateBoard) -> bool:
+    """Check if a request should be traced by chance."""
+    sample_rate = board.sample_rate
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+@contextmanager
+def trace(name: str) -> Iterator[Trace]:
+    """Trace the stages within the context and log them when it is left."""
+    new_trace = Trace(name)
+    token = _current_trace.set(new_trace)
+    try:
+        yield new_trace
+    finally:
+        _current_trace.reset(token)
+        new_trace.log()
+
+
+def record(name: str, duration: float):
+    """Record the duration of a stage in the active trace. Does nothing if no trace is active."""
+    active_trace = _current_trace.get()
+    if active_trace is not None:
+        active_trace.stages.append((name, duration))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Measure the duration of a stage in the active trace. It is recorded even if the stage raises."""
+    active_trace = _current_trace.get()
+    if active_trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        active_trace.stages.append((name, time.perf_counter() - start))
+
+
+class TracingMiddleware:
+    """Trace a sample of requests and requests of admins asking for a trace.
+
+    Traced responses get a Server-Timing header with the durations of all stages up to the response start.
+    """
+
+    app: Callable[..., Awaitable[Any]]
+    admin_token: bytes
+    board: SampleRateBoard
+
+    def __init__(self, app: Callable[..., Awaitable[Any]], admin_token: str, config: Config):
+        """Constructor for a new tracing middleware.
+
+        :param admin_token: Requests are always traced if their trace header holds this token.
+        :param config: Config locating the sample rate board.
+        """
+        self.app = app
+        self.admin_token = admin_token.encode()
+        self.board = get_board(config)
+
+    def check_requested(self, scope: dict) -> bool:
+        """Check if an admin asked for a trace of a request."""
+        header_name = defaults.TRACE_REQUEST_HEADER.encode()
+        for name, value in scope["headers"]:
+            if name == header_name:
+                return hmac.compare_digest(value, self.admin_token)
+        return False
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope["type"] != "http" or not (check_sampled(self.board) or self.check_requested(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        with trace(f"{scope['method']} {scope['path']}") as request_trace:
+
+            async def send_with_timing(message: dict):
+                if message["type"] == "http.response.start":
+                    server_timing = (b"server-timing", request_trace.get_server_timing().encode("latin-1"))
+                    message = {**message, "headers": [*message.get("headers", []), server_timing]}
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+
+_profiling = False
+
+
+async def profile(duration: float) -> bytes:
+    """Profile the code running on the event loop of this process for some time.
+
+    Only the thread of the event loop is profiled. Other requests continue to be handled while profiling.
+
+    :returns: Profile in the format written by cProfile, which can be loaded with pstats.
+    :raises ProfilerBusyError: If a profile is already being captured in this process.
+    """
+    global _profiling
+    if _profiling:
+        raise ProfilerBusyError()
+    _profiling = True
+    try:
+        logger.info(f"Profiling for {duration}s.")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            profiler.disable()
+        profiler.create_stats()
+        return marshal.dumps(profiler.stats)
+    finally:
+        _profiling = False
@@ -0,0 +1,133 @@
+"""Manage the http client and the sources used to download price data from aWATTar.
+
+Each process uses one long-lived client, so that connections (and their DNS, TCP and TLS setup) are reused across
+downloads. Its pool limits, keep-alive, http/2 usage and timeouts are read from the `[upstream]` config section.
+
+Price data of a region can be downloaded from multiple equivalent sources, like aWATTar and a mirror or caching
+proxy of it. Requests to them are hedged: if a source is slow to answer, the next one is requested as well and the
+first valid answer wins.
+"""
+import asyncio
+import re
+
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from typing import Awaitable
+from typing import Callable
+from typing import Optional
+from typing import Sequence
+from typing import TypeVar
+
+import httpx
+
+from liteconfig import Config
+from loguru import logger
+
+from awattprice.defaults import Region
+
+Result = TypeVar("Result")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def create_client(config: Config) -> httpx.AsyncClient:
+    """Create a new http client configured for upstream requests."""
+    upstream_config = config.upstream
+    limits = httpx.Limits(
+        max_connections=upstream_config.max_connections,
+        max_keepalive_connections=upstream_config.max_keepalive_connections,
+        keepalive_expiry=upstream_config.keepalive_expiry,
+    )
+    timeout = httpx.Timeout(
+        connect=upstream_config.connect_timeout,
+        read=upstream_config.read_timeout,
+        write=upstream_config.write_timeout,
+        pool=upstream_config.pool_timeout,
+    )
+    return httpx.AsyncClient(http2=upstream_config.http2, limits=limits, timeout=timeout)
+
+
+def open_client(config: Config) -> httpx.AsyncClient:
+    """Create the shared client of this process if it doesn't exist yet."""
+    global _client
+    if _client is None:
+        logger.debug("Opening shared upstream http client.")
+        _client = create_client(config)
+    return _client
+
+
+async def close_client():
+    """Close the shared client of this process and its connections."""
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        logger.debug("Closing shared upstream http client.")
+        await client.aclose()
+
+
+@asynccontextmanager
+async def client_session(config: Config) -> AsyncIterator[httpx.AsyncClient]:
+    """Use the shared client or, if none is open, a temporary client which is closed afterwards."""
+    if _client is not None:
+        yield _client
+        return
+    async with create_client(config) as client:
+        yield client
+
+
+def get_sources(region: Region, config: Config) -> list[str]:
+    """Get the urls of the equivalent sources of the price data of a region in the order they are requested.
+
+    These are the `url` of the region's `[awattar.<region>]` config section followed by its `mirrors`.
+    """
+    section_name = f"awattar.{region.value.lower()}"
+    section = getattr(config, section_name)
+    sources = [section.url]
+    if config.has_property("mirrors", section_name):
+        sources.extend(url for url in re.split(r"[\s,]+", section.mirrors) if url)
+    return sources
+
+
+async def hedge(requests: Sequence[Callable[[], Awaitable[Result]]], delay: float) -> tuple[int, Result]:
+    """Run equivalent requests one after another until one of them succeeds.
+
+    The first request is started right away. The next one is started once the delay passed without an answer to
+    the requests started so far, or right away when one of them fails. The first request which succeeds wins and
+    the others are cancelled.
+
+    :param requests: Called without arguments to start each request.
+    :param delay: Seconds to wait for an answer before starting the next request.
+    :returns: Index of the request which succeeded and its result.
+    :raises Exception: Exception of the first request, if all of them failed.
+    """
+    pending: dict[asyncio.Future, int] = {}
+    next_index = 0
+    errors: dict[int, BaseException] = {}
+
+    def start_next():
+        nonlocal next_index
+        pending[asyncio.ensure_future(requests[next_index]())] = next_index
+        next_index += 1
+
+    start_next()
+    try:
+        while pending:
+            timeout = delay if next_index < len(requests) else None
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                logger.debug(f"No answer within {delay}s. Hedging with request {next_index}.")
+                start_next()
+                continue
+            for future in done:
+                index = pending.pop(future)
+                if future.exception() is None:
+                    return index, future.result()
+                errors[index] = future.exception()
+                logger.debug(f"Request {index} failed: {errors[index]}.")
+            if next_index < len(requests):
+                start_next()
+        raise errors[0]
+    finally:
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
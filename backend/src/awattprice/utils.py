@@ -1,36 +1,17 @@
 """Helper functions which don't fit into a bigger category."""
 import asyncio
 
-from contextlib import contextmanager
+from decimal import ROUND_HALF_EVEN
 from decimal import Decimal
 from functools import partial
 from typing import Callable
 from typing import Union
 
-import jsonschema
-
-from box import Box
-from fastapi import HTTPException
-from filelock import FileLock
-from loguru import logger
 from loguru._logger import Logger
 
 from awattprice import defaults
 
 
-class ExtendedFileLock(FileLock):
-    @contextmanager
-    def context(self, acquire=True):
-        """Bettern context manager.
-
-        :param acquire: If true the lock will be acquired on context enter, else won't be acquired.
-        """
-        if acquire:
-            self.acquire()
-        yield
-        self.release()
-
-
 def async_wrap(func: Callable):
     """Wrap a synchronous running function to make it run asynchronous."""
 
@@ -44,17 +25,6 @@ def async_wrap(func: Callable):
     return run
 
 
-def http_exc_validate_json_schema(body: Union[Box, dict, list], schema: dict, http_code: int):
-    """Validate a json body against a schema and throw exception if body doesn't match.
-    :raises HTTPException: with the parsed error code if the body doesn't match the schema.
-    """
-    try:
-        jsonschema.validate(body, schema)
-    except jsonschema.ValidationError as exc:
-        logger.warning(f"Body doesn't match correct schema: {exc}.")
-        raise HTTPException(http_code) from exc
-
-
 def log_attempts(logger: Callable, service_name: str):
     """Before strategy for tenacity to log attempts."""
 
@@ -76,3 +46,55 @@ def round_ctkwh(value: Union[float, Decimal]) -> Union[float, Decimal]:
     """Round ct per kwh to the natual decimal places."""
     rounded_value = round(value, defaults.CENT_KWH_ROUNDING_PLACES)
     return rounded_value
+
+
+def euromwh_to_millicents(value: Union[float, Decimal]) -> int:
+    """Convert euro per mwh to fixed-point millicent per kwh.
+
+    Market prices have at most two decimal places and are converted exactly. More places are rounded half to even.
+    """
+    if isinstance(value, float):
+        # The repr of a float is the shortest string which reads back to it. This matches the received value.
+        value = Decimal(repr(value))
+    return int((value * defaults.EURMWH_TO_MILLICENTKWH).to_integral_value(ROUND_HALF_EVEN))
+
+
+def ctkwh_to_millicents(value: Decimal) -> int:
+    """Convert cent per kwh to fixed-point millicent per kwh.
+
+    Values have at most three decimal places to be converted exactly. More places are rounded half to even.
+    """
+    return int((value * defaults.MILLICENTS_PER_CENT).to_integral_value(ROUND_HALF_EVEN))
+
+
+def millicents_to_ctkwh(value: int) -> Decimal:
+    """Convert fixed-point millicent per kwh to cent per kwh.
+
+    Values are expressed with the natural decimal places of cent per kwh prices or more if needed. The result is
+    identical to adding the rounded decimal prices and fees the values were computed from.
+    """
+    ct_kwh_value = Decimal(value).scaleb(-defaults.MILLICENT_PLACES)
+    if value % defaults.CENT_KWH_ROUNDING_STEP == 0:
+        ct_kwh_value = ct_kwh_value.quantize(Decimal(1).scaleb(-defaults.CENT_KWH_ROUNDING_PLACES))
+    return ct_kwh_value
+
+
+def divide_round_half_even(numerator: int, denominator: int) -> int:
+    """Divide integers and round the quotient half to even, like rounding decimals does by default."""
+    quotient, remainder = divmod(numerator, denominator)
+    twice_remainder = 2 * remainder
+    if twice_remainder > denominator or (twice_remainder == denominator and quotient % 2 == 1):
+        quotient += 1
+    return quotient
+
+
+def round_millicents(numerator: int, denominator: int = 1) -> int:
+    """Round a millicent per kwh price to the natural decimal places of cent per kwh.
+
+    The result is identical to rounding the price as decimal cent per kwh with `round_ctkwh`.
+
+    :param numerator, denominator: Price as fraction of millicents, e.g. with the tax ratio applied. The
+        denominator must be positive.
+    """
+    step = defaults.CENT_KWH_ROUNDING_STEP
+    return divide_round_half_even(numerator, denominator * step) * step
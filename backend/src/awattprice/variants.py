@@ -0,0 +1,190 @@
+"""Compute personalized price variants with tax, base fee and unit applied, as clients display them.
+
+A variant holds the final consumer price of each price point. Prices as cent per kWh are rounded before the base
+fee is added, the way the app and the price below notifications compute them. The rounded cent per kWh prices
+are converted once per data version and tax option, and each variant is computed from them in one pass.
+
+Variants are cache entries of their own which share the timestamps of the price data they were computed from.
+Thus their responses are rendered, negotiated and revalidated like those of the price data. Variants of all
+regions are kept in a least recently used cache bounded by their estimated memory usage.
+
+Price data can also be aggregated to a coarser resolution, e.g. to serve hourly prices to clients which don't
+handle quarter-hourly ones. Aggregated price data is an entry of its own as well and is personalized like the
+price data.
+"""
+from array import array
+from collections import OrderedDict
+from typing import Optional
+
+from awattprice import defaults
+from awattprice import tracing
+from awattprice.cache import PriceDataCacheEntry
+from awattprice.defaults import PriceUnit
+from awattprice.defaults import Region
+from awattprice.responses import RenderedResponse
+from awattprice.series import PRICE_TYPECODE
+from awattprice.series import PriceSeries
+
+VariantKey = tuple[Region, int, bool, int, PriceUnit]
+
+
+def check_personalized(taxed: bool, base_fee: int, unit: PriceUnit) -> bool:
+    """Check if the options personalize prices or if they leave the market prices unchanged."""
+    return taxed or base_fee != 0 or unit != PriceUnit.EUR_MWH
+
+
+def get_consumer_prices(
+    data: PriceSeries,
+    taxed: bool,
+    base_fee: int,
+    unit: PriceUnit,
+    ct_kwh_prices: Optional[list[int]] = None,
+) -> list[float]:
+    """Get the final consumer price of each price point.
+
+    Prices are computed as fixed-point millicents and only divided into the unit at the end. The division is
+    correctly rounded, so the results are identical to converting exact decimal prices to floats.
+
+    :param taxed: If set tax the prices.
+    :param base_fee: Fee as fixed-point millicent per kWh added to each price.
+    :param unit: Unit of the prices. Prices as cent per kWh are rounded before adding the base fee.
+    :param ct_kwh_prices: Rounded cent per kWh prices as millicents of the data with the same tax option, if
+        already known.
+    """
+    if unit == PriceUnit.CT_KWH:
+        if ct_kwh_prices is None:
+            ct_kwh_prices = data.ct_kwh_millicents(taxed)
+        return [(base_fee + price) / defaults.MILLICENTS_PER_CENT for price in ct_kwh_prices]
+
+    if taxed:
+        numerator, denominator = data.region.tax_ratio
+    else:
+        numerator, denominator = 1, 1
+    base_fee *= denominator
+    divisor = denominator * defaults.EURMWH_TO_MILLICENTKWH
+    return [(base_fee + price * numerator) / divisor for price in data.millicents()]
+
+
+def personalize(
+    data: PriceSeries,
+    taxed: bool,
+    base_fee: int,
+    unit: PriceUnit,
+    ct_kwh_prices: Optional[list[int]] = None,
+) -> PriceSeries:
+    """Get price data holding the final consumer prices instead of the market prices.
+
+    The returned price series shares the timestamp columns with the price data.
+    """
+    prices = get_consumer_prices(data, taxed, base_fee, unit, ct_kwh_prices)
+    return PriceSeries(data.region, data.start_timestamps, data.end_timestamps, array(PRICE_TYPECODE, prices))
+
+
+def get_ct_kwh_prices(entry: PriceDataCacheEntry, taxed: bool) -> list[int]:
+    """Get the rounded cent per kWh prices of a cache entry as millicents. They are only converted once per tax
+    option.
+    """
+    return entry.get_derived(("ct_kwh_millicents", taxed), lambda: entry.data.ct_kwh_millicents(taxed))
+
+
+def create_variant(entry: PriceDataCacheEntry, taxed: bool, base_fee: int, unit: PriceUnit) -> PriceDataCacheEntry:
+    """Create the cache entry of a variant of the price data of a cache entry."""
+    if unit == PriceUnit.CT_KWH:
+        ct_kwh_prices = get_ct_kwh_prices(entry, taxed)
+    else:
+        ct_kwh_prices = None
+    return entry.derive(personalize(entry.data, taxed, base_fee, unit, ct_kwh_prices))
+
+
+def get_aggregated(entry: PriceDataCacheEntry, resolution: int) -> PriceDataCacheEntry:
+    """Get the cache entry of the price data of a cache entry aggregated to a resolution. It is only aggregated
+    once per data version.
+
+    :param resolution: Resolution in seconds. Price points which aren't shorter are kept as they are.
+    """
+    aggregated = entry.get_derived(
+        ("aggregated", resolution), lambda: entry.derive(entry.data.aggregate(resolution))
+    )
+    # Polling aWATTar without getting new prices only moves the time the data is due next.
+    aggregated.next_update_time = entry.next_update_time
+    return aggregated
+
+
+def estimate_size(variant: PriceDataCacheEntry) -> int:
+    """Estimate the number of bytes taken by a variant and the responses rendered from it."""
+    size = len(variant.data) * variant.data.marketprices.itemsize
+    for value in variant.derived.values():
+        if isinstance(value, RenderedResponse):
+            size += len(value.body)
+    return size
+
+
+class PriceVariantCache:
+    """Least recently used cache of price variants bounded by their estimated memory usage."""
+
+    max_size: int
+
+    # Variants with the version of the price data they were computed from, in the order they were used.
+    _variants: OrderedDict[VariantKey, tuple[int, PriceDataCacheEntry]]
+    _sizes: dict[VariantKey, int]
+    _size: int
+
+    def __init__(self, max_size: int = defaults.PRICE_VARIANT_CACHE_MAX_BYTES):
+        """Constructor for a new variant cache.
+
+        :param max_size: Maximal estimated number of bytes taken by all variants. The most recently used variant
+            is always kept.
+        """
+        self.max_size = max_size
+        self._variants = OrderedDict()
+        self._sizes = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._variants)
+
+    @property
+    def size(self) -> int:
+        """Estimated number of bytes taken by all variants as of their last use."""
+        return self._size
+
+    def get(
+        self, entry: PriceDataCacheEntry, taxed: bool, base_fee: int, unit: PriceUnit, resolution: int = 0
+    ) -> PriceDataCacheEntry:
+        """Get a variant of the price data of a cache entry, computing it if it isn't cached.
+
+        Variants computed from a previous version of the price data are computed again.
+
+        :param resolution: Resolution the price data of the entry was aggregated to. 0 if it wasn't aggregated.
+        """
+        key: VariantKey = (entry.data.region, resolution, taxed, base_fee, unit)
+        cached = self._variants.get(key)
+        if cached is not None and cached[0] == entry.version:
+            self._variants.move_to_end(key)
+            variant = cached[1]
+            # Polling aWATTar without getting new prices only moves the time the data is due next.
+            variant.next_update_time = entry.next_update_time
+            return variant
+
+        with tracing.stage("personalize"):
+            variant = create_variant(entry, taxed, base_fee, unit)
+        self._variants[key] = (entry.version, variant)
+        self._variants.move_to_end(key)
+        self._sizes.setdefault(key, 0)
+        return variant
+
+    def trim(self):
+        """Account for the responses rendered from the most recently used variant and evict variants if needed."""
+        if not self._variants:
+            return
+        key = next(reversed(self._variants))
+        size = estimate_size(self._variants[key][1])
+        self._size += size - self._sizes[key]
+        self._sizes[key] = size
+
+        while self._size > self.max_size and len(self._variants) > 1:
+            evicted_key, _ = self._variants.popitem(last=False)
+            self._size -= self._sizes.pop(evicted_key)
+
+
+cache = PriceVariantCache()
@@ -0,0 +1,141 @@
+"""Encode response data in the binary formats offered to clients besides json.
+
+Response data only consists of dicts with string keys, lists, strings, integers, floats, booleans and None.
+The encoders support exactly these types, so no further dependencies are needed. Floats are always encoded
+with double precision to keep prices exact.
+"""
+import struct
+
+from typing import Any
+from typing import Callable
+
+
+def _pack_msgpack(value: Any, write: Callable[[bytes], Any]):
+    """Append the MessagePack encoding of a value."""
+    if value is None:
+        write(b"\xc0")
+    elif value is True:
+        write(b"\xc3")
+    elif value is False:
+        write(b"\xc2")
+    elif isinstance(value, int):
+        if 0 <= value < 0x80 or -0x20 <= value < 0:
+            write(struct.pack(">b", value) if value < 0 else struct.pack(">B", value))
+        elif 0 <= value <= 0xFF:
+            write(struct.pack(">BB", 0xCC, value))
+        elif 0 <= value <= 0xFFFF:
+            write(struct.pack(">BH", 0xCD, value))
+        elif 0 <= value <= 0xFFFFFFFF:
+            write(struct.pack(">BI", 0xCE, value))
+        elif 0 <= value <= 0xFFFFFFFFFFFFFFFF:
+            write(struct.pack(">BQ", 0xCF, value))
+        elif -0x80 <= value < 0:
+            write(struct.pack(">Bb", 0xD0, value))
+        elif -0x8000 <= value < 0:
+            write(struct.pack(">Bh", 0xD1, value))
+        elif -0x80000000 <= value < 0:
+            write(struct.pack(">Bi", 0xD2, value))
+        elif -0x8000000000000000 <= value < 0:
+            write(struct.pack(">Bq", 0xD3, value))
+        else:
+            raise OverflowError(f"Integer {value} is too large for MessagePack.")
+    elif isinstance(value, float):
+        write(struct.pack(">Bd", 0xCB, value))
+    elif isinstance(value, str):
+        encoded = value.encode("utf-8")
+        length = len(encoded)
+        if length < 0x20:
+            write(struct.pack(">B", 0xA0 | length))
+        elif length <= 0xFF:
+            write(struct.pack(">BB", 0xD9, length))
+        elif length <= 0xFFFF:
+            write(struct.pack(">BH", 0xDA, length))
+        else:
+            write(struct.pack(">BI", 0xDB, length))
+        write(encoded)
+    elif isinstance(value, (list, tuple)):
+        length = len(value)
+        if length < 0x10:
+            write(struct.pack(">B", 0x90 | length))
+        elif length <= 0xFFFF:
+            write(struct.pack(">BH", 0xDC, length))
+        else:
+            write(struct.pack(">BI", 0xDD, length))
+        for item in value:
+            _pack_msgpack(item, write)
+    elif isinstance(value, dict):
+        length = len(value)
+        if length < 0x10:
+            write(struct.pack(">B", 0x80 | length))
+        elif length <= 0xFFFF:
+            write(struct.pack(">BH", 0xDE, length))
+        else:
+            write(struct.pack(">BI", 0xDF, length))
+        for key, item in value.items():
+            _pack_msgpack(key, write)
+            _pack_msgpack(item, write)
+    else:
+        raise TypeError(f"Can't encode {type(value).__name__} as MessagePack.")
+
+
+def encode_msgpack(value: Any) -> bytes:
+    """Encode response data as MessagePack."""
+    parts = []
+    _pack_msgpack(value, parts.append)
+    return b"".join(parts)
+
+
+def _pack_cbor_head(major_type: int, argument: int, write: Callable[[bytes], Any]):
+    """Append the head of a CBOR data item with the smallest possible argument encoding."""
+    initial = major_type << 5
+    if argument < 24:
+        write(struct.pack(">B", initial | argument))
+    elif argument <= 0xFF:
+        write(struct.pack(">BB", initial | 24, argument))
+    elif argument <= 0xFFFF:
+        write(struct.pack(">BH", initial | 25, argument))
+    elif argument <= 0xFFFFFFFF:
+        write(struct.pack(">BI", initial | 26, argument))
+    elif argument <= 0xFFFFFFFFFFFFFFFF:
+        write(struct.pack(">BQ", initial | 27, argument))
+    else:
+        raise OverflowError(f"Integer {argument} is too large for CBOR.")
+
+
+def _pack_cbor(value: Any, write: Callable[[bytes], Any]):
+    """Append the CBOR encoding of a value."""
+    if value is None:
+        write(b"\xf6")
+    elif value is True:
+        write(b"\xf5")
+    elif value is False:
+        write(b"\xf4")
+    elif isinstance(value, int):
+        if value >= 0:
+            _pack_cbor_head(0, value, write)
+        else:
+            _pack_cbor_head(1, -1 - value, write)
+    elif isinstance(value, float):
+        write(struct.pack(">Bd", 0xFB, value))
+    elif isinstance(value, str):
+        encoded = value.encode("utf-8")
+        _pack_cbor_head(3, len(encoded), write)
+        write(encoded)
+    elif isinstance(value, (list, tuple)):
+        _pack_cbor_head(4, len(value), write)
+        for item in value:
+            _pack_cbor(item, write)
+    elif isinstance(value, dict):
+        _pack_cbor_head(5, len(value), write)
+        for key, item in value.items():
+            _pack_cbor(key, write)
+            _pack_cbor(item, write)
+    else:
+        raise TypeError(f"Can't encode {type(value).__name__} as CBOR.")
+
+
+def encode_cbor(value: Any) -> bytes:
+    """Encode response data as CBOR."""
+    parts = []
+    _pack_cbor(value, parts.append)
+    return b"".join(parts)
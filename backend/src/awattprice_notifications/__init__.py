@@ -1,4 +1,23 @@
-from . import apns
-from . import defaults
-from . import notifications
-from . import utils
+"""Send notifications to users of AWattPrice.
+
+Submodules are imported on first access, like those of the awattprice package.
+"""
+import importlib
+
+_SUBMODULES = (
+    "apns",
+    "defaults",
+    "notifications",
+    "utils",
+)
+
+
+def __getattr__(name: str):
+    """Import a submodule on its first access."""
+    if name in _SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *_SUBMODULES])
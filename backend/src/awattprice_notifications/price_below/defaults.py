@@ -6,13 +6,20 @@ import awattprice
 
 from arrow import Arrow
 from awattprice.defaults import Region
+from awattprice.series import PriceSeries
 from box import Box
 from loguru import logger
 
 # Regions for which to send price below notifications.
 REGIONS_TO_SEND = [Region.DE, Region.AT]
 
-LAST_UPDATED_ENDTIME_FILE_NAME = "last-updated-{}-endtime.pickle"
+# Resolution in seconds at which prices are compared and notified about. Shorter price points, like quarter-hourly
+# prices, are averaged to it because the notification texts of the app speak of hours. 0 notifies about the price
+# points as received from aWATTar.
+NOTIFICATION_RESOLUTION = 3600
+
+# Name of the pickle file which stored the last updated end time before it moved to the price data file header.
+LEGACY_LAST_UPDATED_ENDTIME_FILE_NAME = "last-updated-{}-endtime.pickle"
 
 NOTIFICATION = Box(
     {
@@ -29,27 +36,27 @@ NOTIFICATION = Box(
 )
 
 
-def get_notifiable_prices(price_data: Box) -> Optional[list[Box]]:
-    """Get the prices about which users should be notified."""
-    selected_prices = []
+def get_notifiable_prices(price_data: PriceSeries) -> Optional[PriceSeries]:
+    """Get the prices about which users should be notified.
 
+    These are the prices of the following day. They are only notifiable if their price points cover the whole day,
+    whatever their resolution. They are aggregated to the notification resolution.
+    """
     now_berlin = arrow.now(awattprice.defaults.EUROPE_BERLIN_TIMEZONE)
     # Note: Time range must not exceed 24 hours.
-    berlin_tomorrow_start = now_berlin.floor("day").shift(days=+1)
-    berlin_tomorrow_end = berlin_tomorrow_start.shift(days=+1)
-
-    for price_point in price_data:
-        if (
-            price_point.start_timestamp >= berlin_tomorrow_start
-            and price_point.end_timestamp <= berlin_tomorrow_end
-        ):
-            selected_prices.append(price_point)
-
-    if not len(selected_prices) == 24:
-        logger.debug(f"Length of selected prices isn't equal to 24: {len(selected_prices)}.")
+    berlin_tomorrow_start = now_berlin.floor("day").shift(days=+1).int_timestamp
+    berlin_tomorrow_end = now_berlin.floor("day").shift(days=+2).int_timestamp
+
+    tomorrow_prices = price_data.slice(
+        price_data.index_since(berlin_tomorrow_start), price_data.index_since(berlin_tomorrow_end)
+    )
+    if not tomorrow_prices.covers(berlin_tomorrow_start, berlin_tomorrow_end):
+        logger.debug(f"Selected {len(tomorrow_prices)} prices don't cover the whole following day.")
         return None
 
-    return selected_prices
+    if NOTIFICATION_RESOLUTION:
+        tomorrow_prices = tomorrow_prices.aggregate(NOTIFICATION_RESOLUTION)
+    return tomorrow_prices
 
 
 def check_region_updated(stored_endtime: Optional[Arrow], new_endtime: Arrow) -> bool:
@@ -7,6 +7,8 @@ import httpx
 
 from awattprice.defaults import Region
 from awattprice.orm import Token
+from awattprice.series import PriceSeries
+from awattprice.utils import millicents_to_ctkwh
 from awattprice.utils import round_ctkwh
 from box import Box
 from decimal import Decimal
@@ -25,9 +27,9 @@ from awattprice_notifications.price_below import defaults
 from awattprice_notifications.price_below.prices import NotifiableDetailedPriceData
 
 
-def construct_notification_headers(apns_authorization: str, prices_below: list[Box], use_sandbox: bool) -> Box:
+def construct_notification_headers(apns_authorization: str, prices_below: PriceSeries, use_sandbox: bool) -> Box:
     """Construct the headers for a token when sending a price below notification."""
-    latest_price_below = max(prices_below, key=lambda price_point: price_point.start_timestamp)
+    latest_price_below_start = max(prices_below.start_timestamps)
 
     headers = Box()
     headers["authorization"] = f"bearer {apns_authorization}"
@@ -38,17 +40,17 @@ def construct_notification_headers(apns_authorization: str, prices_below: list[B
         headers["apns-topic"] = awattprice.defaults.APP_BUNDLE_ID.production
     else:
         headers["apns-topic"] = awattprice.defaults.APP_BUNDLE_ID.staging
-    headers["apns-expiration"] = str(latest_price_below.start_timestamp.int_timestamp)
+    headers["apns-expiration"] = str(latest_price_below_start)
 
     return headers
 
 
 def construct_notification(
-    token: Token, prices_below: list[Box], notifiable_prices: NotifiableDetailedPriceData
+    token: Token, prices_below: PriceSeries, notifiable_prices: NotifiableDetailedPriceData
 ) -> Box:
     """Construct the notification for a token.
 
-    :param prices_below: List of prices considered below the value. They must all are present in the detailed prices.
+    :param prices_below: Prices considered below the value. They must all are present in the detailed prices.
         This list is not allowed to be empty.
     """
     prices_below_length = len(prices_below)
@@ -63,9 +65,14 @@ def construct_notification(
     below_value_str = below_value_str.replace(".", ",")
 
     lowest_price = notifiable_prices.lowest_price
-    lowest_price_start_str = lowest_price.start_timestamp.format("H")
+    if lowest_price.start_timestamp.minute == 0:
+        lowest_price_start_str = lowest_price.start_timestamp.format("H")
+    else:
+        lowest_price_start_str = lowest_price.start_timestamp.format("H:mm")
     lowest_marketprice = lowest_price.marketprice
-    lowest_marketprice_value = token.base_fee+lowest_price.marketprice.ct_kwh(taxed=token.tax, round_=True)
+    lowest_marketprice_value = millicents_to_ctkwh(
+        token.base_fee + lowest_marketprice.ct_kwh_millicents(taxed=token.tax)
+    )
     lowest_marketprice_value_str = awattprice_notifications.utils.stringify_price(
         lowest_marketprice_value, lowest_marketprice.region
     )
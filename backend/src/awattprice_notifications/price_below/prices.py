@@ -1,16 +1,19 @@
 """Manage and handle price data fron the main awattprice package."""
 import asyncio
+import bisect
 import pickle
 import sys
 
 from decimal import Decimal
 from typing import Optional
 
+import arrow
 import awattprice
 
 from aiofile import async_open
 from arrow import Arrow
 from awattprice.defaults import Region
+from awattprice.series import PriceSeries
 from box import Box
 from liteconfig import Config
 from loguru import logger
@@ -22,38 +25,82 @@ from awattprice_notifications.price_below.defaults import check_region_updated,
 class DetailedPriceData:
     """Describes price data in a detailed manner."""
 
-    data: Box
+    data: PriceSeries
 
     lowest_price: Optional[Box] = None
 
-    def __init__(self, data: Box):
+    # Rounded cent per kWh prices as fixed-point millicents for each tax option.
+    _ct_kwh_prices: dict[bool, list[int]]
+    # Final consumer prices as millicents for each tax option and base fee.
+    _consumer_prices: dict[tuple[bool, int], list[int]]
+    # Final consumer prices sorted ascending and the indices of the sorted prices, for each tax option and base
+    # fee.
+    _sorted_consumer_prices: dict[tuple[bool, int], tuple[list[int], list[int]]]
+
+    def __init__(self, data: PriceSeries):
         self.data = data
+        self._ct_kwh_prices = {}
+        self._consumer_prices = {}
+        self._sorted_consumer_prices = {}
 
     def find_lowest_price(self):
         """Find the lowest price."""
-        lowest_price = min(self.data.prices, key=lambda price_point: price_point.marketprice.value)
-        self.lowest_price = lowest_price
+        lowest_index = self.data.lowest_index()
+        self.lowest_price = awattprice.prices.get_price_point(self.data, lowest_index)
+
+    def get_ct_kwh_prices(self, taxed: bool) -> list[int]:
+        """Get the rounded prices as cent per kWh in millicents.
+
+        They are only converted once for each tax option.
+        """
+        if taxed not in self._ct_kwh_prices:
+            self._ct_kwh_prices[taxed] = self.data.ct_kwh_millicents(taxed)
+        return self._ct_kwh_prices[taxed]
+
+    def get_consumer_prices(self, taxed: bool, base_fee: int) -> list[int]:
+        """Get the final consumer prices as cent per kWh in millicents. They are only computed once for all tokens
+        sharing the tax option and base fee.
 
-    def get_prices_below_value(self, below_value: int, base_fee: float, taxed: bool) -> list[int]:
+        :param base_fee: Fee as millicent per kWh.
+        """
+        key = (taxed, base_fee)
+        if key not in self._consumer_prices:
+            self._consumer_prices[key] = [base_fee + price for price in self.get_ct_kwh_prices(taxed)]
+        return self._consumer_prices[key]
+
+    def get_sorted_consumer_prices(self, taxed: bool, base_fee: int) -> tuple[list[int], list[int]]:
+        """Get the final consumer prices sorted ascending and the index of each sorted price. They are only sorted
+        once for all tokens sharing the tax option and base fee.
+
+        :param base_fee: Fee as millicent per kWh.
+        """
+        key = (taxed, base_fee)
+        if key not in self._sorted_consumer_prices:
+            consumer_prices = self.get_consumer_prices(taxed, base_fee)
+            indices = sorted(range(len(consumer_prices)), key=consumer_prices.__getitem__)
+            self._sorted_consumer_prices[key] = ([consumer_prices[index] for index in indices], indices)
+        return self._sorted_consumer_prices[key]
+
+    def get_prices_below_value(self, below_value: int, base_fee: int, taxed: bool) -> PriceSeries:
         """Get prices which are on or below the given value.
 
+        The prices are found with a binary search over the sorted prices, so the time taken for each token doesn't
+        grow with the number of price points but with the number of prices found.
+
+        :param below_value: Value as whole cent per kWh.
+        :param base_fee: Fee as millicent per kWh.
         :param taxed: If true prices are taxed before comparing to the below value. This doesn't affect the
             below value.
         """
-        below_value_prices = []
-        for price_point in self.data.prices:
-            marketprice = base_fee+price_point.marketprice.ct_kwh(taxed=taxed, round_=True)
-            if marketprice <= below_value:
-                below_value_prices.append(price_point)
-        return below_value_prices
+        sorted_prices, indices = self.get_sorted_consumer_prices(taxed, base_fee)
+        below_value = below_value * awattprice.defaults.MILLICENTS_PER_CENT
+        below_value_count = bisect.bisect_right(sorted_prices, below_value)
+        return self.data.select(sorted(indices[:below_value_count]))
 
 
 class NotifiableDetailedPriceData(DetailedPriceData):
     """Holds price data about which users should be notified for."""
 
-    def __init__(self, notifiable_data: Box):
-        self.data = notifiable_data
-
 
 async def collect_regions_prices(config: Config, regions: list[Region]) -> Box:
     """Get the current prices for multiple regions."""
@@ -70,9 +117,9 @@ async def collect_regions_prices(config: Config, regions: list[Region]) -> Box:
     return existing_regions_prices
 
 
-async def read_last_updated_endtime(config: Config, region: Region) -> Optional[Arrow]:
-    """Get the end time of the latest price point when the price data was updated last for the certain region."""
-    file_name = defaults.LAST_UPDATED_ENDTIME_FILE_NAME.format(region.name.lower())
+async def read_legacy_last_updated_endtime(config: Config, region: Region) -> Optional[Arrow]:
+    """Get the last updated end time from the pickle file it was stored in before the price data file header."""
+    file_name = defaults.LEGACY_LAST_UPDATED_ENDTIME_FILE_NAME.format(region.name.lower())
     file_path = config.paths.price_data_dir / file_name
     try:
         async with async_open(file_path, "rb") as file:
@@ -85,13 +132,25 @@ async def read_last_updated_endtime(config: Config, region: Region) -> Optional[
     return time
 
 
-def get_current_endtime(prices: Box) -> Arrow:
-    latest_price_point = max(prices.prices, key=lambda price_point: price_point.end_timestamp)
-    current_endtime = latest_price_point.end_timestamp
+async def read_last_updated_endtime(config: Config, region: Region) -> Optional[Arrow]:
+    """Get the end time of the latest price point when the price data was updated last for the certain region.
+
+    It is stored in the header of the region's price data file.
+    """
+    notified_endtime = await awattprice.prices.get_notified_endtime(region, config)
+    if notified_endtime is None:
+        return await read_legacy_last_updated_endtime(config, region)
+
+    time = arrow.get(notified_endtime).to(awattprice.defaults.EUROPE_BERLIN_TIMEZONE)
+    return time
+
+
+def get_current_endtime(prices: PriceSeries) -> Arrow:
+    current_endtime = awattprice.prices.get_latest_end_timestamp(prices)
     return current_endtime
 
 
-async def get_updated_regions(config: Config, regions_prices: Box[Region, Box]) -> list:
+async def get_updated_regions(config: Config, regions_prices: Box[Region, PriceSeries]) -> list:
     """Get the regions of which their prices updated relative to the last time they updated."""
     regions = regions_prices.keys()
     prices = regions_prices.values()
@@ -118,7 +177,7 @@ async def get_updated_regions(config: Config, regions_prices: Box[Region, Box])
 
 
 async def write_updated_regions_endtimes(
-    config: Config, regions_prices: Box[Region, Box], updated_regions: [Region]
+    config: Config, regions_prices: Box[Region, PriceSeries], updated_regions: [Region]
 ):
     """Write the endtimes for the regions which got updated.
 
@@ -127,13 +186,9 @@ async def write_updated_regions_endtimes(
     for region in updated_regions:
         prices = regions_prices[region]
         endtime = get_current_endtime(prices)
-        pickled_endtime = pickle.dumps(endtime)
 
-        file_name = defaults.LAST_UPDATED_ENDTIME_FILE_NAME.format(region.name.lower())
-        file_path = config.paths.price_data_dir / file_name
         try:
-            async with async_open(file_path, "wb") as file:
-                await file.write(pickled_endtime)
+            await awattprice.prices.store_notified_endtime(region, config, endtime.int_timestamp)
             logger.debug(f"Wrote new endtime for region {region}.")
         except Exception as exc:
             logger.exception(f"Couldn't write endtime for region {region.name.lower()}: {exc}.")
@@ -143,13 +198,11 @@ def get_notifiable_regions_prices(regions_prices: Box) -> Box[Region, Notifiable
     """Get the prices for which users should be notified for."""
     notifiable_regions_prices = Box()
     for region, prices_data in regions_prices.items():
-        notifiable_prices_data = prices_data
-        notifiable_prices = get_notifiable_prices(prices_data.prices)
+        notifiable_prices = get_notifiable_prices(prices_data)
         if notifiable_prices is None:
             logger.debug(f"No notifiable prices for region {region}.")
             continue
-        notifiable_prices_data.prices = notifiable_prices
-        notifiable_detailed_prices = NotifiableDetailedPriceData(notifiable_prices_data)
+        notifiable_detailed_prices = NotifiableDetailedPriceData(notifiable_prices)
         notifiable_regions_prices[region] = notifiable_detailed_prices
 
     return notifiable_regions_prices
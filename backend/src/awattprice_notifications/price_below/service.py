@@ -2,13 +2,23 @@
 
 See 'notifications.price_below.service.md' doc for description of this service.
 """
+import argparse
 import asyncio
+import cProfile
 import sys
 
+from contextlib import nullcontext
+from typing import Optional
+
 from awattprice import configurator
 from awattprice import database
+from awattprice import tracing
+from awattprice import upstream
 from awattprice.defaults import Region
+from awattprice.exceptions import DatabaseNotMigratedError
+from liteconfig import Config
 from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncEngine
 
 import awattprice_notifications
 
@@ -18,8 +28,11 @@ from awattprice_notifications.price_below import prices
 from awattprice_notifications.price_below import tokens
 
 
-async def main():
-    """Run steps to send price below notifications to users."""
+async def main(trace: bool = False):
+    """Run steps to send price below notifications to users.
+
+    :param trace: If set log the duration of each stage of the run.
+    """
     config = configurator.get_config()
     price_below_service_name = awattprice_notifications.defaults.PRICE_BELOW_SERVICE_NAME
     configurator.configure_loguru(price_below_service_name, config)
@@ -29,34 +42,72 @@ async def main():
     except FileNotFoundError as exc:
         logger.exception(exc)
         sys.exit(1)
+    try:
+        await database.check_migrated_async(engine)
+    except DatabaseNotMigratedError as exc:
+        logger.exception(exc)
+        await engine.dispose()
+        sys.exit(1)
+
+    upstream.open_client(config)
+    try:
+        with tracing.trace(price_below_service_name) if trace else nullcontext():
+            await send_price_below_notifications(config, engine)
+    finally:
+        await upstream.close_client()
+
 
-    regions_prices = await prices.collect_regions_prices(config, defaults.REGIONS_TO_SEND)
+async def send_price_below_notifications(config: Config, engine: AsyncEngine):
+    """Send price below notifications for all regions of which the prices updated since the last run."""
+    with tracing.stage("collect_prices"):
+        regions_prices = await prices.collect_regions_prices(config, defaults.REGIONS_TO_SEND)
     if len(regions_prices) == 0:
         logger.warning("No current price data for all checked regions.")
-        sys.exit(0)
+        return
 
     updated_regions = await prices.get_updated_regions(config, regions_prices)
     if not updated_regions:
         logger.debug("Aborting as there are currently no regions which updated relative to the last run.")
-        sys.exit(0)
+        return
 
     notifiable_regions_prices = prices.get_notifiable_regions_prices(regions_prices)
     if len(notifiable_regions_prices) == 0:
         logger.debug("No notifiable prices for all checked regions.")
-        sys.exit(0)
+        return
     for notifiable_prices in notifiable_regions_prices.values():
         notifiable_prices.find_lowest_price()
 
     updated_notifiable_regions_prices = {region: notifiable_regions_prices[region] for region in updated_regions}
 
-    applying_regions_tokens = await tokens.collect_applying_tokens(engine, updated_notifiable_regions_prices)
+    with tracing.stage("collect_tokens"):
+        applying_regions_tokens = await tokens.collect_applying_tokens(engine, updated_notifiable_regions_prices)
 
-    await notifications.deliver_notifications(
-        engine, config, applying_regions_tokens, updated_notifiable_regions_prices
-    )
+    with tracing.stage("deliver"):
+        await notifications.deliver_notifications(
+            engine, config, applying_regions_tokens, updated_notifiable_regions_prices
+        )
 
     await prices.write_updated_regions_endtimes(config, regions_prices, updated_regions)
 
 
+def run(trace: bool = False, profile_path: Optional[str] = None):
+    """Run the service, optionally under the profiler.
+
+    :param profile_path: If set write a profile of the whole run to this path. It can be loaded with pstats.
+    """
+    if profile_path is None:
+        asyncio.run(main(trace))
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(asyncio.run, main(trace))
+    finally:
+        profiler.dump_stats(profile_path)
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Send price below notifications to users.")
+    parser.add_argument("--trace", action="store_true", help="Log the duration of each stage of the run.")
+    parser.add_argument("--profile", metavar="PATH", help="Write a profile of the run to this path.")
+    args = parser.parse_args()
+    run(args.trace, args.profile)
@@ -22,29 +22,31 @@ from awattprice_notifications.price_below.prices import DetailedPriceData
 def get_below_value_checks(regions_data: dict[Region, DetailedPriceData]) -> list[BooleanClauseList]:
     """Get sqlalchemy and_ clauses which check if the price data drops below or on the users below value.
 
-    These checks respect the tax option of the user by adding or leaving away the tax on the price data.
+    These checks respect the tax option of the user by adding or leaving away the tax on the price data. All
+    values are compared as fixed-point millicents with plain integer operations.
     """
     below_value_checks = []
+    below_value = PriceBelowNotification.below_value * awattprice.defaults.MILLICENTS_PER_CENT
     for region, price_data in regions_data.items():
         lowest_marketprice = price_data.lowest_price.marketprice
-        lowest_marketprice_untaxed = lowest_marketprice.ct_kwh(taxed=False, round_=True)
+        lowest_marketprice_untaxed = lowest_marketprice.ct_kwh_millicents(taxed=False)
         if region.tax is None:
             below_value_checks.append(
-                and_(Token.region == region, Token.base_fee+lowest_marketprice_untaxed <= PriceBelowNotification.below_value)
+                and_(Token.region == region, Token.base_fee + lowest_marketprice_untaxed <= below_value)
             )
         else:
-            lowest_marketprice_taxed = lowest_marketprice.ct_kwh(taxed=True, round_=True)
+            lowest_marketprice_taxed = lowest_marketprice.ct_kwh_millicents(taxed=True)
             below_value_checks.append(
                 and_(
                     Token.region == region,
                     or_(
                         and_(
                             Token.tax == True,
-                            Token.base_fee+lowest_marketprice_taxed <= PriceBelowNotification.below_value,
+                            Token.base_fee + lowest_marketprice_taxed <= below_value,
                         ),
                         and_(
                             Token.tax == False,
-                            Token.base_fee+lowest_marketprice_untaxed <= PriceBelowNotification.below_value,
+                            Token.base_fee + lowest_marketprice_untaxed <= below_value,
                         ),
                     ),
                 )